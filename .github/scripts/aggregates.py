@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Server-side Aggregation
+Rewrites panel expressions into *_over_time summaries so long time ranges need no raw series
+"""
+
+import os
+import json
+
+from resolution import choose_step
+
+# Summary name -> PromQL template; {subquery} is "(expr)[window:resolution]"
+AGGREGATE_FUNCTIONS = {
+    'min': 'min_over_time({subquery})',
+    'max': 'max_over_time({subquery})',
+    'avg': 'avg_over_time({subquery})',
+    'p50': 'quantile_over_time(0.5, {subquery})',
+    'p95': 'quantile_over_time(0.95, {subquery})',
+    'p99': 'quantile_over_time(0.99, {subquery})',
+    'stddev': 'stddev_over_time({subquery})',
+    'count': 'count_over_time({subquery})',
+    'last': 'last_over_time({subquery})',
+}
+
+# AGGREGATE_MODE=auto switches aggregation on from this window length
+AUTO_MIN_WINDOW = 7 * 86400
+
+# Subquery evaluations per series when AGGREGATE_MAX_SAMPLES is not set
+DEFAULT_MAX_SAMPLES = 10000
+
+# Low-resolution series points kept next to the aggregates (0 = none)
+DEFAULT_SERIES_POINTS = 24
+
+def format_duration(seconds):
+    """Render seconds as a PromQL duration using the largest exact unit"""
+    seconds = int(seconds)
+    for unit, size in (('d', 86400), ('h', 3600), ('m', 60)):
+        if seconds and seconds % size == 0:
+            return f"{seconds // size}{unit}"
+    return f"{seconds}s"
+
+def get_aggregate_settings(window_seconds):
+    """Return aggregation settings for a window, or None when aggregation is off
+    
+    AGGREGATE_MODE is 'off' (default), 'on' or 'auto' (windows of 7d and
+    longer). The subquery resolution keeps each series within
+    AGGREGATE_MAX_SAMPLES evaluations; AGGREGATE_SERIES_POINTS sets the
+    budget of the optional low-resolution series.
+    """
+    mode = os.getenv('AGGREGATE_MODE', 'off').lower()
+    if mode not in ('on', 'auto') or (mode == 'auto' and window_seconds < AUTO_MIN_WINDOW):
+        return None
+    
+    max_samples = int(os.getenv('AGGREGATE_MAX_SAMPLES', str(DEFAULT_MAX_SAMPLES)))
+    series_points = int(os.getenv('AGGREGATE_SERIES_POINTS', str(DEFAULT_SERIES_POINTS)))
+    
+    return {
+        "window": int(window_seconds),
+        "resolution": choose_step(window_seconds, max_samples),
+        "series_step": choose_step(window_seconds, series_points) if series_points > 0 else None
+    }
+
+def build_aggregate_queries(expr, settings):
+    """Return {summary_name: promql} for one expression"""
+    subquery = f"({expr})[{format_duration(settings['window'])}:{format_duration(settings['resolution'])}]"
+    return {name: template.format(subquery=subquery) for name, template in AGGREGATE_FUNCTIONS.items()}
+
+def combine_aggregates(results):
+    """Merge per-function instant query results into one row per series
+    
+    results maps summary name to a Prometheus response. Series are matched
+    on their labels; *_over_time drops __name__, so it is ignored. Returns
+    [{'metric': labels, 'min': ..., 'max': ..., ...}], or None when any
+    summary query failed.
+    """
+    rows = {}
+    
+    for name in AGGREGATE_FUNCTIONS:
+        result = results.get(name)
+        if not result or result.get('status') != 'success':
+            return None
+        
+        for sample in result.get('data', {}).get('result', []):
+            labels = {k: v for k, v in sample.get('metric', {}).items() if k != '__name__'}
+            row = rows.setdefault(json.dumps(labels, sort_keys=True), {'metric': labels})
+            row[name] = float(sample['value'][1]) if 'value' in sample else None
+    
+    return list(rows.values())
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Query Backend Benchmark
+Runs the same dashboard expressions through each query backend and compares per-query latency
+"""
+
+import os
+import sys
+import json
+import argparse
+from datetime import datetime
+import pytz
+
+from fake_grafana import start_server
+from grafana_collector import (
+    BACKENDS,
+    DASHBOARD_LIST,
+    build_query_plan,
+    create_backend,
+    get_datasource,
+    get_grafana_session,
+    get_prometheus_session,
+    get_prometheus_settings,
+)
+from query_trace import QueryTrace, percentile_ms
+
+def create_backends(names, grafana_url, username, password, auth):
+    """Create the named backends, each with its own session; returns (grafana session, {name: backend})"""
+    
+    session = get_grafana_session(grafana_url, username, password, auth=auth)
+    backends = {}
+    
+    for name in names:
+        if name == 'prometheus':
+            settings = get_prometheus_settings()
+            if not settings["url"]:
+                print("❌ PROMETHEUS_URL environment variable not set (required by the prometheus backend)")
+                sys.exit(1)
+            backends[name] = create_backend(name, get_prometheus_session(settings), settings["url"])
+        else:
+            backend_session = get_grafana_session(grafana_url, username, password, auth=auth)
+            backends[name] = create_backend(name, backend_session, grafana_url, get_datasource(backend_session, grafana_url))
+    
+    return session, backends
+
+def summarize(records):
+    """Latency and payload statistics of one backend's trace records"""
+    fetched = [r for r in records if r['status'] != 'error']
+    seconds = [r['seconds'] for r in fetched]
+    return {
+        "queries": len(records),
+        "errors": len(records) - len(fetched),
+        "p50_ms": percentile_ms(seconds, 50),
+        "p95_ms": percentile_ms(seconds, 95),
+        "mean_ms": round(sum(seconds) / len(seconds) * 1000, 1) if seconds else 0.0,
+        "total_seconds": round(sum(seconds), 3),
+        "bytes_received": sum(r['bytes'] for r in fetched)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare query latency of the collector backends on the same expressions")
+    parser.add_argument('--backends', default='proxy,prometheus', help="Comma-separated backends to compare (default: proxy,prometheus)")
+    parser.add_argument('--rounds', type=int, default=3, help="Times every expression is queried per backend (default: 3)")
+    parser.add_argument('--limit', type=int, default=50, help="Number of plan expressions to query (default: 50)")
+    parser.add_argument('--time-range', default=os.getenv('TIME_RANGE', '24h'), help="Query window (default: TIME_RANGE or 24h)")
+    parser.add_argument('--fake', action='store_true', help="Run against a local fake Grafana that also serves the Prometheus API")
+    parser.add_argument('--output', help="Write the results JSON to this file")
+    args = parser.parse_args()
+    
+    names = [name.strip() for name in args.backends.split(',') if name.strip()]
+    unknown = [name for name in names if name not in BACKENDS]
+    if unknown:
+        print(f"❌ Unknown backend(s): {', '.join(unknown)} (use {', '.join(BACKENDS)})")
+        sys.exit(1)
+    
+    server = None
+    if args.fake:
+        server = start_server()
+        os.environ.update({'GRAFANA_PASSWORD': 'benchmark', 'PROMETHEUS_URL': server.url})
+        grafana_url = server.url
+    else:
+        grafana_url = os.getenv('GRAFANA_URL', 'https://grafana.pkc.pub')
+    
+    password = os.getenv('GRAFANA_PASSWORD')
+    if not password:
+        print("❌ GRAFANA_PASSWORD environment variable not set")
+        sys.exit(1)
+    
+    print(f"🚀 Benchmarking query backends: {', '.join(names)}")
+    print(f"   Grafana: {grafana_url}")
+    print(f"   Time range: {args.time_range}")
+    print(f"   Rounds: {args.rounds}, expressions: up to {args.limit}")
+    
+    session, backends = create_backends(
+        names, grafana_url, os.getenv('GRAFANA_USERNAME', 'admin'), password, os.getenv('GRAFANA_AUTH', 'login').lower()
+    )
+    
+    plan = build_query_plan(session, grafana_url, DASHBOARD_LIST, args.time_range)
+    expression_ids = list(plan["expressions"])[:args.limit]
+    queries = [plan["expressions"][expr_id] for expr_id in expression_ids]
+    print(f"\n⚡ Querying {len(queries)} expressions x {args.rounds} rounds per backend, one at a time")
+    
+    records = {name: [] for name in names}
+    try:
+        for round_index in range(args.rounds):
+            # Rotate the order so no backend always runs first (cold server caches)
+            order = names[round_index % len(names):] + names[:round_index % len(names)]
+            for name in order:
+                trace = QueryTrace()
+                backends[name].trace = trace
+                backends[name].execute(queries, args.time_range, labels=expression_ids)
+                records[name].extend(trace.records)
+                summary = summarize(trace.records)
+                print(f"   Round {round_index + 1} {name}: p50 {summary['p50_ms']} ms, p95 {summary['p95_ms']} ms, "
+                      f"{summary['errors']} errors")
+    finally:
+        if server:
+            server.shutdown()
+    
+    results = {
+        "timestamp": datetime.now(pytz.UTC).isoformat(),
+        "grafana_url": grafana_url,
+        "time_range": args.time_range,
+        "rounds": args.rounds,
+        "expressions": len(queries),
+        "backends": {name: summarize(records[name]) for name in names}
+    }
+    
+    print(f"\n📊 Results")
+    print(f"   {'Backend':<12} {'Queries':>8} {'Errors':>7} {'p50 ms':>8} {'p95 ms':>8} {'Mean ms':>8} {'MB':>8}")
+    for name, stats in results["backends"].items():
+        print(f"   {name:<12} {stats['queries']:>8} {stats['errors']:>7} {stats['p50_ms']:>8} {stats['p95_ms']:>8} "
+              f"{stats['mean_ms']:>8} {stats['bytes_received'] / 1024 / 1024:>8.2f}")
+    
+    baseline = results["backends"].get('proxy')
+    if baseline and baseline["mean_ms"]:
+        for name, stats in results["backends"].items():
+            if name != 'proxy':
+                change = (stats["mean_ms"] / baseline["mean_ms"] - 1) * 100
+                print(f"   {name} vs proxy: mean {stats['mean_ms'] - baseline['mean_ms']:+.1f} ms ({change:+.1f}%), "
+                      f"p95 {stats['p95_ms'] - baseline['p95_ms']:+.1f} ms")
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\n💾 Results saved: {args.output}")
+
+if __name__ == "__main__":
+    main()
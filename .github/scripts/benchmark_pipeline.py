@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Metrics Pipeline Benchmark
+Times collection, Markdown conversion and the ZITADEL report end to end against a local fake Grafana
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import shutil
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+from datetime import datetime
+from pathlib import Path
+import pytz
+
+from fake_grafana import start_server
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+REPO_DIR = SCRIPTS_DIR.parent.parent
+
+DEFAULT_BASELINE = SCRIPTS_DIR / 'benchmark_baseline.json'
+
+# Settings that would make runs depend on each other (caches, previous output)
+ISOLATED_ENV = ('QUERY_CACHE_DIR', 'DASHBOARD_CACHE_FILE', 'INCREMENTAL', 'QUERY_PLAN', 'QUERY_PLAN_FILE', 'QUERY_TRACE_FILE')
+
+# Stages shorter than this never count as regressions; their timings are mostly noise
+MIN_REGRESSION_SECONDS = 0.1
+
+def run_stage(command, env, log_file):
+    """Run one pipeline stage, returning (exit code, wall seconds, peak RSS in MB)"""
+    started = time.perf_counter()
+    with open(log_file, 'w') as log:
+        process = subprocess.Popen(command, env=env, cwd=REPO_DIR, stdout=log, stderr=subprocess.STDOUT)
+        # wait4 reports the resource usage of this child alone
+        _, status, usage = os.wait4(process.pid, 0)
+    seconds = time.perf_counter() - started
+    process.returncode = os.waitstatus_to_exitcode(status)
+    return process.returncode, seconds, usage.ru_maxrss / 1024
+
+def get_stage_commands(output_dir):
+    """Return [(stage, command builder)]; builders run after the previous stage finished"""
+    
+    def collect():
+        return [sys.executable, str(SCRIPTS_DIR / 'collect_grafana_metrics.py')]
+    
+    def convert():
+        return [sys.executable, str(SCRIPTS_DIR / 'convert_metrics_to_markdown.py'), output_dir]
+    
+    def zitadel():
+        files = sorted(glob.glob(f"{output_dir}/zitadel_*.json") + glob.glob(f"{output_dir}/zitadel_*.npz"))
+        if not files:
+            return None
+        return [sys.executable, str(REPO_DIR / 'daily-reports' / 'generate_zitadel_report.py'),
+                files[-1], os.path.join(output_dir, 'zitadel_report.md')]
+    
+    return [('collect', collect), ('convert', convert), ('zitadel_report', zitadel)]
+
+def get_output_bytes(output_dir, patterns):
+    return sum(os.path.getsize(f) for pattern in patterns for f in glob.glob(os.path.join(output_dir, pattern)))
+
+def run_pipeline(server, work_dir, run_index, time_range):
+    """Run every stage once into a fresh output directory"""
+    
+    output_dir = os.path.join(work_dir, f"run{run_index}")
+    os.makedirs(output_dir)
+    
+    env = {key: value for key, value in os.environ.items() if key not in ISOLATED_ENV}
+    env.update({
+        'GRAFANA_URL': server.url,
+        'GRAFANA_USERNAME': 'admin',
+        'GRAFANA_PASSWORD': 'benchmark',
+        'TIME_RANGE': time_range,
+        'OUTPUT_DIR': output_dir,
+        'PYTHONDONTWRITEBYTECODE': '1'
+    })
+    
+    stages = {}
+    for stage, build_command in get_stage_commands(output_dir):
+        command = build_command()
+        if command is None:
+            print(f"   ❌ {stage}: no input files")
+            return None
+        
+        before = server.snapshot()
+        log_file = os.path.join(work_dir, f"run{run_index}_{stage}.log")
+        code, seconds, peak_mb = run_stage(command, env, log_file)
+        after = server.snapshot()
+        
+        if code != 0:
+            print(f"   ❌ {stage} exited with {code}, log: {log_file}")
+            with open(log_file, 'r') as f:
+                print(''.join(f.readlines()[-20:]))
+            return None
+        
+        stages[stage] = {
+            "seconds": seconds,
+            "peak_rss_mb": peak_mb,
+            "requests": sum(after["requests"].values()) - sum(before["requests"].values()),
+            "bytes_received": after["bytes_sent"] - before["bytes_sent"]
+        }
+        print(f"   {stage}: {seconds:.2f}s, {peak_mb:.0f} MB peak, {stages[stage]['requests']} requests")
+    
+    stages["collect"]["output_bytes"] = get_output_bytes(output_dir, ['*.json', '*.npz'])
+    stages["convert"]["output_bytes"] = get_output_bytes(output_dir, ['*.md'])
+    return stages
+
+def summarize_runs(runs):
+    """Median time and worst peak memory of each stage over all runs"""
+    summary = {}
+    for stage in runs[0]:
+        samples = [run[stage] for run in runs]
+        summary[stage] = {
+            "seconds": round(statistics.median(s["seconds"] for s in samples), 3),
+            "min_seconds": round(min(s["seconds"] for s in samples), 3),
+            "max_seconds": round(max(s["seconds"] for s in samples), 3),
+            "peak_rss_mb": round(max(s["peak_rss_mb"] for s in samples), 1),
+            "requests": samples[-1]["requests"],
+            "bytes_received": samples[-1]["bytes_received"]
+        }
+        if "output_bytes" in samples[-1]:
+            summary[stage]["output_bytes"] = samples[-1]["output_bytes"]
+    summary["total"] = {"seconds": round(sum(s["seconds"] for s in summary.values()), 3)}
+    return summary
+
+def compare_to_baseline(results, baseline, tolerance):
+    """Return a list of regression messages; times and memory get `tolerance` headroom
+    
+    Request counts are deterministic for a given workload, so any increase
+    counts as a regression.
+    """
+    regressions = []
+    
+    for stage, current in results["stages"].items():
+        previous = baseline["stages"].get(stage)
+        if not previous:
+            continue
+        
+        limit = max(previous["seconds"] * (1 + tolerance), previous["seconds"] + MIN_REGRESSION_SECONDS)
+        if current["seconds"] > limit:
+            regressions.append(f"{stage}: {current['seconds']:.2f}s vs baseline {previous['seconds']:.2f}s")
+        
+        if "peak_rss_mb" in previous and current["peak_rss_mb"] > previous["peak_rss_mb"] * (1 + tolerance):
+            regressions.append(f"{stage}: {current['peak_rss_mb']:.0f} MB peak vs baseline {previous['peak_rss_mb']:.0f} MB")
+        
+        if "requests" in previous and current["requests"] > previous["requests"]:
+            regressions.append(f"{stage}: {current['requests']} requests vs baseline {previous['requests']}")
+    
+    return regressions
+
+def print_comparison(results, baseline):
+    print(f"\n📊 Results (median of {results['runs']} runs)")
+    print(f"   {'Stage':<16} {'Time':>9} {'Baseline':>9} {'Change':>8} {'Peak MB':>8} {'Requests':>9}")
+    for stage, current in results["stages"].items():
+        previous = (baseline or {}).get("stages", {}).get(stage)
+        if previous:
+            change = (current["seconds"] / previous["seconds"] - 1) * 100 if previous["seconds"] else 0.0
+            columns = f"{previous['seconds']:>8.2f}s {change:>+7.1f}%"
+        else:
+            columns = f"{'-':>9} {'-':>8}"
+        if "peak_rss_mb" in current:
+            columns += f" {current['peak_rss_mb']:>8.0f} {current['requests']:>9}"
+        print(f"   {stage:<16} {current['seconds']:>8.2f}s {columns}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the metrics pipeline against a local fake Grafana")
+    parser.add_argument('--runs', type=int, default=3, help="Pipeline runs; the median time is reported (default: 3)")
+    parser.add_argument('--panels', type=int, default=8, help="Panels per dashboard (default: 8)")
+    parser.add_argument('--targets', type=int, default=2, help="Queries per panel (default: 2)")
+    parser.add_argument('--series', type=int, default=20, help="Series returned per query (default: 20)")
+    parser.add_argument('--latency-ms', type=float, default=5, help="Delay added to each data query (default: 5)")
+    parser.add_argument('--time-range', default='24h', help="TIME_RANGE for the collector (default: 24h)")
+    parser.add_argument('--baseline', default=str(DEFAULT_BASELINE), help="Baseline results file")
+    parser.add_argument('--update-baseline', action='store_true', help="Store these results as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed slowdown before failing (default: 0.25 = 25%%)")
+    parser.add_argument('--output', help="Also write the results JSON to this file")
+    parser.add_argument('--keep', action='store_true', help="Keep the generated metrics, reports and logs")
+    args = parser.parse_args()
+    
+    workload = {
+        "panels": args.panels,
+        "targets": args.targets,
+        "series": args.series,
+        "latency_ms": args.latency_ms,
+        "time_range": args.time_range
+    }
+    
+    server = start_server(0, args.panels, args.targets, args.series, args.latency_ms / 1000)
+    work_dir = tempfile.mkdtemp(prefix='metrics-benchmark-')
+    
+    print(f"🚀 Benchmarking metrics pipeline")
+    print(f"   Fake Grafana: {server.url}")
+    print(f"   Workload: {args.panels} panels x {args.targets} queries per dashboard, "
+          f"{args.series} series per query, {args.latency_ms:g} ms latency, {args.time_range}")
+    print(f"   Runs: {args.runs}")
+    
+    runs = []
+    try:
+        for run_index in range(args.runs):
+            print(f"\n⏱️  Run {run_index + 1}/{args.runs}")
+            stages = run_pipeline(server, work_dir, run_index, args.time_range)
+            if stages is None:
+                print(f"\n❌ Benchmark failed, work directory kept: {work_dir}")
+                sys.exit(1)
+            runs.append(stages)
+    finally:
+        server.shutdown()
+    
+    results = {
+        "timestamp": datetime.now(pytz.UTC).isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "runs": args.runs,
+        "workload": workload,
+        "stages": summarize_runs(runs)
+    }
+    
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        if baseline.get("workload") != workload:
+            print(f"\n⚠️  Baseline {args.baseline} was recorded with a different workload, not comparing")
+            baseline = None
+    
+    print_comparison(results, baseline)
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\n💾 Results saved: {args.output}")
+    
+    if args.keep:
+        print(f"📂 Output kept: {work_dir}")
+    else:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\n✅ Baseline updated: {args.baseline}")
+        return
+    
+    if baseline is None:
+        print(f"\n⚠️  No baseline to compare against (run with --update-baseline to store one)")
+        return
+    
+    regressions = compare_to_baseline(results, baseline, args.tolerance)
+    if regressions:
+        print(f"\n❌ {len(regressions)} regression(s) beyond {args.tolerance:.0%} tolerance:")
+        for regression in regressions:
+            print(f"   - {regression}")
+        sys.exit(1)
+    
+    print(f"\n✅ No regressions against baseline from {baseline.get('timestamp', 'unknown')}")
+
+if __name__ == "__main__":
+    main()
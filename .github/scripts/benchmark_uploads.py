@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Upload Benchmark
+Uploads a synthetic report tree through each upload path and compares objects/sec and MB/sec
+"""
+
+import io
+import os
+import sys
+import json
+import glob
+import time
+import random
+import argparse
+import tempfile
+from contextlib import redirect_stdout
+from datetime import datetime
+import pytz
+from minio.helpers import MAX_PART_SIZE, MIN_PART_SIZE
+
+from fake_s3 import start_server
+from minio_archive import upload_archive
+from minio_upload import UploaderSession, get_upload_settings
+
+UPLOAD_MODES = ('sequential', 'parallel', 'multipart', 'archive')
+
+def generate_tree(directory, files, size_kb, large_files, large_mb, seed=0):
+    """Write `files` metrics-like JSON files of about size_kb plus `large_files` of about large_mb
+    
+    Content is indent-2 JSON of Prometheus series, so it compresses like
+    real metrics files. Large files are written a series at a time.
+    """
+    rng = random.Random(seed)
+    
+    def write(path, target_bytes):
+        with open(path, 'w') as f:
+            f.write('{\n  "source": "Benchmark",\n  "metrics": {\n')
+            written = 0
+            index = 0
+            while written < target_bytes:
+                values = ",\n".join(
+                    f'          [{1700000000 + step * 60}, "{rng.random() * 100:.4f}"]' for step in range(60)
+                )
+                separator = ",\n" if index else ""
+                chunk = (f'{separator}    "metric_{index}": {{\n      "resultType": "matrix",\n'
+                         f'      "result": [{{"metric": {{"pod": "pod-{index}"}}, "values": [\n{values}\n      ]}}]\n    }}')
+                f.write(chunk)
+                written += len(chunk)
+                index += 1
+            f.write('\n  }\n}\n')
+    
+    for index in range(files):
+        write(os.path.join(directory, f"dashboard_{index:04d}.json"), size_kb * 1024)
+    for index in range(large_files):
+        write(os.path.join(directory, f"large_{index:02d}.json"), large_mb * 1024 * 1024)
+    
+    return sorted(glob.glob(os.path.join(directory, '*.json')))
+
+def get_mode_settings(mode, base, workers, part_size_mb, part_threads):
+    """Upload settings of one mode
+    
+    sequential is the old one-file-at-a-time loop, parallel adds the worker
+    pool, multipart also splits large files into part_size_mb parts, and
+    archive streams everything into one multipart .tar.gz. Part sizes below
+    the S3 minimum of 5 MiB are raised to it, as get_upload_settings does.
+    """
+    settings = {**base, "skip_unchanged": False, "manifest": None}
+    if mode == 'sequential':
+        return {**settings, "workers": 1, "part_size": MAX_PART_SIZE, "part_threads": 1}
+    if mode == 'parallel':
+        return {**settings, "workers": workers, "part_size": MAX_PART_SIZE, "part_threads": 1}
+    part_size = max(MIN_PART_SIZE, int(part_size_mb * 1024 * 1024))
+    return {**settings, "workers": workers, "part_size": part_size, "part_threads": part_threads}
+
+def run_mode(mode, settings, bucket_name, files, root, prefix):
+    """Upload the tree once; returns (seconds, objects, failed)"""
+    session = UploaderSession(settings)
+    with redirect_stdout(io.StringIO()):
+        session.ensure_bucket(bucket_name)
+        started = time.perf_counter()
+        if mode == 'archive':
+            upload_archive(session, bucket_name, files, root, f"{prefix}/archive.tar.gz")
+            return time.perf_counter() - started, 2, 0
+        uploaded, failed = session.upload_files(bucket_name, [(path, f"{prefix}/{os.path.basename(path)}") for path in files])
+    return time.perf_counter() - started, len(uploaded), len(failed)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare throughput of the MinIO upload paths on a synthetic report tree")
+    parser.add_argument('--modes', default=','.join(UPLOAD_MODES), help=f"Comma-separated modes (default: {','.join(UPLOAD_MODES)})")
+    parser.add_argument('--files', type=int, default=200, help="Small files in the tree (default: 200)")
+    parser.add_argument('--size-kb', type=int, default=64, help="Size of each small file (default: 64)")
+    parser.add_argument('--large-files', type=int, default=2, help="Large files in the tree (default: 2)")
+    parser.add_argument('--large-mb', type=int, default=24, help="Size of each large file (default: 24)")
+    parser.add_argument('--workers', type=int, default=8, help="Upload workers of the parallel modes (default: 8)")
+    parser.add_argument('--part-size-mb', type=float, default=5, help="Part size of the multipart modes, at least 5 (default: 5)")
+    parser.add_argument('--part-threads', type=int, default=4, help="Parts sent at once per file (default: 4)")
+    parser.add_argument('--rounds', type=int, default=3, help="Uploads of the tree per mode (default: 3)")
+    parser.add_argument('--bucket', default='upload-benchmark', help="Bucket written to (default: upload-benchmark)")
+    parser.add_argument('--fake', action='store_true', help="Run against an in-process fake S3 instead of MINIO_ENDPOINT")
+    parser.add_argument('--latency-ms', type=float, default=2, help="Per-request latency of the fake S3 (default: 2)")
+    parser.add_argument('--output', help="Write the results JSON to this file")
+    args = parser.parse_args()
+    
+    if args.part_size_mb * 1024 * 1024 < MIN_PART_SIZE:
+        print(f"   ⚠️  --part-size-mb {args.part_size_mb:g} is below the S3 minimum, using {MIN_PART_SIZE / 1024 / 1024:g} MB")
+        args.part_size_mb = MIN_PART_SIZE / 1024 / 1024
+    
+    modes = [mode.strip() for mode in args.modes.split(',') if mode.strip()]
+    unknown = [mode for mode in modes if mode not in UPLOAD_MODES]
+    if unknown:
+        print(f"❌ Unknown mode(s): {', '.join(unknown)} (use {', '.join(UPLOAD_MODES)})")
+        sys.exit(1)
+    
+    server = None
+    if args.fake:
+        server = start_server(latency=args.latency_ms / 1000)
+        os.environ.update({'MINIO_ENDPOINT': server.endpoint, 'MINIO_SECURE': 'false',
+                           'MINIO_ACCESS_KEY': 'benchmark', 'MINIO_SECRET_KEY': 'benchmark'})
+    
+    base = get_upload_settings()
+    if not base["access_key"] or not base["secret_key"]:
+        print("❌ MinIO credentials not set (use --fake for a local stand-in)")
+        sys.exit(1)
+    
+    with tempfile.TemporaryDirectory(prefix='upload-benchmark-') as root:
+        files = generate_tree(root, args.files, args.size_kb, args.large_files, args.large_mb)
+        total_bytes = sum(os.path.getsize(path) for path in files)
+        
+        print(f"🚀 Benchmarking upload modes: {', '.join(modes)}")
+        print(f"   Endpoint: {base['endpoint']}" + (f" (fake S3, {args.latency_ms:g} ms per request)" if server else ""))
+        print(f"   Tree: {len(files)} files, {total_bytes / 1024 / 1024:.1f} MB "
+              f"({args.files} x {args.size_kb} KB, {args.large_files} x {args.large_mb} MB)")
+        print(f"   Workers: {args.workers}, parts: {args.part_size_mb:g} MB x {args.part_threads}, rounds: {args.rounds}")
+        
+        results = {name: [] for name in modes}
+        requests = {}
+        try:
+            for round_index in range(args.rounds):
+                # Rotate the order so no mode always runs first
+                order = modes[round_index % len(modes):] + modes[:round_index % len(modes)]
+                for mode in order:
+                    settings = get_mode_settings(mode, base, args.workers, args.part_size_mb, args.part_threads)
+                    before = server.snapshot() if server else None
+                    seconds, objects, failed = run_mode(mode, settings, args.bucket, files, root, f"bench/{mode}/{round_index}")
+                    if server:
+                        requests[mode] = sum(server.snapshot()["requests"].values()) - sum(before["requests"].values())
+                        server.reset()
+                    results[mode].append({"seconds": seconds, "objects": objects, "failed": failed})
+                    print(f"   Round {round_index + 1} {mode}: {seconds:.2f}s, {len(files) / seconds:.1f} files/s, "
+                          f"{total_bytes / 1024 / 1024 / seconds:.1f} MB/s" + (f", {failed} failed" if failed else ""))
+        finally:
+            if server:
+                server.shutdown()
+    
+    summary = {}
+    for mode, runs in results.items():
+        best = min(run["seconds"] for run in runs)
+        mean = sum(run["seconds"] for run in runs) / len(runs)
+        summary[mode] = {
+            "mean_seconds": round(mean, 3),
+            "best_seconds": round(best, 3),
+            "files_per_second": round(len(files) / mean, 1),
+            "objects_per_second": round(runs[0]["objects"] / mean, 1),
+            "mb_per_second": round(total_bytes / 1024 / 1024 / mean, 2),
+            "requests": requests.get(mode),
+            "failed": sum(run["failed"] for run in runs)
+        }
+    
+    print(f"\n📊 Results (mean of {args.rounds} rounds)")
+    print(f"   {'Mode':<12} {'Seconds':>8} {'Files/s':>8} {'Objects/s':>10} {'MB/s':>8} {'Requests':>9}")
+    for mode, stats in summary.items():
+        print(f"   {mode:<12} {stats['mean_seconds']:>8} {stats['files_per_second']:>8} {stats['objects_per_second']:>10} "
+              f"{stats['mb_per_second']:>8} {stats['requests'] if stats['requests'] is not None else '-':>9}")
+    
+    baseline = summary.get('sequential')
+    if baseline:
+        for mode, stats in summary.items():
+            if mode != 'sequential':
+                print(f"   {mode} vs sequential: {baseline['mean_seconds'] / stats['mean_seconds']:.2f}x the throughput")
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                "timestamp": datetime.now(pytz.UTC).isoformat(),
+                "endpoint": base["endpoint"],
+                "fake": bool(server),
+                "tree": {"files": len(files), "bytes": total_bytes},
+                "workers": args.workers,
+                "part_size_mb": args.part_size_mb,
+                "part_threads": args.part_threads,
+                "rounds": args.rounds,
+                "modes": summary
+            }, f, indent=2)
+        print(f"\n💾 Results saved: {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Cardinality Guard
+Pre-checks how many series each expression returns and caps oversized queries with topk or sampling
+"""
+
+import os
+import json
+import math
+
+# What to do with an expression over its series limit
+CARDINALITY_ACTIONS = ('topk', 'sample')
+
+def get_cardinality_settings():
+    """Return the guard settings, or None when neither limit is set
+    
+    CARDINALITY_MAX_SERIES caps the series of one query and
+    CARDINALITY_MAX_POINTS its series x points. CARDINALITY_ACTION is
+    'topk' (rewrite the query to its largest series) or 'sample' (fetch
+    everything and keep an evenly spread subset of the series).
+    """
+    max_series = int(os.getenv('CARDINALITY_MAX_SERIES', '0'))
+    max_points = int(os.getenv('CARDINALITY_MAX_POINTS', '0'))
+    if max_series <= 0 and max_points <= 0:
+        return None
+    
+    return {
+        "max_series": max(0, max_series),
+        "max_points": max(0, max_points),
+        "action": os.getenv('CARDINALITY_ACTION', 'topk').lower()
+    }
+
+def get_series_limit(settings, points_per_series=None):
+    """Series allowed per query: the series cap, tightened by the point budget"""
+    limits = []
+    if settings["max_series"]:
+        limits.append(settings["max_series"])
+    if settings["max_points"] and points_per_series:
+        limits.append(max(1, settings["max_points"] // points_per_series))
+    return min(limits) if limits else None
+
+def build_count_query(expr):
+    """Instant query returning the number of series of an expression"""
+    return f"count(({expr}))"
+
+def read_count(result):
+    """Series count from a count() response: 0 for no series, None when the check failed"""
+    if not result or result.get('status') != 'success':
+        return None
+    
+    samples = result.get('data', {}).get('result', [])
+    if not samples:
+        return 0
+    try:
+        return int(float(samples[0]['value'][1]))
+    except (KeyError, IndexError, TypeError, ValueError):
+        return None
+
+def limit_query(expr, limit):
+    """Rewrite an expression to the `limit` largest series at each step"""
+    return f"topk({limit}, {expr})"
+
+def get_series_peak(series):
+    """Largest finite value of a result entry or aggregate row (-inf when it has none)"""
+    if 'values' in series or 'value' in series:
+        values = [point[1] for point in series.get('values') or [series['value']]]
+    else:
+        values = [series.get('max')]
+    
+    peak = -math.inf
+    for value in values:
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            continue
+        if math.isfinite(value) and value > peak:
+            peak = value
+    return peak
+
+def truncate_series(series, limit, action='topk'):
+    """Keep `limit` entries of a Prometheus result list (or of aggregate rows)
+    
+    'topk' keeps the series with the highest peak; 'sample' keeps series
+    evenly spread over the list sorted by labels, so the same series are
+    kept from run to run. The kept series stay in their original order.
+    """
+    if len(series) <= limit:
+        return series
+    
+    if action == 'sample':
+        ordered = sorted(range(len(series)), key=lambda index: json.dumps(series[index].get('metric', {}), sort_keys=True))
+        kept = {ordered[index * len(series) // limit] for index in range(limit)}
+    else:
+        ordered = sorted(range(len(series)), key=lambda index: get_series_peak(series[index]), reverse=True)
+        kept = set(ordered[:limit])
+    
+    return [entry for index, entry in enumerate(series) if index in kept]
+
+def apply_series_limit(result, limit, action, expected_series=None):
+    """Enforce a series limit on a query response and record what was cut
+    
+    expected_series is the pre-checked count of a query that was already
+    rewritten with topk. Aggregate rows are capped like the series. The
+    record is stored under 'truncated' in the response data:
+    {'series': before, 'kept': after, 'limit': ..., 'action': ...}.
+    """
+    if not result or result.get('status') != 'success':
+        return result
+    
+    data = result.get('data', {})
+    series = data.get('result', [])
+    if not isinstance(series, list):
+        return result
+    
+    limited = {**data, 'result': truncate_series(series, limit, action)}
+    aggregates = data.get('aggregates')
+    if aggregates:
+        limited['aggregates'] = truncate_series(aggregates, limit, action)
+    
+    total = max(expected_series or 0, len(series), len(aggregates or []))
+    kept = max(len(limited['result']), len(limited.get('aggregates') or []))
+    if total <= kept:
+        return result
+    
+    limited['truncated'] = {"series": total, "kept": kept, "limit": limit, "action": action}
+    return {**result, 'data': limited}
@@ -4,22 +4,32 @@ Convert Grafana Metrics JSON to Markdown Reports
 Generates readable Markdown reports from collected Grafana metrics
 """
 
+import io
 import os
 import sys
-import json
 import glob
+import time
+import argparse
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
 from datetime import datetime
-from pathlib import Path
+import numpy as np
 import pytz
 
-def load_json_data(json_file):
-    """Load metrics JSON file"""
-    try:
-        with open(json_file, 'r') as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"❌ Failed to load {json_file}: {e}")
-        return None
+from metrics_io import COLUMNAR_EXTENSION, iter_metrics
+from metrics_store import MetricsStore
+
+# Read-only metrics store for trend lines, opened once per process
+_trend_store = None
+
+def get_trend_store():
+    """Open the store named by METRICS_STORE for trend lines, or None when unset or missing"""
+    global _trend_store
+    path = os.getenv('METRICS_STORE')
+    if _trend_store is None and path and os.path.exists(path):
+        _trend_store = MetricsStore(path, read_only=True)
+    return _trend_store
 
 def format_number(num):
     """Format number with K/M suffix for readability"""
@@ -80,34 +90,170 @@ def get_metric_series(metric_data):
     
     return series
 
+STAT_KEYS = ['min', 'max', 'avg', 'current', 'p50', 'p95', 'p99', 'stddev']
+
+# Series rows shown per metric in the per-series table
+MAX_SERIES_ROWS = 10
+
+def build_series_matrix(series):
+    """Stack series values into a (series x points) float64 matrix padded with NaN
+    
+    Returns the matrix and the number of real samples in each row.
+    """
+    lengths = np.array([len(s['values']) for s in series], dtype=np.int64)
+    matrix = np.full((len(series), int(lengths.max(initial=0))), np.nan)
+    
+    for row, s in enumerate(series):
+        if s['values']:
+            # NumPy parses Prometheus value strings ("1.5", "NaN", "+Inf") in C
+            matrix[row, :lengths[row]] = np.asarray([v[1] for v in s['values']], dtype=np.float64)
+    
+    return matrix, lengths
+
+def calculate_matrix_stats(matrix, lengths=None):
+    """Compute stats for every row of a value matrix in one vectorized pass
+    
+    Non-finite samples (NaN, +Inf, -Inf) are ignored; cells past a row's
+    length are padding. Returns per-row arrays for STAT_KEYS plus 'count'
+    (finite samples) and 'non_finite' (skipped samples).
+    """
+    rows, width = matrix.shape
+    if lengths is None:
+        lengths = np.full(rows, width)
+    
+    finite = np.isfinite(matrix)
+    padding = np.arange(width) >= lengths[:, None]
+    values = np.where(finite, matrix, np.nan)
+    
+    # Position of the last finite sample in each row (-1 if none)
+    last_index = np.where(finite, np.arange(width), -1).max(axis=1, initial=-1)
+    
+    # Pad with one NaN column so all-empty matrices still reduce cleanly
+    values = np.hstack([values, np.full((rows, 1), np.nan)])
+    
+    with warnings.catch_warnings():
+        # Rows without finite samples yield NaN, reported as 0 below
+        warnings.simplefilter('ignore', RuntimeWarning)
+        p50, p95, p99 = np.nanpercentile(values, [50, 95, 99], axis=1)
+        stats = {
+            'min': np.nanmin(values, axis=1),
+            'max': np.nanmax(values, axis=1),
+            'avg': np.nanmean(values, axis=1),
+            'current': values[np.arange(rows), last_index],
+            'p50': p50,
+            'p95': p95,
+            'p99': p99,
+            'stddev': np.nanstd(values, axis=1),
+        }
+    
+    stats = {key: np.nan_to_num(value, nan=0.0) for key, value in stats.items()}
+    stats['count'] = finite.sum(axis=1)
+    stats['non_finite'] = (~finite & ~padding).sum(axis=1)
+    return stats
+
 def calculate_stats(values):
-    """Calculate min, max, avg from values"""
-    if not values:
-        return {'min': 0, 'max': 0, 'avg': 0, 'current': 0}
-    
-    numeric_values = [float(v) for v in values if v is not None]
-    if not numeric_values:
-        return {'min': 0, 'max': 0, 'avg': 0, 'current': 0}
-    
-    return {
-        'min': min(numeric_values),
-        'max': max(numeric_values),
-        'avg': sum(numeric_values) / len(numeric_values),
-        'current': numeric_values[-1]
+    """Calculate min, max, avg, current, percentiles and stddev from values"""
+    numeric_values = np.asarray([v for v in values if v is not None] if values is not None else [], dtype=np.float64)
+    
+    if numeric_values.size == 0:
+        return {**{key: 0 for key in STAT_KEYS}, 'count': 0, 'non_finite': 0}
+    
+    stats = calculate_matrix_stats(numeric_values.reshape(1, -1))
+    return {key: stats[key][0].item() for key in stats}
+
+def calculate_metric_stats(series):
+    """Compute per-series and whole-metric stats for a list of series"""
+    matrix, lengths = build_series_matrix(series)
+    per_series = calculate_matrix_stats(matrix, lengths)
+    
+    # Whole-metric stats over every real sample of every series
+    padding = np.arange(matrix.shape[1]) >= lengths[:, None]
+    overall = calculate_stats(matrix[~padding])
+    
+    # 'current' is the latest finite sample of the last series that has one
+    with_data = np.flatnonzero(per_series['count'] > 0)
+    if with_data.size:
+        overall['current'] = per_series['current'][with_data[-1]].item()
+    
+    return per_series, overall
+
+def calculate_aggregate_stats(aggregates):
+    """Build per-series and whole-metric stats from server-side summaries
+    
+    aggregates is the collector's list of {'metric', 'min', 'max', 'avg',
+    'p50', ..., 'count', 'last'} rows. Min, max, avg and stddev combine
+    exactly across series; percentiles cannot be pooled, so the whole-metric
+    value is the highest per-series percentile.
+    """
+    columns = {
+        key: np.array([row.get(key) for row in aggregates], dtype=np.float64)
+        for key in ('min', 'max', 'avg', 'last', 'p50', 'p95', 'p99', 'stddev', 'count')
     }
+    columns['current'] = columns.pop('last')
+    counts = np.nan_to_num(columns.pop('count'), nan=0.0).astype(np.int64)
+    
+    per_series = {key: np.nan_to_num(value, nan=0.0) for key, value in columns.items()}
+    per_series['count'] = counts
+    per_series['non_finite'] = np.zeros(len(aggregates), dtype=np.int64)
+    
+    total = counts.sum()
+    overall = {**{key: 0 for key in STAT_KEYS}, 'count': int(total), 'non_finite': 0}
+    if total == 0:
+        return per_series, overall
+    
+    with_data = counts > 0
+    weights = counts[with_data]
+    avg = per_series['avg'][with_data]
+    stddev = per_series['stddev'][with_data]
+    mean = float((weights * avg).sum() / total)
+    
+    overall.update({
+        'min': float(per_series['min'][with_data].min()),
+        'max': float(per_series['max'][with_data].max()),
+        'avg': mean,
+        'current': float(per_series['current'][np.flatnonzero(with_data)[-1]]),
+        'p50': float(per_series['p50'][with_data].max()),
+        'p95': float(per_series['p95'][with_data].max()),
+        'p99': float(per_series['p99'][with_data].max()),
+        # Pooled variance from per-series count, mean and variance
+        'stddev': float(np.sqrt(max(0.0, (weights * (stddev ** 2 + avg ** 2)).sum() / total - mean ** 2))),
+    })
+    return per_series, overall
 
-def generate_kubernetes_report(data, output_file):
-    """Generate Markdown report for Kubernetes metrics"""
+def format_stat(value):
+    """Format a statistic like the report's Min/Max/Avg lines"""
+    return format_number(value) if value > 1000 else f"{value:.2f}"
+
+def format_series_labels(labels, limit=80):
+    """Render a series label set compactly for report tables"""
+    text = ', '.join(f"{k}={v}" for k, v in labels.items() if k != '__name__') or '(no labels)'
+    text = text if len(text) <= limit else text[:limit - 3] + '...'
+    return text.replace('|', '\\|')
+
+def generate_kubernetes_report(data, output_file, metric_items=None):
+    """Generate Markdown report for Kubernetes metrics
+    
+    metric_items may be an iterator of (metric_name, metric_data) from
+    iter_metrics(); metrics are then rendered one at a time and never held
+    in memory together.
+    """
     
     dashboard_name = data.get('source', 'Kubernetes Dashboard')
     timestamp = data.get('timestamp', '')
     time_range = data.get('time_range', '24h')
-    metrics = data.get('metrics', {})
+    if metric_items is None:
+        metric_items = data.get('metrics', {}).items()
+    
+    # Trend over the last METRICS_TREND_DAYS from the metrics store
+    store = get_trend_store()
+    trend_days = float(os.getenv('METRICS_TREND_DAYS', '7'))
+    trend_end = time.time()
     
     # Parse timestamp
     try:
         wita_tz = pytz.timezone('Asia/Makassar')
         dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00')).astimezone(wita_tz)
+        trend_end = dt.timestamp()
         date_str = dt.strftime('%Y-%m-%d')
         time_str = dt.strftime('%H:%M:%S %Z')
     except:
@@ -128,24 +274,27 @@ def generate_kubernetes_report(data, output_file):
 
 """
     
-    # Count available metrics
-    available_metrics = sum(1 for m in metrics.values() if m is not None)
-    total_metrics = len(metrics)
-    
-    report += f"- **Total Metrics Collected:** {available_metrics}/{total_metrics}\n"
-    report += f"- **Collection Status:** {'✅ Complete' if available_metrics == total_metrics else '⚠️ Partial'}\n\n"
-    
-    # Group metrics by category
-    report += "## 📈 Metric Details\n\n"
+    # Metric details are rendered first so the summary counts need only one pass
+    details = "## 📈 Metric Details\n\n"
     
     metric_count = 0
-    for metric_name, metric_data in metrics.items():
+    total_metrics = 0
+    for metric_name, metric_data in metric_items:
+        total_metrics += 1
         if metric_data is None:
             continue
         
         metric_count += 1
         value = get_metric_value(metric_data)
         
+        # Aggregate-mode collections carry server-side summaries per series
+        aggregates = metric_data.get('aggregates')
+        if aggregates:
+            series = [{'metric': row['metric']} for row in aggregates]
+            per_series, stats = calculate_aggregate_stats(aggregates)
+            if value is None:
+                value = stats['current']
+        
         if value is not None:
             # Format based on metric name
             if 'bytes' in metric_name.lower() or 'memory' in metric_name.lower():
@@ -157,29 +306,65 @@ def generate_kubernetes_report(data, output_file):
             else:
                 formatted_value = f"{value:.2f}"
             
-            report += f"### {metric_count}. {metric_name.replace('_', ' ').title()}\n\n"
-            report += f"- **Current Value:** {formatted_value}\n"
+            details += f"### {metric_count}. {metric_name.replace('_', ' ').title()}\n\n"
+            details += f"- **Current Value:** {formatted_value}\n"
+            truncated = metric_data.get('truncated')
+            if truncated:
+                method = "largest" if truncated['action'] == 'topk' else "sampled"
+                details += f"- **Truncated:** {truncated['kept']} of {truncated['series']} series kept ({method})\n"
+            trend = store.summarize(metric_name, trend_end - trend_days * 86400, trend_end, data.get('source')) if store else None
+            if trend:
+                details += (f"- **{trend_days:g}d Trend:** min {format_stat(trend['min'])} / avg {format_stat(trend['avg'])} / "
+                            f"max {format_stat(trend['max'])} ({trend['count']} samples)\n")
+            
+            # Get time series for stats (already summarized in aggregate mode)
+            if not aggregates:
+                series = get_metric_series(metric_data)
+                per_series, stats = calculate_metric_stats(series) if series else (None, None)
             
-            # Get time series for stats
-            series = get_metric_series(metric_data)
             if series:
-                all_values = []
-                for s in series:
-                    all_values.extend([float(v[1]) for v in s['values']])
+                percentile_label = "P50 / P95 / P99 (highest series)" if aggregates and len(series) > 1 else "P50 / P95 / P99"
+                if stats['count'] or stats['non_finite']:
+                    details += f"- **Min:** {format_stat(stats['min'])}\n"
+                    details += f"- **Max:** {format_stat(stats['max'])}\n"
+                    details += f"- **Avg:** {format_stat(stats['avg'])}\n"
+                    details += f"- **{percentile_label}:** {format_stat(stats['p50'])} / {format_stat(stats['p95'])} / {format_stat(stats['p99'])}\n"
+                    details += f"- **Std Dev:** {format_stat(stats['stddev'])}\n"
+                    if stats['non_finite']:
+                        details += f"- **Non-finite Samples Skipped:** {stats['non_finite']}\n"
                 
-                if all_values:
-                    stats = calculate_stats(all_values)
-                    min_val = format_number(stats['min']) if stats['min'] > 1000 else f"{stats['min']:.2f}"
-                    max_val = format_number(stats['max']) if stats['max'] > 1000 else f"{stats['max']:.2f}"
-                    avg_val = format_number(stats['avg']) if stats['avg'] > 1000 else f"{stats['avg']:.2f}"
-                    report += f"- **Min:** {min_val}\n"
-                    report += f"- **Max:** {max_val}\n"
-                    report += f"- **Avg:** {avg_val}\n"
+                # Per-series breakdown, busiest series first
+                if len(series) > 1:
+                    top = np.argsort(-per_series['max'], kind='stable')[:MAX_SERIES_ROWS]
+                    details += f"\n| Series | Current | Min | Avg | Max | P95 |\n"
+                    details += f"|---|---|---|---|---|---|\n"
+                    for row in top:
+                        details += (
+                            f"| {format_series_labels(series[row]['metric'])} "
+                            f"| {format_stat(per_series['current'][row])} "
+                            f"| {format_stat(per_series['min'][row])} "
+                            f"| {format_stat(per_series['avg'][row])} "
+                            f"| {format_stat(per_series['max'][row])} "
+                            f"| {format_stat(per_series['p95'][row])} |\n"
+                        )
+                    if len(series) > MAX_SERIES_ROWS:
+                        details += f"\n*{len(series) - MAX_SERIES_ROWS} more series not shown*\n"
             
-            report += "\n"
+            details += "\n"
     
     if metric_count == 0:
-        report += "*No metric data available*\n\n"
+        details += "*No metric data available*\n\n"
+    
+    # Count available metrics
+    available_metrics = metric_count
+    
+    report += f"- **Total Metrics Collected:** {available_metrics}/{total_metrics}\n"
+    report += f"- **Collection Status:** {'✅ Complete' if available_metrics == total_metrics else '⚠️ Partial'}\n"
+    if data.get('aggregation'):
+        aggregation = data['aggregation']
+        report += f"- **Aggregation:** server-side over {aggregation.get('window')} at {aggregation.get('resolution')} resolution\n"
+    report += "\n"
+    report += details
     
     # Footer
     report += "---\n\n"
@@ -191,20 +376,26 @@ def generate_kubernetes_report(data, output_file):
     
     return True
 
-def generate_generic_report(data, output_file):
+def generate_generic_report(data, output_file, metric_items=None):
     """Generate generic Markdown report for any dashboard"""
-    return generate_kubernetes_report(data, output_file)
+    return generate_kubernetes_report(data, output_file, metric_items)
 
 def convert_json_to_markdown(json_file):
-    """Convert a single JSON file to Markdown"""
+    """Convert a single JSON file to Markdown
+    
+    Files above METRICS_STREAM_THRESHOLD_MB are parsed incrementally, one
+    metric at a time, instead of being loaded whole.
+    """
     
-    # Load JSON data
-    data = load_json_data(json_file)
-    if not data:
+    # Open metrics file (header now, metrics lazily)
+    try:
+        data, metric_items = iter_metrics(json_file)
+    except Exception as e:
+        print(f"❌ Failed to load {json_file}: {e}")
         return False
     
     # Determine output filename
-    output_file = json_file.replace('.json', '.md')
+    output_file = os.path.splitext(json_file)[0] + '.md'
     
     # Get dashboard source
     source = data.get('source', '').lower()
@@ -217,7 +408,7 @@ def convert_json_to_markdown(json_file):
             return False
         else:
             # Use generic generator for all other dashboards
-            success = generate_generic_report(data, output_file)
+            success = generate_generic_report(data, output_file, metric_items)
             
             if success:
                 print(f"  ✅ Generated: {output_file}")
@@ -230,13 +421,40 @@ def convert_json_to_markdown(json_file):
         print(f"  ❌ Error generating report for {json_file}: {e}")
         return False
 
+def convert_file_worker(json_file):
+    """Convert one file in a worker process, capturing its log output
+    
+    Returns (json_file, success, log_text, seconds) so the parent can print
+    logs in a deterministic order.
+    """
+    buffer = io.StringIO()
+    started = time.perf_counter()
+    
+    with redirect_stdout(buffer):
+        print(f"\n📊 Processing: {os.path.basename(json_file)}")
+        success = convert_json_to_markdown(json_file)
+    
+    return json_file, success, buffer.getvalue(), time.perf_counter() - started
+
 def main():
     """Main function to convert all JSON files in metrics directory"""
     
-    metrics_dir = "grafana-metrics"
+    parser = argparse.ArgumentParser(description="Convert Grafana metrics JSON to Markdown reports")
+    parser.add_argument('metrics_dir', nargs='?', default="grafana-metrics", help="Directory with metrics files")
+    parser.add_argument('--jobs', '-j', type=int, default=1, help="Number of files converted in parallel (default: 1)")
+    parser.add_argument('--stream', action='store_true', help="Stream every JSON file instead of only large ones")
+    parser.add_argument('--store', default=os.getenv('METRICS_STORE'), help="Metrics store for trend lines (default: METRICS_STORE)")
+    parser.add_argument('--trend-days', type=float, default=float(os.getenv('METRICS_TREND_DAYS', '7')), help="Days covered by trend lines (default: 7)")
+    args = parser.parse_args()
     
-    if len(sys.argv) > 1:
-        metrics_dir = sys.argv[1]
+    # Worker processes inherit the environment
+    if args.stream:
+        os.environ['METRICS_STREAM_THRESHOLD_MB'] = '0'
+    if args.store:
+        os.environ['METRICS_STORE'] = args.store
+        os.environ['METRICS_TREND_DAYS'] = str(args.trend_days)
+    
+    metrics_dir = args.metrics_dir
     
     if not os.path.exists(metrics_dir):
         print(f"❌ Metrics directory not found: {metrics_dir}")
@@ -244,14 +462,23 @@ def main():
     
     print(f"🚀 Converting Grafana metrics to Markdown")
     print(f"   Directory: {metrics_dir}")
+    print(f"   Jobs: {args.jobs}")
+    if args.store:
+        print(f"   Trends: {args.trend_days:g} days from {args.store}")
     
     # Find all JSON files (excluding summary and ZITADEL files)
     json_files = glob.glob(f"{metrics_dir}/*.json")
     
+    # Columnar files are converted only when no JSON copy of the same run exists
+    json_files += [
+        f for f in glob.glob(f"{metrics_dir}/*{COLUMNAR_EXTENSION}")
+        if not os.path.exists(os.path.splitext(f)[0] + '.json')
+    ]
+    
     # Exclude specific files
-    exclude_patterns = ['summary', 'upload_results', 'zitadel']
+    exclude_patterns = ['summary', 'upload_results', 'zitadel', 'query_plan']
     json_files = [
-        f for f in json_files 
+        f for f in json_files
         if not any(pattern in os.path.basename(f).lower() for pattern in exclude_patterns)
     ]
     
@@ -264,21 +491,47 @@ def main():
     # Convert each file
     converted_count = 0
     failed_count = 0
+    timings = []
+    started = time.perf_counter()
+    
+    if args.jobs > 1:
+        # Results come back in submission order, so logs stay deterministic
+        with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+            results = executor.map(convert_file_worker, sorted(json_files), chunksize=4)
+            for json_file, success, log_text, seconds in results:
+                print(log_text, end='')
+                timings.append((seconds, json_file))
+                if success:
+                    converted_count += 1
+                else:
+                    failed_count += 1
+    else:
+        for json_file in sorted(json_files):
+            filename = os.path.basename(json_file)
+            print(f"\n📊 Processing: {filename}")
+            
+            file_started = time.perf_counter()
+            success = convert_json_to_markdown(json_file)
+            timings.append((time.perf_counter() - file_started, json_file))
+            
+            if success:
+                converted_count += 1
+            else:
+                failed_count += 1
     
-    for json_file in sorted(json_files):
-        filename = os.path.basename(json_file)
-        print(f"\n📊 Processing: {filename}")
-        
-        if convert_json_to_markdown(json_file):
-            converted_count += 1
-        else:
-            failed_count += 1
+    wall_time = time.perf_counter() - started
+    slowest_time, slowest_file = max(timings)
     
     # Summary
     print(f"\n✅ Conversion completed!")
     print(f"   Converted: {converted_count}")
     print(f"   Failed: {failed_count}")
     print(f"   Total: {len(json_files)}")
+    print(f"\n⏱️  Timing")
+    print(f"   Wall time: {wall_time:.2f}s")
+    print(f"   Sum of per-file time: {sum(t for t, _ in timings):.2f}s")
+    print(f"   Average per file: {sum(t for t, _ in timings) / len(timings):.3f}s")
+    print(f"   Slowest: {os.path.basename(slowest_file)} ({slowest_time:.3f}s)")
 
 if __name__ == "__main__":
     main()
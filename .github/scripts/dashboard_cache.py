@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Dashboard Definition Cache
+Stores dashboard versions and their extracted panel queries between collector runs
+"""
+
+import os
+import json
+import requests
+from datetime import datetime
+import pytz
+
+# Bump when the cached panel/query layout changes
+CACHE_FORMAT = 3
+
+class DashboardCache:
+    """Local JSON cache of dashboard versions and extracted panel queries
+    
+    Each entry holds the dashboard version, the ETag of the last full fetch,
+    the list of panels as {'title': ..., 'queries': [...]} and the extracted
+    template variables, so an unchanged dashboard never has to be
+    downloaded or parsed again.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.stats = {"unchanged": 0, "refreshed": 0, "fetched": 0}
+        
+        if os.path.exists(path):
+            try:
+                with open(path, 'r') as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"  ⚠️  Ignoring unreadable dashboard cache {path}: {e}")
+    
+    def get(self, dashboard_uid):
+        entry = self.entries.get(dashboard_uid)
+        if entry and entry.get('format') != CACHE_FORMAT:
+            return None
+        return entry
+    
+    def put(self, dashboard_uid, version, etag, panels, variables):
+        self.entries[dashboard_uid] = {
+            "format": CACHE_FORMAT,
+            "version": version,
+            "etag": etag,
+            "cached_at": datetime.now(pytz.UTC).isoformat(),
+            "panels": panels,
+            "variables": variables
+        }
+    
+    def save(self):
+        """Write the cache atomically"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.entries, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+def iter_panels(panels):
+    """Yield every panel, descending into rows
+    
+    Collapsed rows keep their children in panel['panels'] instead of the
+    dashboard's top-level panel list.
+    """
+    for panel in panels:
+        yield panel
+        yield from iter_panels(panel.get('panels', []))
+
+def get_latest_version(session, base_url, dashboard_uid, timeout=None):
+    """Return the latest saved version number of a dashboard, or None if unavailable"""
+    url = f"{base_url}/api/dashboards/uid/{dashboard_uid}/versions"
+    
+    try:
+        response = session.get(url, params={'limit': 1}, timeout=timeout)
+        response.raise_for_status()
+        data = response.json()
+    except (requests.exceptions.RequestException, ValueError):
+        return None
+    
+    # Newer Grafana versions wrap the list in {"versions": [...]}
+    if isinstance(data, dict):
+        data = data.get('versions', [])
+    
+    if not data:
+        return None
+    return data[0].get('version')
+
+def get_dashboard_definition(session, base_url, dashboard_uid, extract_queries, extract_variables, cache=None, timeout=None):
+    """Return (panels, variables) of a dashboard
+    
+    panels is [{'title': ..., 'queries': [...]}] for every panel, and
+    variables what extract_variables returns for the dashboard JSON. When a
+    cache is given, the cached entry is reused as long as the dashboard
+    version (or ETag) is unchanged; otherwise the dashboard is downloaded
+    and parsed with extract_queries and extract_variables.
+    """
+    
+    cached = cache.get(dashboard_uid) if cache else None
+    
+    # Cheap revalidation: compare the latest version without downloading the dashboard
+    if cached:
+        latest_version = get_latest_version(session, base_url, dashboard_uid, timeout)
+        if latest_version is not None and latest_version == cached['version']:
+            cache.stats["unchanged"] += 1
+            print(f"   ♻️  Dashboard unchanged (version {latest_version}), using cached queries")
+            return cached['panels'], cached['variables']
+    
+    url = f"{base_url}/api/dashboards/uid/{dashboard_uid}"
+    headers = {}
+    if cached and cached.get('etag'):
+        headers['If-None-Match'] = cached['etag']
+    
+    try:
+        response = session.get(url, headers=headers, timeout=timeout)
+        if response.status_code == 304 and cached:
+            cache.stats["unchanged"] += 1
+            print(f"   ♻️  Dashboard not modified, using cached queries")
+            return cached['panels'], cached['variables']
+        response.raise_for_status()
+        data = response.json()
+    except requests.exceptions.RequestException as e:
+        print(f"  ❌ Failed to get dashboard: {e}")
+        return [], []
+    
+    dashboard = data.get('dashboard', {})
+    version = data.get('meta', {}).get('version', dashboard.get('version'))
+    
+    # Full download but same version: skip parsing
+    if cached and version is not None and version == cached['version']:
+        cache.stats["unchanged"] += 1
+        return cached['panels'], cached['variables']
+    
+    panels = [
+        {
+            'title': panel.get('title', 'Untitled'),
+            'queries': extract_queries(panel)
+        }
+        for panel in iter_panels(dashboard.get('panels', []))
+    ]
+    variables = extract_variables(dashboard)
+    
+    if cache:
+        cache.stats["refreshed" if cached else "fetched"] += 1
+        cache.put(dashboard_uid, version, response.headers.get('ETag'), panels, variables)
+    
+    return panels, variables
+
+def get_dashboard_cache():
+    """Create the dashboard cache configured by DASHBOARD_CACHE_FILE, if enabled"""
+    path = os.getenv('DASHBOARD_CACHE_FILE')
+    if not path:
+        return None
+    
+    print(f"   Dashboard cache: {path}")
+    return DashboardCache(path)
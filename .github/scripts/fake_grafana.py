@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Fake Grafana
+Local stand-in for the Grafana and Prometheus APIs the collectors use, serving synthetic series
+"""
+
+import sys
+import re
+import json
+import time
+import zlib
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+# Values returned for every label by /api/v1/label/<name>/values
+LABEL_VALUES = 3
+
+# topk(N, ...) rewrites return at most N series
+TOPK_PATTERN = re.compile(r'^topk\((\d+),')
+
+class FakeGrafanaServer(ThreadingHTTPServer):
+    """HTTP server with a synthetic workload and per-endpoint request counters
+    
+    Every dashboard UID exists and has `panels` panels with `targets`
+    queries each and a $namespace query variable; every query returns
+    `series` series. `latency` seconds are added to each data query
+    (query_range, query and ds/query).
+    Values are derived from the expression and timestamp, so repeated
+    runs return identical data.
+    """
+    
+    daemon_threads = True
+    
+    def __init__(self, address, panels=8, targets=2, series=20, latency=0.0):
+        super().__init__(address, FakeGrafanaHandler)
+        self.panels = panels
+        self.targets = targets
+        self.series = series
+        self.latency = latency
+        self.stats = {"requests": {}, "bytes_sent": 0}
+        self._lock = threading.Lock()
+    
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+    
+    def count(self, endpoint, size):
+        with self._lock:
+            self.stats["requests"][endpoint] = self.stats["requests"].get(endpoint, 0) + 1
+            self.stats["bytes_sent"] += size
+    
+    def snapshot(self):
+        """Return a copy of the counters, e.g. before and after a benchmark stage"""
+        with self._lock:
+            return {"requests": dict(self.stats["requests"]), "bytes_sent": self.stats["bytes_sent"]}
+    
+    def build_dashboard(self, uid):
+        """Synthetic dashboard; the last panel sits in a collapsed row"""
+        panels = []
+        for index in range(self.panels):
+            panels.append({
+                "id": index + 1,
+                "type": "timeseries",
+                "title": f"Panel {index + 1}",
+                "targets": [
+                    {
+                        "refId": chr(ord('A') + target),
+                        "expr": f'sum by (pod) (rate(bench_metric_{index}_{target}{{namespace=~"$namespace", dashboard="{uid}"}}[$__rate_interval]))'
+                    }
+                    for target in range(self.targets)
+                ]
+            })
+        
+        if len(panels) > 1:
+            panels = panels[:-1] + [{"type": "row", "title": "Details", "collapsed": True, "panels": panels[-1:]}]
+        
+        return {
+            "meta": {"version": 1},
+            "dashboard": {
+                "uid": uid,
+                "title": f"Benchmark {uid}",
+                "version": 1,
+                "panels": panels,
+                "templating": {
+                    "list": [
+                        {"name": "datasource", "type": "datasource", "query": "prometheus"},
+                        {
+                            "name": "namespace",
+                            "type": "query",
+                            "query": {"query": f'label_values(bench_info{{dashboard="{uid}"}}, namespace)', "refId": "namespace"},
+                            "multi": True,
+                            "includeAll": True,
+                            "current": {"value": "$__all"}
+                        }
+                    ]
+                }
+            }
+        }
+    
+    def build_series(self, expr, timestamps):
+        """Return `series` Prometheus result entries over the given timestamps
+        
+        count((expr)) returns one series holding the series count, and
+        topk(N, expr) at most N series.
+        """
+        if expr.startswith('count(('):
+            return [{"metric": {}, "values": [[ts, str(self.series)] for ts in timestamps]}]
+        
+        series = self.series
+        topk = TOPK_PATTERN.match(expr)
+        if topk:
+            series = min(series, int(topk.group(1)))
+        
+        seed = zlib.crc32(expr.encode())
+        return [
+            {
+                "metric": {"pod": f"pod-{index}", "namespace": "bench"},
+                "values": [[ts, str((seed + index * 31 + ts // 60) % 1000 / 10)] for ts in timestamps]
+            }
+            for index in range(series)
+        ]
+
+class FakeGrafanaHandler(BaseHTTPRequestHandler):
+    """Routes the Grafana endpoints used by the collectors"""
+    
+    protocol_version = 'HTTP/1.1'
+    
+    def log_message(self, format, *args):
+        pass
+    
+    def send_json(self, endpoint, payload, status=200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.count(endpoint, len(body))
+    
+    def read_json(self):
+        length = int(self.headers.get('Content-Length', 0))
+        return json.loads(self.rfile.read(length) or b'{}')
+    
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        path = url.path
+        
+        if path == '/api/org':
+            return self.send_json('org', {"id": 1, "name": "Benchmark"})
+        
+        if path in ('/api/datasources/name/prometheus', '/api/datasources/uid/prometheus'):
+            return self.send_json('datasource', {"id": 1, "uid": "prometheus", "name": "prometheus", "type": "prometheus"})
+        
+        if path == '/api/datasources':
+            return self.send_json('datasource', [{"id": 1, "uid": "prometheus", "name": "prometheus", "type": "prometheus"}])
+        
+        if path.startswith('/api/dashboards/uid/'):
+            uid = path[len('/api/dashboards/uid/'):]
+            if uid.endswith('/versions'):
+                return self.send_json('dashboard_versions', [{"version": 1}])
+            return self.send_json('dashboard', self.server.build_dashboard(uid))
+        
+        if '/api/v1/label/' in path and path.endswith('/values'):
+            name = path.split('/api/v1/label/')[1][:-len('/values')]
+            return self.send_json('label_values', {"status": "success", "data": [f"{name}-{index}" for index in range(LABEL_VALUES)]})
+        
+        if path.endswith('/api/v1/query_range'):
+            time.sleep(self.server.latency)
+            start = int(float(params['start']))
+            end = int(float(params['end']))
+            step = max(1, int(float(params.get('step', '60').rstrip('s'))))
+            result = self.server.build_series(params['query'], range(start, end + 1, step))
+            return self.send_json('query_range', {"status": "success", "data": {"resultType": "matrix", "result": result}})
+        
+        if path.endswith('/api/v1/query'):
+            time.sleep(self.server.latency)
+            ts = int(float(params.get('time', time.time())))
+            result = [
+                {"metric": entry["metric"], "value": entry["values"][0]}
+                for entry in self.server.build_series(params['query'], [ts])
+            ]
+            return self.send_json('query', {"status": "success", "data": {"resultType": "vector", "result": result}})
+        
+        if path == '/bench/stats':
+            return self.send_json('stats', self.server.snapshot())
+        
+        self.send_json('not_found', {"message": "Not found"}, 404)
+    
+    def do_POST(self):
+        path = urlparse(self.path).path
+        body = self.read_json()
+        
+        if path == '/login':
+            return self.send_json('login', {"message": "Logged in"})
+        
+        if path == '/api/ds/query':
+            time.sleep(self.server.latency)
+            start = int(body.get('from', '0')) // 1000
+            end = int(body.get('to', '0')) // 1000
+            results = {}
+            for query in body.get('queries', []):
+                step = max(1, int(query.get('intervalMs', 60000)) // 1000)
+                timestamps = list(range(start, end + 1, step))
+                results[query['refId']] = {
+                    "status": 200,
+                    "frames": [
+                        {
+                            "schema": {
+                                "refId": query['refId'],
+                                "fields": [
+                                    {"name": "Time", "type": "time"},
+                                    {"name": "Value", "type": "number", "labels": entry["metric"]}
+                                ]
+                            },
+                            "data": {"values": [[ts * 1000 for ts in timestamps], [float(v) for _, v in entry["values"]]]}
+                        }
+                        for entry in self.server.build_series(query.get('expr', ''), timestamps)
+                    ]
+                }
+            return self.send_json('ds_query', {"results": results})
+        
+        self.send_json('not_found', {"message": "Not found"}, 404)
+
+def start_server(port=0, panels=8, targets=2, series=20, latency=0.0):
+    """Start a fake Grafana on 127.0.0.1 in a background thread (port 0 picks a free port)"""
+    server = FakeGrafanaServer(('127.0.0.1', port), panels, targets, series, latency)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a fake Grafana/Prometheus API with synthetic metrics")
+    parser.add_argument('--port', type=int, default=3000, help="Port to listen on (default: 3000)")
+    parser.add_argument('--panels', type=int, default=8, help="Panels per dashboard (default: 8)")
+    parser.add_argument('--targets', type=int, default=2, help="Queries per panel (default: 2)")
+    parser.add_argument('--series', type=int, default=20, help="Series returned per query (default: 20)")
+    parser.add_argument('--latency-ms', type=float, default=0, help="Delay added to each data query (default: 0)")
+    args = parser.parse_args()
+    
+    server = FakeGrafanaServer(('127.0.0.1', args.port), args.panels, args.targets, args.series, args.latency_ms / 1000)
+    print(f"🧪 Fake Grafana listening on {server.url}")
+    print(f"   {args.panels} panels x {args.targets} queries per dashboard, {args.series} series per query")
+    
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Stopped")
+        sys.exit(0)
+
+if __name__ == "__main__":
+    main()
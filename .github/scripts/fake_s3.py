@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Fake S3
+Local in-memory stand-in for the MinIO/S3 API the uploaders use, for tests and upload benchmarks
+"""
+
+import sys
+import time
+import uuid
+import hashlib
+import argparse
+import threading
+from email.utils import formatdate
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs, unquote
+
+S3_NAMESPACE = "http://s3.amazonaws.com/doc/2006-03-01/"
+
+class FakeS3Server(ThreadingHTTPServer):
+    """HTTP server keeping buckets and objects in memory, with per-operation request counters
+    
+    Supports the calls made by minio-py for bucket checks, single and
+    multipart uploads, stat_object and ranged get_object. Signatures are
+    not checked. Object ETags follow S3 (MD5, or MD5 of part MD5s plus
+    -<parts> for multipart uploads). `latency` seconds are added to every
+    request to stand in for the network round trip.
+    """
+    
+    daemon_threads = True
+    
+    def __init__(self, address, latency=0.0):
+        super().__init__(address, FakeS3Handler)
+        self.latency = latency
+        self.buckets = {}
+        self.uploads = {}
+        self.stats = {"requests": {}, "bytes_received": 0}
+        self._lock = threading.Lock()
+    
+    @property
+    def endpoint(self):
+        host, port = self.server_address[:2]
+        return f"{host}:{port}"
+    
+    def count(self, operation, size=0):
+        with self._lock:
+            self.stats["requests"][operation] = self.stats["requests"].get(operation, 0) + 1
+            self.stats["bytes_received"] += size
+    
+    def snapshot(self):
+        """Return a copy of the counters plus object totals, e.g. before and after a benchmark stage"""
+        with self._lock:
+            objects = [obj for bucket in self.buckets.values() for obj in bucket.values()]
+            return {
+                "requests": dict(self.stats["requests"]),
+                "bytes_received": self.stats["bytes_received"],
+                "objects": len(objects),
+                "stored_bytes": sum(len(obj["data"]) for obj in objects)
+            }
+    
+    def reset(self):
+        """Drop every object (buckets are kept) and zero the counters"""
+        with self._lock:
+            for bucket in self.buckets.values():
+                bucket.clear()
+            self.uploads.clear()
+            self.stats = {"requests": {}, "bytes_received": 0}
+
+class FakeS3Handler(BaseHTTPRequestHandler):
+    """Routes path-style S3 requests: /bucket and /bucket/object"""
+    
+    protocol_version = 'HTTP/1.1'
+    
+    def log_message(self, format, *args):
+        pass
+    
+    def parse(self):
+        url = urlparse(self.path)
+        parts = url.path.lstrip('/').split('/', 1)
+        bucket = unquote(parts[0])
+        key = unquote(parts[1]) if len(parts) > 1 else ''
+        params = {name: values[0] for name, values in parse_qs(url.query, keep_blank_values=True).items()}
+        time.sleep(self.server.latency)
+        return bucket, key, params
+    
+    def read_body(self):
+        length = int(self.headers.get('Content-Length', 0))
+        return self.rfile.read(length) if length else b''
+    
+    def send(self, status, body=b'', headers=None, head=False):
+        """Send a response; HEAD responses carry the headers (Content-Length included) but no body"""
+        headers = {'Content-Length': str(len(body)), **(headers or {})}
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        if body and not head:
+            self.wfile.write(body)
+    
+    def send_xml(self, root, content):
+        body = f'<?xml version="1.0" encoding="UTF-8"?>\n<{root} xmlns="{S3_NAMESPACE}">{content}</{root}>'.encode()
+        self.send(200, body, {'Content-Type': 'application/xml'})
+    
+    def send_error_xml(self, status, code, resource, head=False):
+        body = f'<?xml version="1.0" encoding="UTF-8"?>\n<Error><Code>{code}</Code><Message>{code}</Message><Resource>{resource}</Resource><RequestId>fake</RequestId></Error>'.encode()
+        if head:
+            return self.send(status, head=True)
+        self.send(status, body, {'Content-Type': 'application/xml'})
+    
+    def get_object(self, bucket, key):
+        return self.server.buckets.get(bucket, {}).get(key)
+    
+    def object_headers(self, obj):
+        headers = {
+            'ETag': f'"{obj["etag"]}"',
+            'Content-Type': obj["content_type"],
+            'Last-Modified': formatdate(obj["modified"], usegmt=True),
+            'Accept-Ranges': 'bytes'
+        }
+        headers.update(obj["metadata"])
+        return headers
+    
+    def do_HEAD(self):
+        bucket, key, params = self.parse()
+        self.server.count('head_object' if key else 'bucket_exists')
+        if bucket not in self.server.buckets:
+            return self.send_error_xml(404, 'NoSuchBucket', bucket, head=True)
+        if not key:
+            return self.send(200)
+        
+        obj = self.get_object(bucket, key)
+        if obj is None:
+            return self.send_error_xml(404, 'NoSuchKey', key, head=True)
+        self.send(200, headers={**self.object_headers(obj), 'Content-Length': str(len(obj["data"]))}, head=True)
+    
+    def do_GET(self):
+        bucket, key, params = self.parse()
+        if not key and 'location' in params:
+            self.server.count('get_bucket_location')
+            return self.send_xml('LocationConstraint', '')
+        
+        self.server.count('get_object')
+        obj = self.get_object(bucket, key)
+        if obj is None:
+            return self.send_error_xml(404, 'NoSuchKey' if bucket in self.server.buckets else 'NoSuchBucket', key or bucket)
+        
+        data = obj["data"]
+        headers = self.object_headers(obj)
+        byte_range = self.headers.get('Range', '')
+        if byte_range.startswith('bytes='):
+            start, _, end = byte_range[len('bytes='):].partition('-')
+            start = int(start)
+            end = min(int(end), len(data) - 1) if end else len(data) - 1
+            headers['Content-Range'] = f"bytes {start}-{end}/{len(data)}"
+            return self.send(206, data[start:end + 1], headers)
+        self.send(200, data, headers)
+    
+    def do_PUT(self):
+        bucket, key, params = self.parse()
+        body = self.read_body()
+        
+        if not key:
+            if 'policy' in params:
+                self.server.count('set_bucket_policy', len(body))
+            else:
+                self.server.count('make_bucket', len(body))
+                self.server.buckets.setdefault(bucket, {})
+            return self.send(200)
+        
+        if bucket not in self.server.buckets:
+            return self.send_error_xml(404, 'NoSuchBucket', bucket)
+        
+        if 'uploadId' in params:
+            self.server.count('upload_part', len(body))
+            upload = self.server.uploads.get(params['uploadId'])
+            if upload is None:
+                return self.send_error_xml(404, 'NoSuchUpload', key)
+            etag = hashlib.md5(body).hexdigest()
+            upload["parts"][int(params['partNumber'])] = body
+            return self.send(200, headers={'ETag': f'"{etag}"'})
+        
+        self.server.count('put_object', len(body))
+        etag = hashlib.md5(body).hexdigest()
+        self.server.buckets[bucket][key] = {
+            "data": body,
+            "etag": etag,
+            "content_type": self.headers.get('Content-Type', 'application/octet-stream'),
+            "metadata": self.get_metadata(),
+            "modified": time.time()
+        }
+        self.send(200, headers={'ETag': f'"{etag}"'})
+    
+    def do_POST(self):
+        bucket, key, params = self.parse()
+        # Drain the request; part ETags are taken from the stored parts, not the completion XML
+        self.read_body()
+        
+        if 'uploads' in params:
+            self.server.count('create_multipart_upload')
+            upload_id = uuid.uuid4().hex
+            self.server.uploads[upload_id] = {
+                "bucket": bucket,
+                "key": key,
+                "parts": {},
+                "content_type": self.headers.get('Content-Type', 'application/octet-stream'),
+                "metadata": self.get_metadata()
+            }
+            return self.send_xml('InitiateMultipartUploadResult', f"<Bucket>{bucket}</Bucket><Key>{key}</Key><UploadId>{upload_id}</UploadId>")
+        
+        if 'uploadId' in params:
+            self.server.count('complete_multipart_upload')
+            upload = self.server.uploads.pop(params['uploadId'], None)
+            if upload is None:
+                return self.send_error_xml(404, 'NoSuchUpload', key)
+            parts = [upload["parts"][number] for number in sorted(upload["parts"])]
+            etag = f"{hashlib.md5(b''.join(hashlib.md5(part).digest() for part in parts)).hexdigest()}-{len(parts)}"
+            self.server.buckets[bucket][key] = {
+                "data": b''.join(parts),
+                "etag": etag,
+                "content_type": upload["content_type"],
+                "metadata": upload["metadata"],
+                "modified": time.time()
+            }
+            return self.send_xml('CompleteMultipartUploadResult', f"<Bucket>{bucket}</Bucket><Key>{key}</Key><ETag>\"{etag}\"</ETag>")
+        
+        self.send_error_xml(400, 'NotImplemented', key)
+    
+    def do_DELETE(self):
+        bucket, key, params = self.parse()
+        if 'uploadId' in params:
+            self.server.count('abort_multipart_upload')
+            self.server.uploads.pop(params['uploadId'], None)
+        else:
+            self.server.count('remove_object')
+            self.server.buckets.get(bucket, {}).pop(key, None)
+        self.send(204)
+    
+    def get_metadata(self):
+        return {name.lower(): value for name, value in self.headers.items() if name.lower().startswith('x-amz-meta-')}
+
+def start_server(port=0, latency=0.0):
+    """Start a fake S3 on 127.0.0.1 in a background thread (port 0 picks a free port)"""
+    server = FakeS3Server(('127.0.0.1', port), latency)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a fake in-memory S3/MinIO API")
+    parser.add_argument('--port', type=int, default=9000, help="Port to listen on (default: 9000)")
+    parser.add_argument('--latency-ms', type=float, default=0, help="Delay added to each request (default: 0)")
+    args = parser.parse_args()
+    
+    server = FakeS3Server(('127.0.0.1', args.port), args.latency_ms / 1000)
+    print(f"🧪 Fake S3 listening on {server.endpoint}")
+    print(f"   Use MINIO_ENDPOINT={server.endpoint} MINIO_SECURE=false (any access and secret key)")
+    
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Stopped")
+        sys.exit(0)
+
+if __name__ == "__main__":
+    main()
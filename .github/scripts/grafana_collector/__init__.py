@@ -0,0 +1,49 @@
+"""
+Grafana Collector
+Shared collection library behind collect_grafana_metrics.py and collect_all_dashboard_metrics.py
+"""
+
+from .grafana import (
+    DASHBOARD_LIST,
+    ZITADEL_UID,
+    get_datasource,
+    get_grafana_session,
+    get_query_step,
+    parse_time_range,
+)
+from .prometheus import get_prometheus_session, get_prometheus_settings
+from .queries import (
+    ZITADEL_QUERIES,
+    build_query_plan,
+    extract_queries_from_panel,
+    get_plan_jobs,
+    load_query_plan,
+    resolve_template_variables,
+    save_query_plan,
+)
+from .variables import (
+    TEMPLATE_MODES,
+    TemplateVariables,
+    extract_variables,
+    get_template_variables,
+    substitute,
+)
+from .backends import (
+    BACKENDS,
+    DsQueryBackend,
+    PrometheusBackend,
+    ProxyBackend,
+    QueryBackend,
+    create_backend,
+    frames_to_result,
+)
+from .collector import (
+    apply_query_results,
+    execute_query_plan,
+    get_collector_settings,
+    load_previous_metrics,
+    merge_previous_metrics,
+    new_metrics_data,
+    run_collection,
+    save_metrics,
+)
@@ -0,0 +1,404 @@
+"""
+Query Backends
+Ways of running PromQL through Grafana; every backend returns Prometheus API style results
+"""
+
+import time
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlparse
+import pytz
+
+from metrics_io import format_sample_value
+from query_cache import align_window
+from resolution import get_max_points
+
+from .grafana import DEFAULT_DATASOURCE, get_query_step, parse_time_range
+
+# Per-host semaphores shared by every query worker
+_host_limits = {}
+_host_limits_lock = threading.Lock()
+
+def get_host_limit(url, per_host_limit):
+    """Return the semaphore bounding concurrent requests to the host of url"""
+    host = urlparse(url).netloc
+    
+    with _host_limits_lock:
+        if host not in _host_limits:
+            _host_limits[host] = threading.BoundedSemaphore(per_host_limit)
+        return _host_limits[host]
+
+def empty_result(instant=False):
+    return {'status': 'success', 'data': {'resultType': 'vector' if instant else 'matrix', 'result': []}}
+
+def format_timestamp(milliseconds):
+    """Milliseconds to Prometheus API seconds, keeping whole seconds as integers"""
+    milliseconds = int(milliseconds)
+    return milliseconds // 1000 if milliseconds % 1000 == 0 else milliseconds / 1000.0
+
+def frames_to_result(frames, instant=False):
+    """Convert the Grafana data frames of one query into Prometheus API result entries
+    
+    The Prometheus datasource returns one frame per series: a time field and
+    a value field carrying the series labels. Null values are gaps and are
+    dropped, as Prometheus itself omits them.
+    """
+    result = []
+    
+    for frame in frames:
+        fields = frame.get('schema', {}).get('fields', [])
+        columns = frame.get('data', {}).get('values', [])
+        if len(columns) < 2:
+            continue
+        
+        for field, values in zip(fields[1:], columns[1:]):
+            points = [
+                [format_timestamp(ts), format_sample_value(float(value))]
+                for ts, value in zip(columns[0], values)
+                if value is not None
+            ]
+            labels = dict(field.get('labels') or {})
+            
+            if instant:
+                if points:
+                    result.append({'metric': labels, 'value': points[-1]})
+            else:
+                result.append({'metric': labels, 'values': points})
+    
+    return result
+
+class QueryBackend:
+    """Runs resolved PromQL expressions over the collection time range
+    
+    execute() returns one Prometheus API response per query in input order
+    ({'status': 'success', 'data': {'resultType': ..., 'result': [...]}},
+    or None when the query failed), so planning, merging and saving do not
+    depend on the backend. Concurrency, the per-host limit, the query cache
+    and the query trace are handled here for every backend.
+    """
+    
+    name = None
+    
+    def __init__(self, session, base_url, datasource=None, cache=None, trace=None, max_workers=1, per_host_limit=None, batch_size=1):
+        self.session = session
+        self.base_url = base_url
+        self.datasource = datasource or DEFAULT_DATASOURCE
+        self.cache = cache
+        self.trace = trace
+        self.max_workers = max(1, int(max_workers))
+        self.per_host_limit = per_host_limit or self.max_workers
+        self.batch_size = batch_size
+    
+    def get_window(self, time_range, start=None, step=None, instant=False):
+        """Return the aligned (start, end, step) of a query, or None when start is in the future
+        
+        start overrides the beginning of the window (unix seconds), e.g. to
+        fetch only the points after a previous run. Unless given, the step
+        is picked by the resolution planner. Windows are aligned to the
+        step, so samples land on step boundaries and reruns share cache keys.
+        """
+        now = datetime.now(pytz.UTC)
+        step = step or get_query_step(time_range)
+        if start is None or instant:
+            start = int((now - parse_time_range(time_range)).timestamp())
+        end = int(now.timestamp())
+        
+        if start > end:
+            return None
+        return (*align_window(start, end, step), step)
+    
+    def get_cache_key(self, query, start, end, step, instant=False):
+        datasource = self.datasource.get('id') or 1
+        if instant:
+            return self.cache.make_key(datasource, query, end, end, 'instant')
+        return self.cache.make_key(datasource, query, start, end, step)
+    
+    def run_parallel(self, function, *iterables):
+        """Map function over the arguments with the configured workers and per-host limit"""
+        if self.max_workers <= 1:
+            return list(map(function, *iterables))
+        
+        host_limit = get_host_limit(self.base_url, self.per_host_limit)
+        
+        def run(*args):
+            with host_limit:
+                return function(*args)
+        
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(run, *iterables))
+    
+    def get_url(self, endpoint):
+        """URL of a Prometheus API endpoint, through the Grafana datasource proxy"""
+        return f"{self.base_url}/api/datasources/proxy/{self.datasource.get('id') or 1}/api/v1/{endpoint}"
+    
+    def label_values(self, label, match=None, time_range=None):
+        """Return the values of a label, optionally only on series matching a selector, or None on failure"""
+        
+        params = {}
+        if match:
+            params['match[]'] = match
+        if time_range:
+            end = int(datetime.now(pytz.UTC).timestamp())
+            params['start'] = end - int(parse_time_range(time_range).total_seconds())
+            params['end'] = end
+        
+        try:
+            response = self.session.get(self.get_url(f"label/{label}/values"), params=params, timeout=30)
+            response.raise_for_status()
+            result = response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"   ⚠️  Failed to look up values of label {label}: {e}")
+            return None
+        
+        if result.get('status') != 'success':
+            return None
+        return [str(value) for value in result.get('data', [])]
+    
+    def execute(self, queries, time_range, starts=None, step=None, instant=False, labels=None, groups=None):
+        """Run queries, returning their results in input order
+        
+        starts optionally gives a per-query window start (None = full time
+        range); step and instant apply to every query. labels name each
+        query in the trace. groups (e.g. the panel of each query) lets
+        batching backends keep related queries in one request.
+        """
+        raise NotImplementedError
+
+class ProxyBackend(QueryBackend):
+    """One query_range (or instant query) request per expression through the Grafana datasource proxy"""
+    
+    name = 'proxy'
+    
+    def query(self, query, time_range, start=None, step=None, instant=False, label=None):
+        """Run one query_range (or instant) query, returning the Prometheus API response or None"""
+        
+        started = time.perf_counter()
+        
+        window = self.get_window(time_range, start, step, instant)
+        # Nothing new since the requested start
+        if window is None:
+            return empty_result()
+        start, end, step = window
+        
+        url = self.get_url('query' if instant else 'query_range')
+        trace_window = {'time': end} if instant else {'start': start, 'end': end, 'step': step}
+        
+        if self.cache:
+            cache_key = self.get_cache_key(query, start, end, step, instant)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                if self.trace:
+                    self.trace.record(label, query, time.perf_counter() - started, result=cached, cached=True, **trace_window)
+                return cached
+        
+        if instant:
+            params = {'query': query, 'time': end}
+        else:
+            params = {
+                'query': query,
+                'start': start,
+                'end': end,
+                'step': f'{step}s'
+            }
+        
+        try:
+            response = self.session.get(url, params=params)
+            response.raise_for_status()
+            result = response.json()
+            if self.trace:
+                self.trace.record(label, query, time.perf_counter() - started, response, result, **trace_window)
+            if self.cache and result.get('status') == 'success':
+                self.cache.put(cache_key, result)
+            return result
+        except requests.exceptions.RequestException as e:
+            if self.trace:
+                self.trace.record(label, query, time.perf_counter() - started, getattr(e, 'response', None), error=e, **trace_window)
+            print(f"⚠️  Query failed: {query[:50]}... - {e}")
+            print(f"      URL: {url}")
+            print(f"      Error: {e}")
+            return None
+    
+    def execute(self, queries, time_range, starts=None, step=None, instant=False, labels=None, groups=None):
+        starts = starts or [None] * len(queries)
+        labels = labels or [None] * len(queries)
+        
+        def run_query(query, start, label):
+            return self.query(query, time_range, start, step, instant, label)
+        
+        return self.run_parallel(run_query, queries, starts, labels)
+
+class PrometheusBackend(ProxyBackend):
+    """Queries a Prometheus-compatible API directly, skipping the Grafana proxy hop
+    
+    base_url is the Prometheus API root and session a session for it;
+    Grafana is still used for dashboard definitions.
+    """
+    
+    name = 'prometheus'
+    
+    def get_url(self, endpoint):
+        return f"{self.base_url}/api/v1/{endpoint}"
+    
+    def get_cache_key(self, query, start, end, step, instant=False):
+        if instant:
+            return self.cache.make_key(self.base_url, query, end, end, 'instant')
+        return self.cache.make_key(self.base_url, query, start, end, step)
+
+class DsQueryBackend(QueryBackend):
+    """Batches expressions into Grafana's unified /api/ds/query endpoint
+    
+    batch_size is 'panel' to send all queries of a group (panel) together,
+    or a number of queries to pack into each request. Queries are only
+    batched with others that share the same window start.
+    """
+    
+    name = 'ds_query'
+    
+    def get_cache_key(self, query, start, end, step, instant=False):
+        datasource = self.datasource.get('uid') or DEFAULT_DATASOURCE['uid']
+        if instant:
+            return self.cache.make_key(datasource, query, end, end, 'instant')
+        return self.cache.make_key(datasource, query, start, end, step)
+    
+    def make_batches(self, indexes, starts, groups):
+        """Split query indexes into request batches"""
+        batches = []
+        size = None if self.batch_size == 'panel' else max(1, int(self.batch_size))
+        
+        for index in indexes:
+            if batches:
+                last = batches[-1][-1]
+                same_window = starts[last] == starts[index]
+                fits = groups[last] == groups[index] if size is None else len(batches[-1]) < size
+                if same_window and fits:
+                    batches[-1].append(index)
+                    continue
+            batches.append([index])
+        
+        return batches
+    
+    def query_batch(self, queries, time_range, start=None, step=None, instant=False, labels=None):
+        """Query several expressions in one /api/ds/query request, returning one result per query
+        
+        With a trace, the request is recorded once with every expression it
+        carried, labelled with the comma-joined labels.
+        """
+        
+        started = time.perf_counter()
+        label = ','.join(str(label) for label in labels or [] if label is not None) or None
+        
+        window = self.get_window(time_range, start, step, instant)
+        if window is None:
+            return [empty_result() for _ in queries]
+        start, end, step = window
+        trace_window = {'time': end} if instant else {'start': start, 'end': end, 'step': step}
+        
+        # Serve what we can from the cache
+        results = [None] * len(queries)
+        cache_keys = [None] * len(queries)
+        if self.cache:
+            for index, query in enumerate(queries):
+                cache_keys[index] = self.get_cache_key(query, start, end, step, instant)
+                results[index] = self.cache.get(cache_keys[index])
+        
+        pending = [index for index, result in enumerate(results) if result is None]
+        if not pending:
+            if self.trace:
+                self.trace.record(label, '\n'.join(queries), time.perf_counter() - started,
+                                  result={'status': 'success', 'data': {'result': [r for result in results for r in result['data']['result']]}},
+                                  cached=True, **trace_window)
+            return results
+        
+        url = f"{self.base_url}/api/ds/query"
+        
+        # Panel refIds collide across panels, so every query gets its own refId
+        ref_ids = {index: f"Q{index}" for index in pending}
+        
+        # Prepare query payload for Prometheus data source
+        payload = {
+            "queries": [
+                {
+                    "refId": ref_id,
+                    "expr": queries[index],
+                    "range": not instant,
+                    "instant": instant,
+                    "datasource": {
+                        "type": "prometheus",
+                        "uid": self.datasource.get('uid') or DEFAULT_DATASOURCE['uid']
+                    },
+                    "intervalMs": step * 1000,
+                    "maxDataPoints": get_max_points()
+                }
+                for index, ref_id in ref_ids.items()
+            ],
+            "from": str((end if instant else start) * 1000),
+            "to": str(end * 1000)
+        }
+        
+        try:
+            response = self.session.post(url, json=payload, timeout=30)
+            response.raise_for_status()
+            data = response.json()
+        except requests.exceptions.RequestException as e:
+            if self.trace:
+                self.trace.record(label, '\n'.join(queries[index] for index in pending), time.perf_counter() - started,
+                                  getattr(e, 'response', None), error=e, **trace_window)
+            for index in pending:
+                print(f"    ⚠️  Query failed: {queries[index][:80]}... - {e}")
+            return results
+        
+        # Demultiplex Grafana's per-refId frames into Prometheus-style results
+        for index, ref_id in ref_ids.items():
+            ref_result = data.get('results', {}).get(ref_id, {})
+            if ref_result.get('error'):
+                print(f"    ⚠️  Query error: {queries[index][:80]}... - {ref_result['error']}")
+                continue
+            
+            results[index] = {
+                'status': 'success',
+                'data': {
+                    'resultType': 'vector' if instant else 'matrix',
+                    'result': frames_to_result(ref_result.get('frames', []), instant)
+                }
+            }
+            
+            if self.cache:
+                self.cache.put(cache_keys[index], results[index])
+        
+        if self.trace:
+            fetched = [sample for index in pending if results[index] for sample in results[index]['data']['result']]
+            self.trace.record(label, '\n'.join(queries[index] for index in pending), time.perf_counter() - started,
+                              response, {'status': 'success', 'data': {'result': fetched}}, **trace_window)
+        
+        return results
+    
+    def execute(self, queries, time_range, starts=None, step=None, instant=False, labels=None, groups=None):
+        starts = starts or [None] * len(queries)
+        labels = labels or [None] * len(queries)
+        groups = groups or [None] * len(queries)
+        batches = self.make_batches(range(len(queries)), starts, groups)
+        
+        def run_batch(batch):
+            if len(batch) > 1:
+                print(f"    📦 Batch of {len(batch)} queries")
+            return self.query_batch(
+                [queries[index] for index in batch], time_range, starts[batch[0]], step, instant,
+                [labels[index] for index in batch]
+            )
+        
+        results = [None] * len(queries)
+        for batch, batch_results in zip(batches, self.run_parallel(run_batch, batches)):
+            for index, result in zip(batch, batch_results):
+                results[index] = result
+        return results
+
+# Backends selectable with QUERY_BACKEND
+BACKENDS = {backend.name: backend for backend in (ProxyBackend, DsQueryBackend, PrometheusBackend)}
+
+def create_backend(name, session, base_url, datasource=None, cache=None, trace=None, max_workers=1, per_host_limit=None, batch_size=1):
+    """Create the query backend registered under name"""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown query backend '{name}' (use {', '.join(BACKENDS)})")
+    return BACKENDS[name](session, base_url, datasource, cache, trace, max_workers, per_host_limit, batch_size)
@@ -0,0 +1,624 @@
+"""
+Collection Pipeline
+Plans, executes, merges and saves a collection run; the collector scripts are thin wrappers around run_collection
+"""
+
+import os
+import sys
+import json
+import glob
+from datetime import datetime
+import pytz
+
+from aggregates import AGGREGATE_FUNCTIONS, build_aggregate_queries, combine_aggregates, format_duration, get_aggregate_settings
+from cardinality import (
+    CARDINALITY_ACTIONS,
+    apply_series_limit,
+    build_count_query,
+    get_cardinality_settings,
+    get_series_limit,
+    limit_query,
+    read_count,
+)
+from dashboard_cache import get_dashboard_cache
+from metrics_io import COLUMNAR_EXTENSION, load_metrics, save_columnar
+from metrics_store import get_metrics_store, get_store_settings
+from query_cache import get_query_cache
+from query_trace import get_query_trace
+
+from .backends import BACKENDS, create_backend
+from .grafana import DASHBOARD_LIST, DEFAULT_DATASOURCE, get_datasource, get_grafana_session, get_query_step, parse_time_range
+from .prometheus import get_prometheus_session, get_prometheus_settings
+from .queries import build_query_plan, get_expression_panels, get_plan_jobs, load_query_plan, save_query_plan
+from .variables import TEMPLATE_MODES, get_template_variables
+
+def new_metrics_data(source, dashboard_uid, time_range, aggregate=None):
+    """Create the empty metrics document saved for a dashboard
+    
+    With aggregation settings, step is that of the low-resolution series
+    (None when no series are kept).
+    """
+    metrics_data = {
+        "timestamp": datetime.now(pytz.UTC).isoformat(),
+        "time_range": time_range,
+        "step": aggregate["series_step"] if aggregate else get_query_step(time_range),
+        "source": source,
+        "dashboard": dashboard_uid
+    }
+    
+    if aggregate:
+        metrics_data["aggregation"] = {
+            "window": format_duration(aggregate["window"]),
+            "resolution": format_duration(aggregate["resolution"]),
+            "functions": list(AGGREGATE_FUNCTIONS)
+        }
+    
+    # Header fields stay ahead of "metrics" for streaming readers
+    metrics_data["metrics"] = {}
+    return metrics_data
+
+def apply_query_results(metrics_data, query_jobs, results, empty_zitadel_failures=False):
+    """Store query results into metrics_data in the order the jobs were planned
+    
+    Failed queries are stored as None. With empty_zitadel_failures, failed
+    ZITADEL queries become an empty matrix instead, which the ZITADEL
+    report reads as zero.
+    """
+    
+    current_panel = None
+    
+    for job, result in zip(query_jobs, results):
+        metric_key = job['metric_key']
+        success = bool(result and result.get('status') == 'success')
+        
+        if success:
+            metrics_data["metrics"][metric_key] = result.get('data', {})
+        elif job['panel'] is None and empty_zitadel_failures:
+            metrics_data["metrics"][metric_key] = {"resultType": "matrix", "result": []}
+        else:
+            metrics_data["metrics"][metric_key] = None
+        
+        # ZITADEL jobs have no panel and keep their own log format
+        if job['panel'] is None:
+            print(f"  Querying: {metric_key}...")
+            print(f"    ✅ Collected {metric_key}" if success else f"    ⚠️  No data for {metric_key}")
+            continue
+        
+        if job['panel'] != current_panel:
+            current_panel = job['panel']
+            print(f"  Panel: {current_panel}")
+        print(f"    Querying: {job['query'][:80]}...")
+        if job['query'] != job['resolved_query']:
+            print(f"    Resolved: {job['resolved_query'][:80]}...")
+        print(f"      ✅ Collected" if success else f"      ⚠️  No data")
+    
+    return metrics_data
+
+def check_cardinality(backend, plan, expression_ids, queries, groups, limit, action):
+    """Count the series of every expression with one instant count() query each
+    
+    Returns the queries to execute, with those over the limit rewritten to
+    topk when action is 'topk', and the pre-checked counts (None where the
+    check failed). Trace records are labelled 'e3:count'.
+    """
+    count_results = backend.execute(
+        [build_count_query(query) for query in queries], plan["time_range"], instant=True,
+        labels=[f"{expr_id}:count" for expr_id in expression_ids], groups=groups
+    )
+    counts = [read_count(result) for result in count_results]
+    
+    guarded = [
+        limit_query(query, limit) if action == 'topk' and count is not None and count > limit else query
+        for query, count in zip(queries, counts)
+    ]
+    over = sum(1 for count in counts if count is not None and count > limit)
+    print(f"   Cardinality check: {over} of {len(queries)} expressions over {limit} series ({action})")
+    
+    return guarded, counts
+
+def execute_query_plan(backend, plan, starts=None, aggregate=None, cardinality=None):
+    """Execute every distinct expression of a plan once, returning {expr_id: result}
+    
+    starts optionally maps expr_id to a window start for incremental runs.
+    With aggregation settings, each expression is summarized server-side by
+    instant *_over_time queries, stored under 'aggregates' in the result
+    data, next to an optional low-resolution series. With cardinality
+    settings, expressions over the series limit are capped and the cut is
+    recorded under 'truncated' in the result data. Trace records are
+    labelled with the expression id ('e3', or 'e3:p95' for summaries).
+    """
+    
+    expression_ids = list(plan["expressions"])
+    queries = [plan["expressions"][expr_id] for expr_id in expression_ids]
+    query_starts = [(starts or {}).get(expr_id) for expr_id in expression_ids]
+    expression_panels = get_expression_panels(plan)
+    groups = [expression_panels.get(expr_id) for expr_id in expression_ids]
+    
+    limit = None
+    if cardinality:
+        window = int(parse_time_range(plan["time_range"]).total_seconds())
+        if aggregate:
+            points_per_series = window // aggregate["series_step"] + 1 if aggregate["series_step"] else None
+        else:
+            points_per_series = window // get_query_step(plan["time_range"]) + 1
+        limit = get_series_limit(cardinality, points_per_series)
+    
+    counts = [None] * len(queries)
+    if limit:
+        queries, counts = check_cardinality(backend, plan, expression_ids, queries, groups, limit, cardinality["action"])
+    
+    if not aggregate:
+        results = backend.execute(queries, plan["time_range"], query_starts, labels=expression_ids, groups=groups)
+    else:
+        results = execute_aggregate_queries(backend, plan, expression_ids, queries, groups, aggregate)
+    
+    if limit:
+        results = [
+            apply_series_limit(result, limit, cardinality["action"], count)
+            for result, count in zip(results, counts)
+        ]
+    
+    return dict(zip(expression_ids, results))
+
+def execute_aggregate_queries(backend, plan, expression_ids, queries, groups, aggregate):
+    """Run the low-resolution series and the *_over_time summaries of every expression"""
+    
+    if aggregate["series_step"]:
+        results = backend.execute(
+            queries, plan["time_range"], step=aggregate["series_step"], labels=expression_ids, groups=groups
+        )
+    else:
+        results = [{'status': 'success', 'data': {'resultType': 'matrix', 'result': []}} for _ in queries]
+    
+    # One instant query per summary function, evaluated on the subquery grid
+    summary_names = list(AGGREGATE_FUNCTIONS)
+    summary_queries = [
+        summary_query
+        for query in queries
+        for summary_query in build_aggregate_queries(query, aggregate).values()
+    ]
+    summary_labels = [f"{expr_id}:{name}" for expr_id in expression_ids for name in summary_names]
+    summary_groups = [group for group in groups for _ in summary_names]
+    summary_results = backend.execute(
+        summary_queries, plan["time_range"], step=aggregate["resolution"], instant=True,
+        labels=summary_labels, groups=summary_groups
+    )
+    
+    for index, result in enumerate(results):
+        chunk = summary_results[index * len(summary_names):(index + 1) * len(summary_names)]
+        aggregates = combine_aggregates(dict(zip(summary_names, chunk)))
+        
+        if result and result.get('status') == 'success' and aggregates is not None:
+            results[index] = {**result, 'data': {**result.get('data', {}), 'aggregates': aggregates}}
+        else:
+            results[index] = None
+    
+    return results
+
+def get_last_timestamp(metric_data):
+    """Return the newest sample timestamp in a query_range result, or None"""
+    if not metric_data or not metric_data.get('result'):
+        return None
+    
+    timestamps = [
+        result['values'][-1][0]
+        for result in metric_data['result']
+        if result.get('values')
+    ]
+    return max(timestamps) if timestamps else None
+
+def load_previous_metrics(dashboard_name, output_dir, time_range, step=3600):
+    """Load the most recent saved metrics for a dashboard collected with the same time range and step"""
+    
+    safe_name = get_safe_name(dashboard_name)
+    pattern = f"{output_dir}/{glob.escape(safe_name)}_*"
+    
+    # Ignore other dashboards whose name starts with this one
+    candidates = []
+    for path in glob.glob(pattern):
+        stem, extension = os.path.splitext(os.path.basename(path))
+        if extension in ('.json', COLUMNAR_EXTENSION) and stem[len(safe_name) + 1:].replace('_', '').isdigit():
+            candidates.append((stem, extension == '.json', path))
+    
+    if not candidates:
+        return None, None
+    
+    # Newest run first; prefer JSON when a run was saved in both formats
+    latest_file = max(candidates)[2]
+    
+    try:
+        previous = load_metrics(latest_file, string_values=True)
+    except (OSError, ValueError) as e:
+        print(f"  ⚠️  Failed to read previous metrics {latest_file}: {e}")
+        return None, None
+    
+    # Files written before the resolution planner used a fixed 1h step
+    if previous.get('time_range') != time_range or previous.get('step', 3600) != step:
+        return None, None
+    
+    return previous, latest_file
+
+def plan_incremental_starts(query_jobs, previous, window_start, step=3600):
+    """Pick a per-query start just after the last point already collected"""
+    
+    starts = []
+    for job in query_jobs:
+        last_timestamp = get_last_timestamp(previous.get('metrics', {}).get(job['metric_key']))
+        if last_timestamp is None or last_timestamp < window_start:
+            starts.append(None)
+        else:
+            starts.append(int(last_timestamp) + step)
+    
+    return starts
+
+def merge_metric_data(previous_data, new_data, window_start):
+    """Merge two query_range results, deduplicating samples by timestamp per series"""
+    
+    merged = {}
+    for metric_data in (previous_data, new_data):
+        if not metric_data:
+            continue
+        for result in metric_data.get('result', []):
+            series_key = json.dumps(result.get('metric', {}), sort_keys=True)
+            series = merged.setdefault(series_key, {'metric': result.get('metric', {}), 'values': {}})
+            for timestamp, value in result.get('values', []):
+                if timestamp >= window_start:
+                    series['values'][timestamp] = value
+    
+    result_type = (new_data or previous_data).get('resultType', 'matrix')
+    merged_data = {
+        'resultType': result_type,
+        'result': [
+            {'metric': series['metric'], 'values': [[ts, series['values'][ts]] for ts in sorted(series['values'])]}
+            for series in merged.values()
+            if series['values']
+        ]
+    }
+    
+    # Keep the cardinality guard's record of the new fetch, counting the merged series
+    if new_data and 'truncated' in new_data:
+        merged_data['truncated'] = {**new_data['truncated'], 'kept': len(merged_data['result'])}
+    return merged_data
+
+def merge_previous_metrics(metrics_data, previous, window_start):
+    """Merge the previous run's series into freshly collected delta metrics"""
+    
+    for metric_key, metric_data in metrics_data["metrics"].items():
+        previous_data = previous.get('metrics', {}).get(metric_key)
+        if previous_data and previous_data.get('resultType', 'matrix') == 'matrix':
+            metrics_data["metrics"][metric_key] = merge_metric_data(previous_data, metric_data, window_start)
+    
+    return metrics_data
+
+def get_safe_name(dashboard_name):
+    """Convert a dashboard name to the file name prefix used for its metrics"""
+    return dashboard_name.replace('/', '_').replace(' ', '_').lower()
+
+def save_metrics(metrics_data, dashboard_name, output_dir="grafana-metrics", output_format="json"):
+    """Save metrics to JSON and/or columnar files
+    
+    output_format is 'json', 'npz' or 'both'. Returns the primary file written.
+    """
+    
+    os.makedirs(output_dir, exist_ok=True)
+    
+    timestamp = datetime.now(pytz.timezone('Asia/Makassar')).strftime('%Y%m%d_%H%M%S')
+    safe_name = get_safe_name(dashboard_name)
+    filename = f"{output_dir}/{safe_name}_{timestamp}.json"
+    
+    if output_format in ('json', 'both'):
+        with open(filename, 'w') as f:
+            json.dump(metrics_data, f, indent=2)
+        
+        print(f"  💾 Saved to: {filename}")
+    
+    if output_format in ('npz', 'both'):
+        columnar_file = f"{output_dir}/{safe_name}_{timestamp}{COLUMNAR_EXTENSION}"
+        save_columnar(metrics_data, columnar_file)
+        
+        print(f"  💾 Saved to: {columnar_file}")
+        
+        if output_format == 'npz':
+            return columnar_file
+    
+    return filename
+
+def get_collector_settings(backend='proxy', auth='login', output_dir='grafana-metrics', summary_file='latest_summary.json', max_workers=8, empty_zitadel_failures=False):
+    """Read the collection settings from the environment
+    
+    The arguments are the defaults of the calling entry point; every one of
+    them can be overridden through the environment (QUERY_BACKEND,
+    GRAFANA_AUTH, OUTPUT_DIR, QUERY_WORKERS). GRAFANA_PASSWORD has no
+    default and must be set. empty_zitadel_failures keeps failed ZITADEL
+    queries as empty matrices rather than None.
+    """
+    max_workers = int(os.getenv('QUERY_WORKERS', str(max_workers)))
+    
+    return {
+        "grafana_url": os.getenv('GRAFANA_URL', 'https://grafana.pkc.pub'),
+        "username": os.getenv('GRAFANA_USERNAME', 'admin'),
+        "password": os.getenv('GRAFANA_PASSWORD'),
+        "auth": os.getenv('GRAFANA_AUTH', auth).lower(),
+        "time_range": os.getenv('TIME_RANGE', '24h'),
+        "output_dir": os.getenv('OUTPUT_DIR', output_dir),
+        "output_format": os.getenv('OUTPUT_FORMAT', 'json').lower(),
+        "summary_file": summary_file,
+        "backend": os.getenv('QUERY_BACKEND', backend).lower(),
+        "max_workers": max_workers,
+        "per_host_limit": int(os.getenv('QUERY_PER_HOST_LIMIT', str(max_workers))),
+        # 1 = one query per request, 'panel' = one request per panel, N = N queries per request
+        "batch_size": os.getenv('QUERY_BATCH_SIZE', '1'),
+        "template_mode": os.getenv('TEMPLATE_MODE', 'wildcard').lower(),
+        "incremental": os.getenv('INCREMENTAL', 'false').lower() in ('1', 'true', 'yes'),
+        "query_plan": os.getenv('QUERY_PLAN'),
+        "query_plan_file": os.getenv('QUERY_PLAN_FILE'),
+        "empty_zitadel_failures": empty_zitadel_failures
+    }
+
+def run_collection(settings, dashboard_list=DASHBOARD_LIST):
+    """Collect every dashboard with the given settings and write the metrics files and summary"""
+    
+    grafana_url = settings["grafana_url"]
+    time_range = settings["time_range"]
+    output_dir = settings["output_dir"]
+    output_format = settings["output_format"]
+    incremental = settings["incremental"]
+    
+    if not settings["password"]:
+        print("❌ GRAFANA_PASSWORD environment variable not set")
+        sys.exit(1)
+    
+    if output_format not in ('json', 'npz', 'both'):
+        print(f"❌ Unsupported OUTPUT_FORMAT: {output_format} (use json, npz or both)")
+        sys.exit(1)
+    
+    if settings["backend"] not in BACKENDS:
+        print(f"❌ Unsupported QUERY_BACKEND: {settings['backend']} (use {', '.join(BACKENDS)})")
+        sys.exit(1)
+    
+    if settings["template_mode"] not in TEMPLATE_MODES:
+        print(f"❌ Unsupported TEMPLATE_MODE: {settings['template_mode']} (use {', '.join(TEMPLATE_MODES)})")
+        sys.exit(1)
+    
+    prometheus = get_prometheus_settings()
+    if settings["backend"] == 'prometheus' and not prometheus["url"]:
+        print("❌ PROMETHEUS_URL environment variable not set (required by QUERY_BACKEND=prometheus)")
+        sys.exit(1)
+    
+    cardinality = get_cardinality_settings()
+    if cardinality and cardinality["action"] not in CARDINALITY_ACTIONS:
+        print(f"❌ Unsupported CARDINALITY_ACTION: {cardinality['action']} (use {', '.join(CARDINALITY_ACTIONS)})")
+        sys.exit(1)
+    
+    # Server-side summaries cover the whole window, so there is nothing to merge
+    aggregate = get_aggregate_settings(parse_time_range(time_range).total_seconds())
+    if aggregate and incremental:
+        print("⚠️  INCREMENTAL is ignored in aggregate mode")
+        incremental = False
+    
+    print(f"🚀 Starting Grafana metrics collection")
+    print(f"   URL: {grafana_url}")
+    print(f"   Time range: {time_range} (step {get_query_step(time_range)}s)")
+    print(f"   User: {settings['username']}")
+    print(f"   Output: {output_dir} ({output_format})")
+    print(f"   Dashboards: {len(dashboard_list)}")
+    if settings["backend"] == 'prometheus':
+        print(f"   Backend: prometheus ({prometheus['url']})")
+    else:
+        print(f"   Backend: {settings['backend']} (batch size {settings['batch_size']})")
+    print(f"   Query workers: {settings['max_workers']}")
+    print(f"   Template variables: {settings['template_mode']}")
+    if cardinality:
+        print(f"   Cardinality guard: max {cardinality['max_series'] or '-'} series, "
+              f"{cardinality['max_points'] or '-'} points per query ({cardinality['action']})")
+    print(f"   Incremental: {incremental}")
+    if aggregate:
+        series_step = f"{aggregate['series_step']}s" if aggregate['series_step'] else "none"
+        print(f"   Aggregate mode: {format_duration(aggregate['window'])} window, "
+              f"{format_duration(aggregate['resolution'])} resolution, series step {series_step}")
+    
+    # Optional on-disk query result cache
+    cache = get_query_cache()
+    dashboard_cache = get_dashboard_cache()
+    trace = get_query_trace()
+    store = get_metrics_store()
+    
+    # Login to Grafana
+    session = get_grafana_session(
+        grafana_url, settings["username"], settings["password"], settings["max_workers"], settings["auth"]
+    )
+    
+    if settings["backend"] == 'prometheus':
+        # Grafana only serves dashboard definitions; queries go straight to Prometheus
+        query_session = get_prometheus_session(prometheus, settings["max_workers"])
+        query_url = prometheus["url"]
+        datasource = None
+    else:
+        query_session = session
+        query_url = grafana_url
+        
+        # Get Prometheus datasource
+        print(f"\n🔍 Getting Prometheus datasource...")
+        datasource = get_datasource(session, grafana_url, 'prometheus')
+        if datasource:
+            print(f"   ✅ Using Prometheus datasource ID: {datasource.get('id')}")
+        else:
+            print(f"   ⚠️  Could not find Prometheus datasource, will use default datasource ID {DEFAULT_DATASOURCE['id']}")
+    
+    backend = create_backend(
+        settings["backend"], query_session, query_url, datasource, cache, trace,
+        settings["max_workers"], settings["per_host_limit"], settings["batch_size"]
+    )
+    
+    # Template variable values are looked up through the query backend
+    template = get_template_variables(settings["template_mode"], time_range, backend)
+    
+    # Build (or load) the query plan covering every dashboard
+    if settings["query_plan"]:
+        print(f"\n🧭 Loading query plan: {settings['query_plan']}")
+        plan = load_query_plan(settings["query_plan"], time_range)
+        if not plan:
+            sys.exit(1)
+    else:
+        plan = build_query_plan(session, grafana_url, dashboard_list, time_range, dashboard_cache, template)
+    
+    if dashboard_cache:
+        dashboard_cache.save()
+    
+    if settings["query_plan_file"]:
+        save_query_plan(plan, settings["query_plan_file"])
+    
+    total_jobs = sum(len(entry["jobs"]) for entry in plan["dashboards"])
+    print(f"\n🧭 Query plan: {total_jobs} queries, {len(plan['expressions'])} unique expressions")
+    
+    # In incremental mode, only fetch points newer than the previous run
+    window_start = int((datetime.now(pytz.UTC) - parse_time_range(time_range)).timestamp())
+    step = get_query_step(time_range)
+    previous_runs = {}
+    expression_starts = {}
+    
+    for entry in plan["dashboards"]:
+        dashboard_name = entry["name"]
+        previous, previous_file = (None, None)
+        if incremental:
+            previous, previous_file = load_previous_metrics(dashboard_name, output_dir, time_range, step)
+        
+        if previous:
+            print(f"   ♻️  {dashboard_name}: incremental from {previous_file}")
+            previous_runs[dashboard_name] = (previous, os.path.basename(previous_file))
+            job_starts = plan_incremental_starts(entry["jobs"], previous, window_start, step)
+        else:
+            job_starts = [None] * len(entry["jobs"])
+        
+        # A shared expression must cover the widest window any of its users needs
+        for job, start in zip(entry["jobs"], job_starts):
+            expr_id = job['expr_id']
+            if expr_id not in expression_starts:
+                expression_starts[expr_id] = start
+            elif start is None or expression_starts[expr_id] is None:
+                expression_starts[expr_id] = None
+            else:
+                expression_starts[expr_id] = min(start, expression_starts[expr_id])
+    
+    # Fan out all distinct expressions from every dashboard at once
+    query_count = len(plan['expressions']) * (len(AGGREGATE_FUNCTIONS) + 1 if aggregate else 1)
+    if cardinality:
+        query_count += len(plan['expressions'])
+    print(f"\n⚡ Executing {query_count} queries ({settings['max_workers']} workers, {settings['per_host_limit']} per host)")
+    expression_results = execute_query_plan(backend, plan, expression_starts, aggregate, cardinality)
+    trace.close()
+    
+    # Collect metrics from all dashboards
+    collected_count = 0
+    total_metrics = 0
+    
+    for entry in plan["dashboards"]:
+        dashboard_name = entry["name"]
+        
+        try:
+            print(f"\n📊 Results: {dashboard_name}")
+            query_jobs = get_plan_jobs(plan, entry)
+            results = [expression_results.get(job['expr_id']) for job in query_jobs]
+            
+            metrics_data = new_metrics_data(entry["source"], entry["uid"], time_range, aggregate)
+            metrics_data = apply_query_results(metrics_data, query_jobs, results, settings["empty_zitadel_failures"])
+            
+            if dashboard_name in previous_runs:
+                previous, previous_file = previous_runs[dashboard_name]
+                metrics_data["incremental_base"] = previous_file
+                metrics_data = merge_previous_metrics(metrics_data, previous, window_start)
+            
+            save_metrics(metrics_data, dashboard_name, output_dir, output_format)
+            if store:
+                store.ingest(metrics_data)
+            collected_count += 1
+            total_metrics += len([m for m in metrics_data["metrics"].values() if m is not None])
+        except Exception as e:
+            print(f"  ❌ Error collecting {dashboard_name}: {e}")
+    
+    # Fold samples past the raw retention into rollups
+    store_summary = None
+    if store:
+        store_settings = get_store_settings()
+        compaction = store.compact(**store_settings)
+        store_summary = {"path": store.path, **store_settings, **compaction, **store.stats()}
+        store.close()
+    
+    # Create summary
+    summary = {
+        "collection_time": datetime.now(pytz.UTC).isoformat(),
+        "time_range": time_range,
+        "step": get_query_step(time_range),
+        "backend": backend.name,
+        "total_dashboards": len(dashboard_list),
+        "collected": collected_count,
+        "total_metrics": total_metrics,
+        "output_directory": output_dir
+    }
+    
+    summary["transport"] = session.stats.summary()
+    if query_session is not session:
+        summary["prometheus_transport"] = query_session.stats.summary()
+    summary["query_trace"] = trace.summary({
+        entry["name"]: [job["expr_id"] for job in entry["jobs"]]
+        for entry in plan["dashboards"]
+    })
+    if cache:
+        summary["query_cache"] = cache.summary()
+    if dashboard_cache:
+        summary["dashboard_cache"] = dashboard_cache.stats
+    if template.mode != 'wildcard':
+        summary["template_variables"] = template.stats
+    if cardinality:
+        summary["cardinality"] = {
+            **cardinality,
+            "truncated": [
+                {"expr_id": expr_id, "query": plan["expressions"][expr_id], **result['data']['truncated']}
+                for expr_id, result in expression_results.items()
+                if result and 'truncated' in result.get('data', {})
+            ]
+        }
+    if store_summary:
+        summary["metrics_store"] = store_summary
+    if aggregate:
+        summary["aggregation"] = {
+            "window": format_duration(aggregate["window"]),
+            "resolution": format_duration(aggregate["resolution"]),
+            "series_step": aggregate["series_step"],
+            "summary_queries": len(plan["expressions"]) * len(AGGREGATE_FUNCTIONS)
+        }
+    summary["query_plan"] = {
+        "queries": total_jobs,
+        "unique_expressions": len(plan["expressions"])
+    }
+    
+    os.makedirs(output_dir, exist_ok=True)
+    summary_file = f"{output_dir}/{settings['summary_file']}"
+    with open(summary_file, 'w') as f:
+        json.dump(summary, f, indent=2)
+    
+    print(f"\n✅ Metrics collection completed!")
+    print(f"   Total dashboards: {len(dashboard_list)}")
+    print(f"   Collected: {collected_count}")
+    print(f"   Total metrics: {total_metrics}")
+    if cache:
+        print(f"   Cache hits/misses: {cache.stats['hits']}/{cache.stats['misses']}")
+    if store_summary:
+        print(f"   Metrics store: {store_summary['samples']} samples, {store_summary['rollups']} rollups "
+              f"({store_summary['folded']} samples compacted)")
+    if cardinality:
+        print(f"   Truncated queries: {len(summary['cardinality']['truncated'])}")
+    if "template_variables" in summary:
+        print(f"   Template variables: {template.stats['discovered']} discovered ({template.stats['lookups']} lookups), "
+              f"{template.stats['match_all']} matching all, {template.stats['fanned_out']} queries fanned out")
+    if summary["query_trace"]["slowest"]:
+        slowest = summary["query_trace"]["slowest"][0]
+        print(f"   Slowest query: {slowest['seconds']:.2f}s {str(slowest['label'])[:40]} {slowest['query'][:60]}")
+    for name, key in (("HTTP requests", "transport"), ("Prometheus requests", "prometheus_transport")):
+        if summary.get(key, {}).get("latency_ms"):
+            latency = summary[key]["latency_ms"]
+            print(f"   {name}: {summary[key]['requests']} (p50 {latency['p50']} ms, p95 {latency['p95']} ms, "
+                  f"{summary[key]['retries']} retries)")
+    print(f"   Summary: {summary_file}")
+    
+    return summary
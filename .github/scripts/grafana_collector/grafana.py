@@ -0,0 +1,108 @@
+"""
+Grafana API
+Login, datasource lookup and the dashboards collected by default
+"""
+
+import sys
+import requests
+import urllib3
+
+from resolution import get_step, parse_time_range
+from transport import create_session, get_transport_settings
+
+ZITADEL_UID = "zitadel-auth"
+
+# Dashboard list (UID, Name)
+DASHBOARD_LIST = [
+    ("09ec8aa1e996d6ffcd6817bbaff4db1b", "Kubernetes / API server"),
+    ("a87fb0d919ec0ea5f6543124e16c42a5", "Kubernetes / Compute Resources / Cluster"),
+    ("85a562078cdf77779eaa1add43ccec1e", "Kubernetes / Compute Resources / Namespace (Pods)"),
+    ("a164a7f0339f99e89cea5cb47e9be617", "Kubernetes / Compute Resources / Namespace (Workloads)"),
+    ("200ac8fdbfbb74b39aff88118e4d1c2c", "Kubernetes / Compute Resources / Node (Pods)"),
+    ("6581e46e4e5c7ba40a07646395ef7b23", "Kubernetes / Compute Resources / Pod"),
+    ("df83f0b4e5f3e5f3e5f3e5f3e5f3e5f3", "Kubernetes / Controller Manager"),
+    ("3138fa155d5915769fbded898ac09fd9", "Kubernetes / Kubelet"),
+    ("ff635a025bcfea7bc2dd4f508990a3e9", "Kubernetes / Networking / Cluster"),
+    ("8b7a8b326d7a6f1f3e3e3e3e3e3e3e3e", "Kubernetes / Networking / Namespace (Pods)"),
+    ("bbb2a765a623ae38130206c7d94a160f", "Kubernetes / Networking / Namespace (Workload)"),
+    ("728bf77cc1166d2f3133bf25846876cc", "Kubernetes / Networking / Pod"),
+    ("919b92a8e8041bd567af9edab12c840c", "Kubernetes / Persistent Volumes"),
+    ("632e265de5b7a5d7f0f3e5f3e5f3e5f3", "Kubernetes / Proxy"),
+    ("2e6b6a3b4bddf1427b3a55aa1311c656", "Kubernetes / Scheduler"),
+    (ZITADEL_UID, "ZITADEL Authentication & User Monitoring"),
+]
+
+# Used when the Prometheus datasource cannot be looked up
+DEFAULT_DATASOURCE = {"id": 1, "uid": "prometheus", "name": "prometheus", "type": "prometheus"}
+
+def get_query_step(time_range):
+    """Query step in seconds for a time range, chosen by the resolution planner"""
+    return get_step(parse_time_range(time_range).total_seconds())
+
+def get_grafana_session(base_url, username, password, pool_size=10, auth='login'):
+    """Log in to Grafana and return a pooled, retrying session
+    
+    auth='login' posts the credentials to /login and keeps the session
+    cookie; auth='basic' sends HTTP basic auth with every request and
+    checks it against /api/org. The session records per-request latency
+    in session.stats; see transport.get_transport_settings for the options.
+    """
+    settings = get_transport_settings(pool_size)
+    session = create_session(**settings)
+    print(f"   Transport: pool {settings['pool_size']}, {settings['retries']} retries, "
+          f"{'HTTP/2' if settings['http2'] else 'HTTP/1.1'}, TLS verify {settings['verify']}")
+    
+    if settings['verify'] is False:
+        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+    
+    try:
+        if auth == 'basic':
+            session.auth = (username, password)
+            response = session.get(f"{base_url}/api/org", timeout=10)
+        else:
+            response = session.post(f"{base_url}/login", json={"user": username, "password": password})
+        response.raise_for_status()
+        print(f"✅ Successfully logged in to Grafana")
+        return session
+    except requests.exceptions.RequestException as e:
+        print(f"❌ Failed to login to Grafana: {e}")
+        sys.exit(1)
+
+def get_datasource(session, base_url, datasource_name='prometheus'):
+    """Return the datasource (with 'id' and 'uid') by name, or the first Prometheus datasource"""
+    
+    # First, try exact name match
+    url = f"{base_url}/api/datasources/name/{datasource_name}"
+    try:
+        response = session.get(url)
+        response.raise_for_status()
+        data = response.json()
+        print(f"   Found datasource '{datasource_name}': ID={data.get('id')}, UID={data.get('uid')}")
+        return data
+    except requests.exceptions.RequestException:
+        pass
+    
+    # If exact match fails, list all datasources and find Prometheus
+    print(f"   Exact match failed, searching all datasources...")
+    url = f"{base_url}/api/datasources"
+    try:
+        response = session.get(url)
+        response.raise_for_status()
+        datasources = response.json()
+        
+        print(f"   Found {len(datasources)} datasources:")
+        for ds in datasources:
+            ds_name = ds.get('name', '')
+            ds_type = ds.get('type', '')
+            print(f"     - {ds_name} (type: {ds_type}, id: {ds.get('id')}, uid: {ds.get('uid')})")
+            
+            # Look for Prometheus datasource (case-insensitive)
+            if ds_type.lower() == 'prometheus':
+                print(f"   ✅ Found Prometheus datasource: '{ds_name}' ID={ds.get('id')}, UID={ds.get('uid')}")
+                return ds
+        
+        print(f"   ⚠️  No Prometheus datasource found")
+        return None
+    except requests.exceptions.RequestException as e:
+        print(f"   ⚠️  Failed to list datasources: {e}")
+        return None
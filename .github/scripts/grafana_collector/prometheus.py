@@ -0,0 +1,54 @@
+"""
+Direct Prometheus Access
+Session for querying a Prometheus-compatible HTTP API without going through Grafana
+"""
+
+import os
+import sys
+import requests
+import urllib3
+
+from transport import create_session, get_transport_settings
+
+def get_prometheus_settings():
+    """Read PROMETHEUS_* settings from the environment
+    
+    PROMETHEUS_URL is the API root that /api/v1/query_range is appended to
+    (e.g. http://prometheus:9090, or https://mimir/prometheus). Requests
+    are authenticated with PROMETHEUS_TOKEN (bearer) or
+    PROMETHEUS_USERNAME/PROMETHEUS_PASSWORD (basic), if set.
+    """
+    return {
+        "url": os.getenv('PROMETHEUS_URL', '').rstrip('/'),
+        "token": os.getenv('PROMETHEUS_TOKEN'),
+        "username": os.getenv('PROMETHEUS_USERNAME'),
+        "password": os.getenv('PROMETHEUS_PASSWORD')
+    }
+
+def get_prometheus_session(settings, pool_size=10):
+    """Return a pooled, retrying session for the Prometheus API, checked with a trivial query
+    
+    TLS verification follows PROMETHEUS_VERIFY_TLS, with the same values as
+    GRAFANA_VERIFY_TLS.
+    """
+    transport = get_transport_settings(pool_size, 'PROMETHEUS_VERIFY_TLS')
+    session = create_session(**transport)
+    print(f"   Prometheus transport: pool {transport['pool_size']}, {transport['retries']} retries, "
+          f"{'HTTP/2' if transport['http2'] else 'HTTP/1.1'}, TLS verify {transport['verify']}")
+    
+    if transport['verify'] is False:
+        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+    
+    if settings["token"]:
+        session.headers['Authorization'] = f"Bearer {settings['token']}"
+    elif settings["username"]:
+        session.auth = (settings["username"], settings["password"] or '')
+    
+    try:
+        response = session.get(f"{settings['url']}/api/v1/query", params={'query': '1'}, timeout=10)
+        response.raise_for_status()
+        print(f"✅ Connected to Prometheus: {settings['url']}")
+        return session
+    except requests.exceptions.RequestException as e:
+        print(f"❌ Failed to reach Prometheus at {settings['url']}: {e}")
+        sys.exit(1)
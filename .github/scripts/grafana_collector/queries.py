@@ -0,0 +1,243 @@
+"""
+Query Planning
+Extracts panel queries from dashboards, resolves template variables and builds a deduplicated query plan
+"""
+
+import os
+import json
+from datetime import datetime
+import pytz
+
+from dashboard_cache import get_dashboard_definition
+
+from .grafana import ZITADEL_UID
+from .variables import MatchAll, TemplateVariables, extract_variables
+
+# Common ZITADEL metrics to collect
+ZITADEL_QUERIES = {
+    "active_sessions": 'zitadel_active_sessions_total',
+    "failed_logins": 'rate(zitadel_failed_auth_requests_total[1h])',
+    "successful_logins": 'rate(zitadel_successful_auth_requests_total[1h])',
+    "active_users": 'zitadel_active_users_total',
+    "registered_users": 'zitadel_users_total',
+    "auth_requests": 'rate(zitadel_auth_requests_total[1h])',
+    "token_requests": 'rate(zitadel_token_requests_total[1h])',
+    "api_calls": 'rate(zitadel_api_calls_total[1h])',
+    "database_connections": 'zitadel_database_connections',
+    "cache_hit_rate": 'rate(zitadel_cache_hits_total[1h]) / rate(zitadel_cache_requests_total[1h])',
+    # Authentication Events (specific event types) - using correct metric name
+    "event_oidc_session_access_token_added": 'zitadel_auth_events_total{event_type="oidc_session.access_token.added"}',
+    "event_oidc_session_added": 'zitadel_auth_events_total{event_type="oidc_session.added"}',
+    "event_user_human_externallogin_check_succeeded": 'zitadel_auth_events_total{event_type="user.human.externallogin.check.succeeded"}',
+    "event_user_human_mfa_init_skipped": 'zitadel_auth_events_total{event_type="user.human.mfa.init.skipped"}',
+    "event_user_human_mfa_otp_added": 'zitadel_auth_events_total{event_type="user.human.mfa.otp.added"}',
+    "event_user_human_password_check_succeeded": 'zitadel_auth_events_total{event_type="user.human.password.check.succeeded"}',
+    "event_user_token_v2_added": 'zitadel_auth_events_total{event_type="user.token.v2.added"}',
+    # All authentication events aggregated by event type
+    "authentication_events_by_type": 'zitadel_auth_events_total',
+}
+
+def resolve_template_variables(query, time_range='24h'):
+    """Resolve Grafana template variables in query with the fixed wildcard values"""
+    template = TemplateVariables(time_range)
+    return template.expand(query, template.resolve_dashboard([]))[0][0]
+
+def extract_queries_from_panel(panel):
+    """Extract Prometheus queries from a panel"""
+    queries = []
+    targets = panel.get('targets', [])
+    
+    for target in targets:
+        expr = target.get('expr')
+        if expr:
+            queries.append({
+                'expr': expr,
+                'refId': target.get('refId', 'A'),
+                'legendFormat': target.get('legendFormat', '')
+            })
+    
+    return queries
+
+def get_metric_key(panel_title, ref_id, variables=None):
+    """Key under which a panel target is stored in the metrics document
+    
+    Fanned-out queries append the value of each variable they were expanded for.
+    """
+    parts = [panel_title, ref_id, *(variables or {}).values()]
+    return '_'.join(parts).replace(' ', '_').replace('/', '_').lower()
+
+def describe_variables(values, variables):
+    """One-line summary of a dashboard's resolved variables for the log"""
+    described = []
+    for variable in variables:
+        value = values.get(variable.get('name'))
+        if isinstance(value, list):
+            described.append(f"{variable['name']} ({len(value)} values)")
+        elif value is not None:
+            described.append(f"{variable['name']} ({'all' if isinstance(value, MatchAll) else value})")
+    return ', '.join(described)
+
+def prepare_dashboard_queries(session, base_url, dashboard_uid, dashboard_name, time_range, dashboard_cache=None, template=None):
+    """Fetch dashboard panels and resolve their queries without executing them"""
+    
+    print(f"\n📊 Collecting metrics: {dashboard_name}")
+    print(f"   UID: {dashboard_uid}")
+    
+    # Get dashboard panels with their extracted queries
+    panels, variables = get_dashboard_definition(
+        session, base_url, dashboard_uid, extract_queries_from_panel, extract_variables, dashboard_cache, timeout=10
+    )
+    
+    if not panels:
+        print(f"  ⚠️  No panels found")
+        return None
+    
+    print(f"   Found {len(panels)} panels")
+    
+    template = template or TemplateVariables(time_range)
+    values = template.resolve_dashboard(variables)
+    if template.mode != 'wildcard' and variables:
+        print(f"   Variables: {describe_variables(values, variables)}")
+    
+    query_jobs = []
+    
+    # Resolve queries from each panel
+    for panel in panels:
+        panel_title = panel['title']
+        
+        for query_info in panel['queries']:
+            query = query_info['expr']
+            
+            # Fanout mode turns one target into a query per variable value
+            for resolved_query, selected in template.expand(query, values):
+                job = {
+                    'panel': panel_title,
+                    'metric_key': get_metric_key(panel_title, query_info['refId'], selected),
+                    'query': query,
+                    'resolved_query': resolved_query
+                }
+                if selected:
+                    job['variables'] = selected
+                query_jobs.append(job)
+    
+    return query_jobs
+
+def prepare_zitadel_queries(time_range):
+    """Build the ZITADEL query jobs; they have no panel"""
+    
+    print(f"\n📊 Collecting ZITADEL metrics")
+    
+    return [
+        {
+            'panel': None,
+            'metric_key': metric_name,
+            'query': query,
+            'resolved_query': query
+        }
+        for metric_name, query in ZITADEL_QUERIES.items()
+    ]
+
+def build_query_plan(session, base_url, dashboard_list, time_range, dashboard_cache=None, template=None):
+    """Resolve the queries of every dashboard into a deduplicated, serializable plan
+    
+    Each distinct resolved expression is stored once under an id in
+    plan['expressions']; dashboard jobs only reference that id, so shared
+    expressions are executed a single time. template is the
+    TemplateVariables engine (default: wildcard substitution).
+    """
+    
+    template = template or TemplateVariables(time_range)
+    plan = {
+        "created": datetime.now(pytz.UTC).isoformat(),
+        "time_range": time_range,
+        "template_mode": template.mode,
+        "expressions": {},
+        "dashboards": []
+    }
+    expression_ids = {}
+    
+    for dashboard_uid, dashboard_name in dashboard_list:
+        try:
+            # Special handling for ZITADEL
+            if dashboard_uid == ZITADEL_UID:
+                query_jobs = prepare_zitadel_queries(time_range)
+            else:
+                query_jobs = prepare_dashboard_queries(
+                    session, base_url, dashboard_uid, dashboard_name, time_range, dashboard_cache, template
+                )
+        except Exception as e:
+            print(f"  ❌ Error collecting {dashboard_name}: {e}")
+            continue
+        
+        if not query_jobs:
+            continue
+        
+        plan_jobs = []
+        
+        for job in query_jobs:
+            resolved_query = job['resolved_query']
+            if resolved_query not in expression_ids:
+                expression_ids[resolved_query] = f"e{len(expression_ids)}"
+                plan["expressions"][expression_ids[resolved_query]] = resolved_query
+            
+            plan_job = {
+                'panel': job['panel'],
+                'metric_key': job['metric_key'],
+                'query': job['query'],
+                'expr_id': expression_ids[resolved_query]
+            }
+            if job.get('variables'):
+                plan_job['variables'] = job['variables']
+            plan_jobs.append(plan_job)
+        
+        plan["dashboards"].append({
+            "name": dashboard_name,
+            "source": "ZITADEL" if dashboard_uid == ZITADEL_UID else dashboard_name,
+            "uid": dashboard_uid,
+            "jobs": plan_jobs
+        })
+    
+    return plan
+
+def get_plan_jobs(plan, dashboard_entry):
+    """Return the jobs of a plan dashboard with their resolved queries filled in"""
+    return [
+        {**job, 'resolved_query': plan["expressions"][job['expr_id']]}
+        for job in dashboard_entry["jobs"]
+    ]
+
+def get_expression_panels(plan):
+    """Map each expression id to the (dashboard, panel) that first uses it, for panel batching"""
+    panels = {}
+    for entry in plan["dashboards"]:
+        for job in entry["jobs"]:
+            panels.setdefault(job['expr_id'], (entry["name"], job['panel']))
+    return panels
+
+def save_query_plan(plan, plan_file):
+    """Write a query plan to disk"""
+    
+    directory = os.path.dirname(plan_file)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    
+    with open(plan_file, 'w') as f:
+        json.dump(plan, f, indent=2)
+    
+    print(f"  💾 Query plan saved to: {plan_file}")
+
+def load_query_plan(plan_file, time_range):
+    """Load a precompiled query plan, or None if it is unusable for this time range"""
+    
+    try:
+        with open(plan_file, 'r') as f:
+            plan = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"  ⚠️  Failed to load query plan {plan_file}: {e}")
+        return None
+    
+    if plan.get('time_range') != time_range:
+        print(f"  ⚠️  Query plan {plan_file} was built for {plan.get('time_range')}, not {time_range}")
+        return None
+    
+    return plan
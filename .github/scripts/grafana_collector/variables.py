@@ -0,0 +1,313 @@
+"""
+Template Variables
+Expands Grafana template variables in panel queries, with values discovered from Prometheus label values
+"""
+
+import os
+import re
+import itertools
+
+from .grafana import parse_time_range
+
+TEMPLATE_MODES = ('wildcard', 'aggregate', 'fanout')
+DEFAULT_MAX_VALUES = 100
+DEFAULT_MAX_FANOUT = 20
+
+# Values substituted in wildcard mode, where nothing is discovered
+WILDCARD_VALUES = {
+    'cluster': '',  # Empty to match all clusters
+    '__all': '.*',  # Match all
+    'instance': '.*',
+    'namespace': '.*',
+    'node': '.*',
+}
+
+# $var, ${var}, ${var:format} and [[var]], with the label matcher operator when the reference is quoted.
+# Names start with a letter or underscore, so label_replace() references like "$1" are not variables.
+VARIABLE_PATTERN = re.compile(
+    r'(?:(?P<op>=~|!~|!=|=)")?'
+    r'(?:\$\{(?P<braced>[A-Za-z_]\w*)(?::(?P<format>\w+))?\}|\[\[(?P<old>[A-Za-z_]\w*)\]\]|\$(?P<plain>[A-Za-z_]\w*))'
+)
+
+# label_values(label) or label_values(selector, label)
+LABEL_VALUES_PATTERN = re.compile(r'^\s*label_values\(\s*(?:(?P<match>.+?)\s*,\s*)?(?P<label>\w+)\s*\)\s*$', re.S)
+
+# Regex metacharacters, escaped with a double backslash inside a PromQL string
+PROMQL_REGEX_CHARS = re.compile(r'([\\^$*+?.()|{}\[\]])')
+
+class MatchAll(str):
+    """A regex standing for every value of a variable (Grafana's 'All' / allValue)"""
+
+def get_builtin_variables(time_range):
+    """Values of Grafana's $__ built-in variables for a collection time range"""
+    
+    # Rate interval scaled to the window
+    if time_range.endswith('h'):
+        hours = int(time_range[:-1])
+        if hours <= 1:
+            rate_interval = '1m'
+        elif hours <= 6:
+            rate_interval = '5m'
+        else:
+            rate_interval = '1h'
+    else:
+        rate_interval = '5m'
+    
+    interval_seconds = {'1m': 60, '5m': 300, '1h': 3600}[rate_interval]
+    range_seconds = int(parse_time_range(time_range).total_seconds())
+    
+    return {
+        '__rate_interval': rate_interval,
+        '__interval': rate_interval,
+        '__interval_ms': str(interval_seconds * 1000),
+        '__range': f"{range_seconds}s",
+        '__range_s': str(range_seconds),
+        '__range_ms': str(range_seconds * 1000),
+    }
+
+def extract_variables(dashboard):
+    """Return the template variables of a dashboard, reduced to the fields the engine uses"""
+    variables = []
+    
+    for variable in dashboard.get('templating', {}).get('list', []):
+        query = variable.get('query')
+        # Newer Grafana versions store query variables as {"query": "label_values(...)", ...}
+        if isinstance(query, dict):
+            query = query.get('query')
+        
+        variables.append({
+            'name': variable.get('name'),
+            'type': variable.get('type'),
+            'query': query or variable.get('definition') or '',
+            'regex': variable.get('regex') or '',
+            'all_value': variable.get('allValue') or '',
+            'current': (variable.get('current') or {}).get('value')
+        })
+    
+    return variables
+
+def escape_regex(value):
+    """Escape a label value for use inside a PromQL regex matcher"""
+    return PROMQL_REGEX_CHARS.sub(r'\\\\\1', value)
+
+def format_values(value, value_format=None, regex=False):
+    """Render a variable value: strings verbatim, lists of values in the requested format
+    
+    A single value is inserted as is, or escaped when it lands in a regex
+    (regex, or ${var:regex}); several values become a regex alternation of
+    escaped values, as Grafana does for multi-value variables, or a
+    pipe/comma separated list with ${var:pipe} and ${var:csv}.
+    """
+    if isinstance(value, str):
+        return value
+    if value_format == 'csv':
+        return ','.join(value)
+    if value_format == 'pipe':
+        return '|'.join(value)
+    if len(value) == 1:
+        return escape_regex(value[0]) if regex or value_format == 'regex' else value[0]
+    return '(' + '|'.join(escape_regex(item) for item in value) + ')'
+
+def is_regex_value(value, value_format=None):
+    """Whether a value only works with a regex matcher"""
+    if isinstance(value, MatchAll):
+        return True
+    return isinstance(value, list) and len(value) > 1 and value_format in (None, 'regex', 'pipe')
+
+def substitute(query, values):
+    """Replace every known variable of a query in one pass; unknown variables are left as they are
+    
+    values maps a variable name to a string or a list of values. An = or !=
+    matcher in front of a multi-value (or match-all) variable becomes =~ or !~,
+    and values behind =~ or !~ are regex-escaped.
+    """
+    
+    def replace(match):
+        name = match.group('braced') or match.group('old') or match.group('plain')
+        if name not in values:
+            return match.group(0)
+        
+        value = values[name]
+        value_format = match.group('format')
+        op = match.group('op')
+        if not op:
+            return format_values(value, value_format)
+        
+        if is_regex_value(value, value_format):
+            op = {'=': '=~', '!=': '!~'}.get(op, op)
+        return f'{op}"{format_values(value, value_format, op in ("=~", "!~"))}'
+    
+    return VARIABLE_PATTERN.sub(replace, query)
+
+def get_variable_names(query, matchers_only=False):
+    """Names of the variables referenced by a query, in order of first use
+    
+    With matchers_only, only variables used as a label matcher value
+    (label="$var", label=~"$var", ...) are returned.
+    """
+    names = []
+    for match in VARIABLE_PATTERN.finditer(query):
+        name = match.group('braced') or match.group('old') or match.group('plain')
+        if name not in names and (match.group('op') or not matchers_only):
+            names.append(name)
+    return names
+
+def filter_values(values, regex):
+    """Apply a variable's regex option: keep matching values, or the first capture group"""
+    if not regex:
+        return values
+    
+    # Grafana stores the regex as /pattern/
+    if regex.startswith('/') and regex.rfind('/') > 0:
+        regex = regex[1:regex.rfind('/')]
+    try:
+        pattern = re.compile(regex)
+    except re.error:
+        return values
+    
+    filtered = []
+    for value in values:
+        match = pattern.search(value)
+        if not match:
+            continue
+        value = match.group(1) if pattern.groups and match.group(1) is not None else value
+        if value not in filtered:
+            filtered.append(value)
+    return filtered
+
+class TemplateVariables:
+    """Resolves the template variables of dashboard queries for one collection run
+    
+    mode 'wildcard' substitutes the fixed WILDCARD_VALUES and never asks
+    Prometheus. 'aggregate' and 'fanout' discover each variable's values
+    (label_values() queries through backend.label_values, custom and
+    constant values from the dashboard); 'aggregate' keeps one query
+    matching all of them, 'fanout' emits one query per value combination,
+    up to max_fanout. Variables with more than max_values values, or whose
+    values cannot be found, match everything instead. Label value lookups
+    are shared between dashboards.
+    """
+    
+    def __init__(self, time_range, mode='wildcard', backend=None, max_values=DEFAULT_MAX_VALUES, max_fanout=DEFAULT_MAX_FANOUT):
+        self.time_range = time_range
+        self.mode = mode
+        self.backend = backend
+        self.max_values = max_values
+        self.max_fanout = max_fanout
+        self.builtins = get_builtin_variables(time_range)
+        self._lookups = {}
+        self.stats = {"mode": mode, "lookups": 0, "discovered": 0, "match_all": 0, "fanned_out": 0}
+    
+    def lookup(self, label, match=None):
+        """Return the values of a label, or None when they cannot be looked up"""
+        key = (label, match)
+        if key not in self._lookups:
+            self.stats["lookups"] += 1
+            self._lookups[key] = self.backend.label_values(label, match, self.time_range) if self.backend else None
+        return self._lookups[key]
+    
+    def discover(self, variable, values):
+        """Return the value of one dashboard variable: a list of values, a string, or None to leave it alone
+        
+        values holds the variables resolved so far, which are substituted
+        into the selector of chained label_values() queries.
+        """
+        kind = variable.get('type')
+        query = variable.get('query', '')
+        match_all = MatchAll(variable.get('all_value') or '.*')
+        
+        if kind in ('constant', 'textbox'):
+            return str(variable.get('current') or query)
+        if kind == 'interval':
+            current = str(variable.get('current') or '')
+            return current if current and not current.startswith(('$', 'auto')) else self.builtins['__interval']
+        
+        if kind == 'custom':
+            found = [item.strip() for item in query.split(',') if item.strip()]
+        elif kind == 'query':
+            parsed = LABEL_VALUES_PATTERN.match(query)
+            if not parsed:
+                print(f"   ⚠️  ${variable['name']}: unsupported variable query {query[:60]}, matching all values")
+                self.stats["match_all"] += 1
+                return match_all
+            selector = parsed.group('match')
+            found = self.lookup(parsed.group('label'), substitute(selector, values) if selector else None)
+        else:
+            # Datasource and ad hoc variables do not appear in expressions
+            return None
+        
+        found = filter_values(found or [], variable.get('regex'))
+        if not found or len(found) > self.max_values:
+            if found:
+                print(f"   ⚠️  ${variable['name']}: {len(found)} values exceed TEMPLATE_MAX_VALUES, matching all values")
+            self.stats["match_all"] += 1
+            return match_all
+        
+        self.stats["discovered"] += 1
+        return found
+    
+    def resolve_dashboard(self, variables):
+        """Return {name: value} for the built-ins and a dashboard's template variables"""
+        values = dict(self.builtins)
+        
+        if self.mode == 'wildcard':
+            values.update(WILDCARD_VALUES)
+            return values
+        
+        for variable in variables:
+            name = variable.get('name')
+            if not name or name in values:
+                continue
+            value = self.discover(variable, values)
+            if value is not None:
+                values[name] = value
+        
+        return values
+    
+    def expand(self, query, values):
+        """Return [(resolved_query, {variable: value})] for one panel query
+        
+        values comes from resolve_dashboard. There is one entry, with no
+        variables, except in fanout mode, where every combination of the
+        multi-value variables the query uses gets its own entry. Variables
+        the dashboard does not define are looked up as labels of the same
+        name when they are used as a label matcher value; other unknown
+        references are left untouched, as in wildcard mode.
+        """
+        
+        if self.mode == 'wildcard':
+            resolved_query = substitute(query, values)
+            # Drop the empty cluster filter left by WILDCARD_VALUES
+            return [(resolved_query.replace('cluster=~""', 'cluster=~".*"'), {})]
+        
+        for name in get_variable_names(query, matchers_only=True):
+            if name not in values:
+                values[name] = self.discover({'name': name, 'type': 'query', 'query': f"label_values({name})"}, values)
+        
+        if self.mode == 'fanout':
+            names = [name for name in get_variable_names(query) if name in values]
+            fanned = [name for name in names if isinstance(values[name], list) and len(values[name]) > 1]
+            combinations = 1
+            for name in fanned:
+                combinations *= len(values[name])
+            
+            if fanned and combinations <= self.max_fanout:
+                self.stats["fanned_out"] += 1
+                expanded = []
+                for combination in itertools.product(*(values[name] for name in fanned)):
+                    selected = dict(zip(fanned, combination))
+                    expanded.append((substitute(query, {**values, **{name: [value] for name, value in selected.items()}}), selected))
+                return expanded
+            
+            if fanned:
+                print(f"   ⚠️  {combinations} variable combinations exceed TEMPLATE_MAX_FANOUT, aggregating: {query[:60]}")
+        
+        return [(substitute(query, values), {})]
+
+def get_template_variables(mode, time_range, backend=None):
+    """Create the template variable engine for a run (limits from TEMPLATE_MAX_VALUES and TEMPLATE_MAX_FANOUT)"""
+    return TemplateVariables(
+        time_range, mode, backend,
+        int(os.getenv('TEMPLATE_MAX_VALUES', str(DEFAULT_MAX_VALUES))),
+        int(os.getenv('TEMPLATE_MAX_FANOUT', str(DEFAULT_MAX_FANOUT)))
+    )
@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+"""
+Metrics Storage Formats
+Columnar (.npz) storage for collected metric series and common loaders for the report generators
+"""
+
+import os
+import json
+import numpy as np
+
+COLUMNAR_EXTENSION = '.npz'
+
+# Files at least this large are streamed one metric at a time
+DEFAULT_STREAM_THRESHOLD_MB = 64
+
+def format_sample_value(value):
+    """Format a float the way the Prometheus API encodes sample values"""
+    if np.isnan(value):
+        return 'NaN'
+    if np.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(value)
+
+def save_columnar(metrics_data, filename):
+    """Save metrics as compressed columns instead of indent-2 JSON
+    
+    All series of all metrics are concatenated into one int64 timestamp
+    column (milliseconds) and one float64 value column; 'offsets' marks
+    where each series starts. Labels are kept once per series in a label
+    dictionary inside the JSON 'meta' header. Results that are not
+    Prometheus matrix/vector data are stored verbatim in the header.
+    """
+    
+    header = {key: value for key, value in metrics_data.items() if key != 'metrics'}
+    metrics_index = []
+    label_dictionary = []
+    label_ids = {}
+    series_labels = []
+    series_kinds = []
+    offsets = [0]
+    timestamp_chunks = []
+    value_chunks = []
+    
+    for metric_name, metric_data in metrics_data.get('metrics', {}).items():
+        if metric_data is None:
+            metrics_index.append({"name": metric_name, "null": True})
+            continue
+        
+        result_type = metric_data.get('resultType')
+        if result_type not in ('matrix', 'vector'):
+            metrics_index.append({"name": metric_name, "raw": metric_data})
+            continue
+        
+        first_series = len(series_labels)
+        for result in metric_data.get('result', []):
+            if 'values' in result:
+                points = result['values']
+                series_kinds.append('values')
+            else:
+                points = [result['value']] if 'value' in result else []
+                series_kinds.append('value')
+            
+            labels = json.dumps(result.get('metric', {}), sort_keys=True)
+            if labels not in label_ids:
+                label_ids[labels] = len(label_dictionary)
+                label_dictionary.append(result.get('metric', {}))
+            series_labels.append(label_ids[labels])
+            
+            timestamp_chunks.append(np.fromiter(
+                (round(float(point[0]) * 1000) for point in points), dtype=np.int64, count=len(points)
+            ))
+            value_chunks.append(np.fromiter(
+                (float(point[1]) for point in points), dtype=np.float64, count=len(points)
+            ))
+            offsets.append(offsets[-1] + len(points))
+        
+        entry = {
+            "name": metric_name,
+            "resultType": result_type,
+            "series": [first_series, len(series_labels)]
+        }
+        # Server-side summaries and truncation records are small, so they stay in the header
+        for key in ('aggregates', 'truncated'):
+            if key in metric_data:
+                entry[key] = metric_data[key]
+        metrics_index.append(entry)
+    
+    meta = {
+        "format": 1,
+        "header": header,
+        "metrics": metrics_index,
+        "labels": label_dictionary,
+        "series_labels": series_labels,
+        "series_kinds": series_kinds
+    }
+    
+    np.savez_compressed(
+        filename,
+        meta=np.array(json.dumps(meta)),
+        timestamps=np.concatenate(timestamp_chunks) if timestamp_chunks else np.empty(0, dtype=np.int64),
+        values=np.concatenate(value_chunks) if value_chunks else np.empty(0, dtype=np.float64),
+        offsets=np.array(offsets, dtype=np.int64)
+    )
+    
+    return filename
+
+def load_columnar_arrays(filename):
+    """Load a columnar metrics file as (header, {metric: [(labels, timestamps, values)] or None})
+    
+    Timestamps are float64 seconds and values float64 arrays, ready for
+    vectorized processing without any string parsing.
+    """
+    
+    with np.load(filename, allow_pickle=False) as data:
+        meta = json.loads(str(data['meta']))
+        timestamps = data['timestamps'] / 1000.0
+        values = data['values']
+        offsets = data['offsets']
+    
+    labels = meta['labels']
+    series_labels = meta['series_labels']
+    metrics = {}
+    
+    for entry in meta['metrics']:
+        if entry.get('null') or 'raw' in entry:
+            metrics[entry['name']] = None
+            continue
+        
+        first, last = entry['series']
+        metrics[entry['name']] = [
+            (
+                labels[series_labels[index]],
+                timestamps[offsets[index]:offsets[index + 1]],
+                values[offsets[index]:offsets[index + 1]]
+            )
+            for index in range(first, last)
+        ]
+    
+    return meta['header'], metrics
+
+def _read_columnar(filename, string_values=False):
+    """Read a columnar file, returning its header and a generator of (name, metric_data)"""
+    
+    with np.load(filename, allow_pickle=False) as data:
+        meta = json.loads(str(data['meta']))
+        timestamps = data['timestamps']
+        values = data['values']
+        offsets = data['offsets'].tolist()
+    
+    def iter_metrics():
+        for entry in meta['metrics']:
+            if entry.get('null'):
+                yield entry['name'], None
+                continue
+            if 'raw' in entry:
+                yield entry['name'], entry['raw']
+                continue
+            
+            first, last = entry['series']
+            results = []
+            for index in range(first, last):
+                series_timestamps = timestamps[offsets[index]:offsets[index + 1]].tolist()
+                series_values = values[offsets[index]:offsets[index + 1]].tolist()
+                
+                # Whole-second timestamps keep the integer form Prometheus returned
+                series_timestamps = [ts // 1000 if ts % 1000 == 0 else ts / 1000.0 for ts in series_timestamps]
+                if string_values:
+                    series_values = [format_sample_value(value) for value in series_values]
+                
+                points = [[ts, value] for ts, value in zip(series_timestamps, series_values)]
+                result = {'metric': meta['labels'][meta['series_labels'][index]]}
+                if meta['series_kinds'][index] == 'value':
+                    if points:
+                        result['value'] = points[0]
+                else:
+                    result['values'] = points
+                results.append(result)
+            
+            metric_data = {'resultType': entry['resultType'], 'result': results}
+            for key in ('aggregates', 'truncated'):
+                if key in entry:
+                    metric_data[key] = entry[key]
+            yield entry['name'], metric_data
+    
+    return dict(meta['header']), iter_metrics()
+
+def load_columnar(filename, string_values=False):
+    """Load a columnar metrics file back into the collector's JSON document layout
+    
+    Values come back as floats, which the report generators convert with
+    float() either way; string_values=True restores Prometheus-style strings
+    for merging with freshly queried data.
+    """
+    
+    metrics_data, metric_items = _read_columnar(filename, string_values)
+    metrics_data['metrics'] = dict(metric_items)
+    return metrics_data
+
+class _JsonStream:
+    """Minimal incremental reader for a JSON document made of nested objects
+    
+    Values are decoded with json's raw_decode on a sliding buffer that is
+    refilled from the file whenever a value is incomplete, so only the value
+    currently being decoded has to fit in memory.
+    """
+    
+    WHITESPACE = ' \t\n\r'
+    
+    def __init__(self, f, chunk_size=1 << 20):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+    
+    def _fill(self, size=None):
+        chunk = self.f.read(size or self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        # Drop the consumed prefix before growing the buffer
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+    
+    def peek(self):
+        """Return the next non-whitespace character without consuming it ('' at EOF)"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in self.WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer) or not self._fill():
+                return self.buffer[self.pos] if self.pos < len(self.buffer) else ''
+    
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Expected '{char}' at offset {self.pos}, found '{self.peek()}'")
+        self.pos += 1
+    
+    def read_value(self):
+        """Decode the next complete JSON value"""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                value, end = None, None
+            
+            # A number or literal ending exactly at the buffer edge may be truncated
+            if end is not None and (end < len(self.buffer) or self.eof):
+                self.pos = end
+                return value
+            
+            # Grow geometrically so a large value is not re-decoded many times
+            if not self._fill(max(self.chunk_size, len(self.buffer) - self.pos)):
+                if end is not None:
+                    self.pos = end
+                    return value
+                raise ValueError(f"Truncated JSON value at offset {self.pos}")
+    
+    def iter_object(self):
+        """Yield (key, stream) for each member of the object at the cursor
+        
+        The caller must consume the member value (read_value or a nested
+        iter_object) before advancing the iterator.
+        """
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        
+        while True:
+            key = self.read_value()
+            self.expect(':')
+            yield key, self
+            
+            if self.peek() == ',':
+                self.pos += 1
+                continue
+            self.expect('}')
+            return
+
+def _stream_json_metrics(filename):
+    """Stream a metrics JSON document, returning (header, generator of (name, metric_data))
+    
+    Top-level fields before "metrics" are in the header when this returns;
+    fields after it are added to the same dict once the generator finishes.
+    """
+    
+    f = open(filename, 'r')
+    stream = _JsonStream(f)
+    members = stream.iter_object()
+    header = {}
+    
+    for key, _ in members:
+        if key == 'metrics':
+            break
+        header[key] = stream.read_value()
+    else:
+        f.close()
+        return header, iter(())
+    
+    def iter_metrics():
+        try:
+            if stream.peek() == 'n':
+                stream.read_value()
+            else:
+                for metric_name, _ in stream.iter_object():
+                    yield metric_name, stream.read_value()
+            
+            for key, _ in members:
+                header[key] = stream.read_value()
+        finally:
+            f.close()
+    
+    return header, iter_metrics()
+
+def get_stream_threshold():
+    """File size in bytes from which metrics files are streamed (METRICS_STREAM_THRESHOLD_MB)"""
+    threshold_mb = float(os.getenv('METRICS_STREAM_THRESHOLD_MB', str(DEFAULT_STREAM_THRESHOLD_MB)))
+    return int(threshold_mb * 1024 * 1024)
+
+def iter_metrics(filename, stream=None):
+    """Open a metrics file as (header, iterator of (metric_name, metric_data))
+    
+    Large JSON files (or any file when stream=True) are parsed incrementally
+    so only one metric is materialized at a time; smaller files are loaded
+    with json.load, which is faster. Columnar files yield metrics one by one
+    from their decompressed columns.
+    """
+    
+    if os.path.splitext(str(filename))[1] == COLUMNAR_EXTENSION:
+        return _read_columnar(filename)
+    
+    if stream is None:
+        stream = os.path.getsize(filename) >= get_stream_threshold()
+    
+    if stream:
+        return _stream_json_metrics(filename)
+    
+    with open(filename, 'r') as f:
+        data = json.load(f)
+    metrics = data.pop('metrics', {}) or {}
+    return data, iter(metrics.items())
+
+def load_metrics(filename, string_values=False):
+    """Load a metrics file in either JSON or columnar format"""
+    if os.path.splitext(str(filename))[1] == COLUMNAR_EXTENSION:
+        return load_columnar(filename, string_values)
+    
+    with open(filename, 'r') as f:
+        return json.load(f)
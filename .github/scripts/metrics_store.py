@@ -0,0 +1,469 @@
+#!/usr/bin/env python3
+"""
+Metrics Store
+Append-only SQLite time-series store for collected metrics, with hourly compaction of older samples
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import tempfile
+from contextlib import redirect_stdout
+from datetime import datetime
+import pytz
+
+from metrics_io import format_sample_value, iter_metrics
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS series (
+    id INTEGER PRIMARY KEY,
+    source TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    labels TEXT NOT NULL,
+    UNIQUE (source, metric, labels)
+);
+CREATE INDEX IF NOT EXISTS series_metric ON series (metric, source);
+CREATE TABLE IF NOT EXISTS samples (
+    series_id INTEGER NOT NULL,
+    ts INTEGER NOT NULL,
+    value REAL,
+    PRIMARY KEY (series_id, ts)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS samples_ts ON samples (ts);
+CREATE TABLE IF NOT EXISTS rollups (
+    series_id INTEGER NOT NULL,
+    resolution INTEGER NOT NULL,
+    ts INTEGER NOT NULL,
+    min REAL,
+    max REAL,
+    sum REAL,
+    count INTEGER NOT NULL,
+    last REAL,
+    last_ts INTEGER NOT NULL,
+    PRIMARY KEY (series_id, resolution, ts)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    source TEXT,
+    ingested_at TEXT NOT NULL,
+    collected_at TEXT,
+    time_range TEXT,
+    step INTEGER,
+    samples INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS compactions (
+    id INTEGER PRIMARY KEY,
+    compacted_at TEXT NOT NULL,
+    cutoff INTEGER NOT NULL,
+    resolution INTEGER NOT NULL,
+    folded INTEGER NOT NULL
+);
+"""
+
+# Older raw samples are folded into rollup buckets of this many seconds
+DEFAULT_RAW_DAYS = 7
+DEFAULT_ROLLUP_SECONDS = 3600
+
+# Rollup buckets of newly compacted samples; ingest() keeps samples out of buckets that already exist
+COMPACT_SQL = """
+INSERT INTO rollups (series_id, resolution, ts, min, max, sum, count, last, last_ts)
+SELECT series_id, :resolution, bucket, vmin, vmax, vsum, vcount,
+       (SELECT value FROM samples s WHERE s.series_id = g.series_id AND s.ts = g.last_ts), last_ts
+FROM (
+    SELECT series_id, (ts / :bucket_ms) * :bucket_ms AS bucket, MIN(value) AS vmin, MAX(value) AS vmax,
+           SUM(value) AS vsum, COUNT(value) AS vcount, MAX(ts) AS last_ts
+    FROM samples WHERE ts < :cutoff GROUP BY series_id, bucket
+) g WHERE true
+ON CONFLICT (series_id, resolution, ts) DO UPDATE SET
+    min = MIN(COALESCE(min, excluded.min), COALESCE(excluded.min, min)),
+    max = MAX(COALESCE(max, excluded.max), COALESCE(excluded.max, max)),
+    sum = COALESCE(sum, 0) + COALESCE(excluded.sum, 0),
+    count = count + excluded.count,
+    last = CASE WHEN excluded.last_ts >= last_ts THEN excluded.last ELSE last END,
+    last_ts = MAX(last_ts, excluded.last_ts)
+"""
+
+def to_milliseconds(timestamp):
+    return round(float(timestamp) * 1000)
+
+def from_milliseconds(milliseconds):
+    """Milliseconds to Prometheus API seconds, keeping whole seconds as integers"""
+    return milliseconds // 1000 if milliseconds % 1000 == 0 else milliseconds / 1000.0
+
+class MetricsStore:
+    """SQLite store of every collected sample, keyed by (source, metric, labels) and timestamp
+    
+    source is the dashboard a metric was collected for ("ZITADEL" for the
+    ZITADEL metrics) and metric its key in the metrics document. Samples are
+    upserted, so ingesting overlapping windows (or the same file twice) is
+    harmless. compact() folds samples older than the raw retention into
+    fixed buckets holding min/max/sum/count/last; queries read both. A
+    bucket is closed once written: samples re-ingested into it are dropped,
+    so they are not counted twice.
+    """
+    
+    def __init__(self, path, read_only=False):
+        self.path = path
+        if read_only:
+            self.connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        else:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.connection = sqlite3.connect(path)
+            # Only takes effect on a new database; lets compaction give space back
+            self.connection.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            self.connection.execute("PRAGMA journal_mode = WAL")
+            self.connection.execute("PRAGMA synchronous = NORMAL")
+            self.connection.executescript(SCHEMA)
+        self._series_ids = {}
+    
+    def close(self):
+        self.connection.close()
+    
+    def get_series_id(self, source, metric, labels):
+        """Return the id of a series, creating it on first use"""
+        key = (source, metric, json.dumps(labels, sort_keys=True))
+        if key not in self._series_ids:
+            self.connection.execute("INSERT OR IGNORE INTO series (source, metric, labels) VALUES (?, ?, ?)", key)
+            self._series_ids[key] = self.connection.execute(
+                "SELECT id FROM series WHERE source = ? AND metric = ? AND labels = ?", key
+            ).fetchone()[0]
+        return self._series_ids[key]
+    
+    def get_compaction_horizon(self):
+        """Return (latest compaction cutoff in ms, rollup resolutions used), or (None, []) before the first compaction"""
+        horizon = self.connection.execute("SELECT MAX(cutoff) FROM compactions").fetchone()[0]
+        resolutions = [row[0] for row in self.connection.execute("SELECT DISTINCT resolution FROM compactions")]
+        return horizon, resolutions
+    
+    def drop_compacted(self, series_id, points, horizon, resolutions):
+        """Remove the (ts, value) points that fall into a rollup bucket the series already has"""
+        old = [ts for ts, value in points if ts < horizon]
+        if not old:
+            return points
+        
+        closed = set()
+        for resolution in resolutions:
+            bucket_ms = resolution * 1000
+            closed.update((resolution, ts) for ts, in self.connection.execute(
+                "SELECT ts FROM rollups WHERE series_id = ? AND resolution = ? AND ts BETWEEN ? AND ?",
+                (series_id, resolution, min(old) // bucket_ms * bucket_ms, max(old))
+            ))
+        if not closed:
+            return points
+        
+        return [
+            (ts, value) for ts, value in points
+            if ts >= horizon or not any((resolution, ts // (resolution * 1000) * (resolution * 1000)) in closed
+                                        for resolution in resolutions)
+        ]
+    
+    def ingest(self, metrics_data, metric_items=None, source=None):
+        """Append the samples of a metrics document in one transaction, returning the sample count
+        
+        metric_items may be an iterator of (metric_name, metric_data) from
+        iter_metrics(), so large files are stored one metric at a time.
+        Metrics without a matrix or vector result (failed queries,
+        summaries only) are skipped, and so are samples whose rollup bucket
+        already exists (e.g. a 30d window re-read after compaction).
+        """
+        source = source or metrics_data.get('source') or 'unknown'
+        if metric_items is None:
+            metric_items = metrics_data.get('metrics', {}).items()
+        
+        horizon, resolutions = self.get_compaction_horizon()
+        count = 0
+        with self.connection:
+            for metric_name, metric_data in metric_items:
+                if not metric_data or metric_data.get('resultType') not in ('matrix', 'vector'):
+                    continue
+                
+                for result in metric_data.get('result', []):
+                    points = result.get('values') or ([result['value']] if 'value' in result else [])
+                    if not points:
+                        continue
+                    series_id = self.get_series_id(source, metric_name, result.get('metric', {}))
+                    points = [(to_milliseconds(ts), float(value)) for ts, value in points]
+                    if horizon is not None:
+                        points = self.drop_compacted(series_id, points, horizon, resolutions)
+                    self.connection.executemany(
+                        "INSERT OR REPLACE INTO samples (series_id, ts, value) VALUES (?, ?, ?)",
+                        ((series_id, ts, value) for ts, value in points)
+                    )
+                    count += len(points)
+            
+            self.connection.execute(
+                "INSERT INTO runs (source, ingested_at, collected_at, time_range, step, samples) VALUES (?, ?, ?, ?, ?, ?)",
+                (source, datetime.now(pytz.UTC).isoformat(), metrics_data.get('timestamp'),
+                 metrics_data.get('time_range'), metrics_data.get('step'), count)
+            )
+        
+        return count
+    
+    def find_series(self, metric, source=None, labels=None):
+        """Return {series_id: labels} of a metric, optionally of one source and matching some labels"""
+        sql = "SELECT id, labels FROM series WHERE metric = ?"
+        params = [metric]
+        if source is not None:
+            sql += " AND source = ?"
+            params.append(source)
+        
+        series = {}
+        for series_id, series_labels in self.connection.execute(sql, params):
+            series_labels = json.loads(series_labels)
+            if all(series_labels.get(name) == value for name, value in (labels or {}).items()):
+                series[series_id] = series_labels
+        return series
+    
+    def query(self, metric, start=None, end=None, source=None, labels=None):
+        """Return the metric over [start, end] (unix seconds) as a Prometheus matrix result
+        
+        Compacted ranges contribute one point per rollup bucket: the last
+        value of the bucket at its own timestamp. Raw samples win where
+        both exist. The result has the same shape as a metrics file entry,
+        so report code can read either.
+        """
+        series = self.find_series(metric, source, labels)
+        start_ms = to_milliseconds(start) if start is not None else 0
+        end_ms = to_milliseconds(end) if end is not None else sys.maxsize
+        points = {series_id: {} for series_id in series}
+        
+        for series_id in series:
+            for ts, value in self.connection.execute(
+                "SELECT last_ts, last FROM rollups WHERE series_id = ? AND last_ts BETWEEN ? AND ? ORDER BY last_ts",
+                (series_id, start_ms, end_ms)
+            ):
+                points[series_id][ts] = value
+            for ts, value in self.connection.execute(
+                "SELECT ts, value FROM samples WHERE series_id = ? AND ts BETWEEN ? AND ? ORDER BY ts",
+                (series_id, start_ms, end_ms)
+            ):
+                points[series_id][ts] = value
+        
+        return {
+            'resultType': 'matrix',
+            'result': [
+                {
+                    'metric': series[series_id],
+                    'values': [
+                        [from_milliseconds(ts), format_sample_value(float('nan') if value is None else value)]
+                        for ts, value in sorted(series_points.items())
+                    ]
+                }
+                for series_id, series_points in points.items()
+                if series_points
+            ]
+        }
+    
+    def summarize(self, metric, start=None, end=None, source=None):
+        """Return min, max, avg and sample count of a metric over [start, end] across all series, or None
+        
+        Rollup buckets count with their full min/max/sum/count, so the
+        figures cover compacted ranges exactly; first is a bucket start there.
+        """
+        start_ms = to_milliseconds(start) if start is not None else 0
+        end_ms = to_milliseconds(end) if end is not None else sys.maxsize
+        series_filter = "SELECT id FROM series WHERE metric = :metric" + (" AND source = :source" if source is not None else "")
+        params = {"metric": metric, "source": source, "start": start_ms, "end": end_ms}
+        
+        row = self.connection.execute(f"""
+            SELECT MIN(vmin), MAX(vmax), SUM(vsum), SUM(vcount), MIN(first_ts), MAX(last_ts) FROM (
+                SELECT MIN(value) AS vmin, MAX(value) AS vmax, SUM(value) AS vsum, COUNT(value) AS vcount,
+                       MIN(ts) AS first_ts, MAX(ts) AS last_ts
+                FROM samples WHERE series_id IN ({series_filter}) AND ts BETWEEN :start AND :end
+                UNION ALL
+                SELECT MIN(min), MAX(max), SUM(sum), SUM(count), MIN(ts), MAX(last_ts)
+                FROM rollups WHERE series_id IN ({series_filter}) AND ts BETWEEN :start AND :end
+            )
+        """, params).fetchone()
+        
+        minimum, maximum, total, count, first_ts, last_ts = row
+        if not count:
+            return None
+        return {
+            "min": minimum,
+            "max": maximum,
+            "avg": total / count,
+            "count": count,
+            "first": from_milliseconds(first_ts),
+            "last": from_milliseconds(last_ts)
+        }
+    
+    def compact(self, raw_days=DEFAULT_RAW_DAYS, resolution=DEFAULT_ROLLUP_SECONDS, rollup_days=0, now=None):
+        """Fold raw samples older than raw_days into rollup buckets and drop expired rollups
+        
+        The cutoff is aligned to the bucket size so only whole buckets are
+        folded. rollup_days = 0 keeps rollups forever. Returns the number of
+        raw samples folded and rollup buckets dropped.
+        """
+        now = now or time.time()
+        bucket_ms = resolution * 1000
+        cutoff = int((now - raw_days * 86400) * 1000) // bucket_ms * bucket_ms
+        
+        with self.connection:
+            self.connection.execute(COMPACT_SQL, {"resolution": resolution, "bucket_ms": bucket_ms, "cutoff": cutoff})
+            folded = self.connection.execute("DELETE FROM samples WHERE ts < ?", (cutoff,)).rowcount
+            self.connection.execute(
+                "INSERT INTO compactions (compacted_at, cutoff, resolution, folded) VALUES (?, ?, ?, ?)",
+                (datetime.now(pytz.UTC).isoformat(), cutoff, resolution, folded)
+            )
+            
+            dropped = 0
+            if rollup_days:
+                rollup_cutoff = int((now - rollup_days * 86400) * 1000)
+                dropped = self.connection.execute("DELETE FROM rollups WHERE ts < ?", (rollup_cutoff,)).rowcount
+            
+            if folded or dropped:
+                self.connection.execute("""
+                    DELETE FROM series WHERE id NOT IN (SELECT series_id FROM samples)
+                    AND id NOT IN (SELECT series_id FROM rollups)
+                """)
+                self._series_ids.clear()
+        
+        if folded or dropped:
+            self.connection.execute("PRAGMA incremental_vacuum")
+        return {"folded": folded, "dropped": dropped}
+    
+    def stats(self):
+        """Row counts, time coverage and file size of the store"""
+        count = lambda sql: self.connection.execute(sql).fetchone()[0]
+        first, last = self.connection.execute("SELECT MIN(ts), MAX(ts) FROM samples").fetchone()
+        return {
+            "series": count("SELECT COUNT(*) FROM series"),
+            "metrics": count("SELECT COUNT(DISTINCT metric) FROM series"),
+            "samples": count("SELECT COUNT(*) FROM samples"),
+            "rollups": count("SELECT COUNT(*) FROM rollups"),
+            "runs": count("SELECT COUNT(*) FROM runs"),
+            "first_sample": from_milliseconds(first) if first is not None else None,
+            "last_sample": from_milliseconds(last) if last is not None else None,
+            "bytes": os.path.getsize(self.path)
+        }
+
+def ingest_files(store, paths):
+    """Ingest metrics files (JSON or .npz) one by one, printing a line each; returns the sample total"""
+    total = 0
+    for path in sorted(paths):
+        try:
+            header, metric_items = iter_metrics(path)
+            samples = store.ingest(header, metric_items)
+        except (OSError, ValueError) as e:
+            print(f"  ❌ {path}: {e}")
+            continue
+        total += samples
+        print(f"  ✅ {os.path.basename(path)}: {samples} samples")
+    return total
+
+def describe_store(store):
+    """Sample and rollup counts plus the summary of every (source, metric), for comparing two states of a store"""
+    figures = {name: value for name, value in store.stats().items() if name in ('series', 'samples', 'rollups')}
+    for source, metric in store.connection.execute("SELECT DISTINCT source, metric FROM series ORDER BY source, metric"):
+        summary = store.summarize(metric, source=source)
+        figures[f"{source}/{metric}"] = summary and {name: summary[name] for name in ('count', 'min', 'max', 'avg')}
+    return figures
+
+def check_idempotent(paths, resolution=DEFAULT_ROLLUP_SECONDS):
+    """Ingest and fully compact files twice in a scratch store; returns the differences between the passes
+    
+    Everything up to now is compacted, so the second pass re-reads every
+    sample into closed rollup buckets. An empty result means re-ingesting
+    changed nothing.
+    """
+    with tempfile.TemporaryDirectory(prefix='metrics-store-check-') as directory:
+        store = MetricsStore(os.path.join(directory, 'check.db'))
+        passes = []
+        for _ in range(2):
+            ingest_files(store, paths)
+            store.compact(raw_days=0, resolution=resolution)
+            passes.append(describe_store(store))
+        store.close()
+    
+    first, second = passes
+    return {key: (first.get(key), second.get(key)) for key in first.keys() | second.keys() if first.get(key) != second.get(key)}
+
+def get_store_settings():
+    """Compaction settings from METRICS_STORE_RAW_DAYS, METRICS_STORE_ROLLUP and METRICS_STORE_ROLLUP_DAYS"""
+    return {
+        "raw_days": float(os.getenv('METRICS_STORE_RAW_DAYS', str(DEFAULT_RAW_DAYS))),
+        "resolution": int(os.getenv('METRICS_STORE_ROLLUP', str(DEFAULT_ROLLUP_SECONDS))),
+        "rollup_days": float(os.getenv('METRICS_STORE_ROLLUP_DAYS', '0'))
+    }
+
+def get_metrics_store(read_only=False):
+    """Open the store configured by METRICS_STORE, if enabled"""
+    path = os.getenv('METRICS_STORE')
+    if not path:
+        return None
+    if read_only and not os.path.exists(path):
+        print(f"   ⚠️  Metrics store not found: {path}")
+        return None
+    
+    print(f"   Metrics store: {path}")
+    return MetricsStore(path, read_only)
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest, compact and query the SQLite metrics store")
+    parser.add_argument('--store', default=os.getenv('METRICS_STORE', 'metrics.db'), help="Store path (default: METRICS_STORE or metrics.db)")
+    commands = parser.add_subparsers(dest='command', required=True)
+    
+    ingest = commands.add_parser('ingest', help="Import metrics files (JSON or .npz)")
+    ingest.add_argument('files', nargs='+')
+    
+    compact = commands.add_parser('compact', help="Fold old samples into rollups")
+    settings = get_store_settings()
+    compact.add_argument('--raw-days', type=float, default=settings["raw_days"], help="Days of raw samples to keep")
+    compact.add_argument('--resolution', type=int, default=settings["resolution"], help="Rollup bucket in seconds")
+    compact.add_argument('--rollup-days', type=float, default=settings["rollup_days"], help="Days of rollups to keep (0 = forever)")
+    
+    query = commands.add_parser('query', help="Print a metric as JSON")
+    query.add_argument('metric')
+    query.add_argument('--source', help="Dashboard name, or ZITADEL")
+    query.add_argument('--days', type=float, default=1, help="Days back from now (default: 1)")
+    query.add_argument('--summary', action='store_true', help="Print min/max/avg instead of the series")
+    
+    commands.add_parser('stats', help="Print store statistics")
+    
+    check = commands.add_parser('check', help="Verify that ingesting and compacting files twice changes nothing (uses a scratch store)")
+    check.add_argument('files', nargs='+')
+    check.add_argument('--resolution', type=int, default=settings["resolution"], help="Rollup bucket in seconds")
+    args = parser.parse_args()
+    
+    if args.command == 'check':
+        print(f"🔁 Ingesting and compacting {len(args.files)} files twice")
+        with redirect_stdout(io.StringIO()):
+            differences = check_idempotent(args.files, args.resolution)
+        if differences:
+            print(f"❌ Second pass changed {len(differences)} figures:")
+            for key, (first, second) in sorted(differences.items()):
+                print(f"   {key}: {first} -> {second}")
+            sys.exit(1)
+        print("✅ Ingest and compaction are idempotent")
+        return
+    
+    store = MetricsStore(args.store, read_only=args.command in ('query', 'stats'))
+    
+    if args.command == 'ingest':
+        print(f"📥 Ingesting {len(args.files)} files into {args.store}")
+        total = ingest_files(store, args.files)
+        print(f"   Total: {total} samples")
+    elif args.command == 'compact':
+        result = store.compact(args.raw_days, args.resolution, args.rollup_days)
+        print(f"🗜️  Compacted {args.store}: {result['folded']} samples folded into {args.resolution}s rollups, "
+              f"{result['dropped']} expired rollups dropped")
+    elif args.command == 'query':
+        end = time.time()
+        if args.summary:
+            print(json.dumps(store.summarize(args.metric, end - args.days * 86400, end, args.source), indent=2))
+        else:
+            print(json.dumps(store.query(args.metric, end - args.days * 86400, end, args.source), indent=2))
+    else:
+        print(json.dumps(store.stats(), indent=2))
+    
+    store.close()
+
+if __name__ == "__main__":
+    main()
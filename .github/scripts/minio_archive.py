@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+MinIO Archive
+Streams a directory into one range-readable .tar.gz object with a manifest of per-file offsets
+"""
+
+import io
+import os
+import json
+import time
+import zlib
+import tarfile
+import argparse
+from datetime import datetime
+import pytz
+
+from minio_upload import get_content_type, get_uploader_session
+
+ARCHIVE_COMPRESSION_LEVEL = 6
+ARCHIVE_CHUNK_SIZE = 1024 * 1024
+ARCHIVE_CONTENT_TYPE = "application/gzip"
+
+class ArchiveStream(io.RawIOBase):
+    """Read-only stream of a .tar.gz of `files`, built while it is read
+    
+    Every file (tar header, data and padding) is compressed as its own gzip
+    member, and the end-of-archive blocks as a last one. Concatenated gzip
+    members are a valid gzip stream, so the object is an ordinary tarball,
+    and any one file can be read back with a byte-range request of its
+    member. manifest holds, per file, the member's offset and length in
+    the object and where the data starts inside the decompressed member.
+    Nothing is staged on disk; at most one chunk of compressed data is held.
+    """
+    
+    def __init__(self, files, root):
+        self.files = list(files)
+        self.root = root
+        self.manifest = []
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self._buffer = bytearray()
+        self._members = self._generate()
+    
+    def readable(self):
+        return True
+    
+    def _member(self, path):
+        """Yield the compressed chunks of one file's gzip member"""
+        compressor = zlib.compressobj(ARCHIVE_COMPRESSION_LEVEL, zlib.DEFLATED, 31)
+        stat = os.stat(path)
+        info = tarfile.TarInfo(os.path.relpath(path, self.root))
+        info.size = stat.st_size
+        info.mtime = int(stat.st_mtime)
+        info.mode = 0o644
+        header = info.tobuf(format=tarfile.PAX_FORMAT)
+        
+        yield compressor.compress(header)
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(ARCHIVE_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield compressor.compress(chunk)
+        padding = -stat.st_size % tarfile.BLOCKSIZE
+        yield compressor.compress(b'\0' * padding) + compressor.flush()
+        
+        self.bytes_in += stat.st_size
+        self.manifest.append({
+            "name": info.name,
+            "size": stat.st_size,
+            "content_type": get_content_type(path),
+            "data_offset": len(header)
+        })
+    
+    def _generate(self):
+        for path in self.files:
+            offset = self.bytes_out
+            for chunk in self._member(path):
+                self.bytes_out += len(chunk)
+                yield chunk
+            self.manifest[-1].update({"offset": offset, "length": self.bytes_out - offset})
+        
+        compressor = zlib.compressobj(ARCHIVE_COMPRESSION_LEVEL, zlib.DEFLATED, 31)
+        end = compressor.compress(b'\0' * tarfile.BLOCKSIZE * 2) + compressor.flush()
+        self.bytes_out += len(end)
+        yield end
+    
+    def readinto(self, buffer):
+        while len(self._buffer) < len(buffer):
+            chunk = next(self._members, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        
+        size = min(len(buffer), len(self._buffer))
+        buffer[:size] = self._buffer[:size]
+        del self._buffer[:size]
+        return size
+
+def build_manifest(stream, bucket_name, archive_object):
+    """Manifest document of a fully read ArchiveStream"""
+    return {
+        "archive": archive_object,
+        "bucket": bucket_name,
+        "created": datetime.now(pytz.UTC).isoformat(),
+        "compression": "gzip-members",
+        "files": stream.manifest,
+        "bytes": stream.bytes_in,
+        "compressed_bytes": stream.bytes_out
+    }
+
+def upload_archive(session, bucket_name, files, root, archive_object):
+    """Stream files into archive_object and upload its manifest next to it
+    
+    Returns the manifest. The archive is sent as a multipart upload of
+    unknown length with the session's part size.
+    """
+    session.ensure_bucket(bucket_name)
+    stream = ArchiveStream(sorted(files), root)
+    started = time.perf_counter()
+    session.client.put_object(
+        bucket_name,
+        archive_object,
+        io.BufferedReader(stream, ARCHIVE_CHUNK_SIZE),
+        length=-1,
+        content_type=ARCHIVE_CONTENT_TYPE,
+        part_size=session.settings["part_size"],
+        num_parallel_uploads=session.settings["part_threads"]
+    )
+    manifest = build_manifest(stream, bucket_name, archive_object)
+    manifest["seconds"] = round(time.perf_counter() - started, 3)
+    
+    body = json.dumps(manifest, indent=2).encode()
+    manifest_object = get_manifest_object(archive_object)
+    session.client.put_object(bucket_name, manifest_object, io.BytesIO(body), len(body), content_type="application/json")
+    manifest["manifest_object"] = manifest_object
+    return manifest
+
+def get_manifest_object(archive_object):
+    """Object name of an archive's manifest"""
+    return archive_object.removesuffix('.tar.gz') + '.manifest.json'
+
+def read_archived_file(client, bucket_name, manifest, name):
+    """Fetch one file out of an archive with a single range request"""
+    entry = next((entry for entry in manifest["files"] if entry["name"] == name), None)
+    if entry is None:
+        raise KeyError(f"{name} is not in {manifest['archive']}")
+    
+    response = client.get_object(bucket_name, manifest["archive"], offset=entry["offset"], length=entry["length"])
+    try:
+        member = zlib.decompress(response.read(), 31)
+    finally:
+        response.close()
+        response.release_conn()
+    return member[entry["data_offset"]:entry["data_offset"] + entry["size"]]
+
+def main():
+    parser = argparse.ArgumentParser(description="Read one file out of an archived metrics upload")
+    parser.add_argument('manifest_object', help="Manifest object, e.g. grafana-metrics/2026-02-06/grafana-metrics_20260206_061711.manifest.json")
+    parser.add_argument('name', nargs='?', help="File to extract (omit to list the archive)")
+    parser.add_argument('--bucket', default='pkc', help="Bucket (default: pkc)")
+    parser.add_argument('--output', help="Where to write the file (default: its name in the current directory)")
+    args = parser.parse_args()
+    
+    session = get_uploader_session()
+    response = session.client.get_object(args.bucket, args.manifest_object)
+    try:
+        manifest = json.loads(response.read())
+    finally:
+        response.close()
+        response.release_conn()
+    
+    if not args.name:
+        for entry in manifest["files"]:
+            print(f"{entry['size']:>12}  {entry['name']}")
+        return
+    
+    data = read_archived_file(session.client, args.bucket, manifest, args.name)
+    output = args.output or os.path.basename(args.name)
+    with open(output, 'wb') as f:
+        f.write(data)
+    print(f"💾 {args.name}: {len(data)} bytes -> {output}")
+
+if __name__ == "__main__":
+    main()
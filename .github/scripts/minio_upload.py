@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+MinIO Upload
+Shared MinIO client setup and a parallel, multipart, deduplicating file uploader for the upload scripts
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import certifi
+import urllib3
+from minio import Minio
+from minio.error import S3Error
+from minio.helpers import MIN_PART_SIZE
+
+DEFAULT_WORKERS = 4
+DEFAULT_PART_SIZE_MB = 16
+DEFAULT_PART_THREADS = 3
+
+# Files are hashed in chunks of this size, never read whole
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# User metadata holding the SHA-256 of an uploaded file (x-amz-meta-content-sha256)
+CONTENT_HASH_METADATA = "content-sha256"
+
+CONTENT_TYPES = {
+    '.json': "application/json",
+    '.md': "text/markdown",
+    '.npz': "application/x-npz",
+    '.tex': "application/x-tex",
+    '.pdf': "application/pdf",
+}
+
+def get_content_type(file_path):
+    """Content type from the file extension"""
+    return CONTENT_TYPES.get(os.path.splitext(file_path)[1].lower(), "application/octet-stream")
+
+def get_upload_settings():
+    """MinIO endpoint, credentials and upload tuning from the environment
+    
+    MINIO_UPLOAD_WORKERS files are uploaded at once. Files larger than
+    MINIO_PART_SIZE_MB (at least 5, the S3 minimum) are sent as multipart
+    uploads of that part size, MINIO_PART_THREADS parts at a time.
+    MINIO_SKIP_UNCHANGED skips files whose content hash matches the object
+    already stored; MINIO_UPLOAD_MANIFEST names a local file of the hashes
+    uploaded so far, which saves the stat_object call for known objects.
+    MINIO_SECURE=false talks plain HTTP, e.g. to a local MinIO or fake_s3.py.
+    """
+    part_size_mb = float(os.getenv('MINIO_PART_SIZE_MB', str(DEFAULT_PART_SIZE_MB)))
+    return {
+        "endpoint": os.getenv('MINIO_ENDPOINT', 'minio.pkc.pub'),
+        "access_key": os.getenv('MINIO_ACCESS_KEY'),
+        "secret_key": os.getenv('MINIO_SECRET_KEY'),
+        "secure": os.getenv('MINIO_SECURE', 'true').lower() != 'false',
+        "workers": max(1, int(os.getenv('MINIO_UPLOAD_WORKERS', str(DEFAULT_WORKERS)))),
+        "part_size": max(MIN_PART_SIZE, int(part_size_mb * 1024 * 1024)),
+        "part_threads": max(1, int(os.getenv('MINIO_PART_THREADS', str(DEFAULT_PART_THREADS)))),
+        "skip_unchanged": os.getenv('MINIO_SKIP_UNCHANGED', 'false').lower() == 'true',
+        "manifest": os.getenv('MINIO_UPLOAD_MANIFEST') or None
+    }
+
+def create_minio_client(settings):
+    """MinIO client whose connection pool fits every concurrent part upload
+    
+    Same timeouts and retries as the client's default pool, which only
+    keeps 10 connections per host.
+    """
+    timeout = 300
+    http_client = urllib3.PoolManager(
+        timeout=urllib3.Timeout(connect=timeout, read=timeout),
+        maxsize=max(10, settings["workers"] * settings["part_threads"]),
+        cert_reqs='CERT_REQUIRED',
+        ca_certs=os.environ.get('SSL_CERT_FILE') or certifi.where(),
+        retries=urllib3.Retry(total=5, backoff_factor=0.2, status_forcelist=[500, 502, 503, 504])
+    )
+    return Minio(
+        settings["endpoint"],
+        access_key=settings["access_key"],
+        secret_key=settings["secret_key"],
+        secure=settings["secure"],
+        http_client=http_client
+    )
+
+def hash_file(file_path, part_size):
+    """Stream a file once, returning (SHA-256, ETag S3 gives it when uploaded with part_size)
+    
+    The ETag is the MD5 of the file for a single-part upload, and the MD5
+    of the part MD5s followed by -<parts> for a multipart upload.
+    """
+    sha256 = hashlib.sha256()
+    part_digests = []
+    part_md5 = hashlib.md5()
+    part_bytes = 0
+    
+    with open(file_path, 'rb') as f:
+        while True:
+            chunk = f.read(min(HASH_CHUNK_SIZE, part_size - part_bytes))
+            if not chunk:
+                break
+            sha256.update(chunk)
+            part_md5.update(chunk)
+            part_bytes += len(chunk)
+            if part_bytes == part_size:
+                part_digests.append(part_md5.digest())
+                part_md5 = hashlib.md5()
+                part_bytes = 0
+    
+    if part_bytes or not part_digests:
+        part_digests.append(part_md5.digest())
+    
+    if len(part_digests) == 1:
+        etag = part_digests[0].hex()
+    else:
+        etag = f"{hashlib.md5(b''.join(part_digests)).hexdigest()}-{len(part_digests)}"
+    return sha256.hexdigest(), etag
+
+class UploadManifest:
+    """Local record of the content hash of every object uploaded, keyed on bucket/object
+    
+    It is trusted without asking the server, so it must only be shared by
+    runs writing to the same endpoint.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"⚠️  Ignoring unreadable upload manifest {path}: {e}")
+    
+    def matches(self, bucket_name, object_name, digest):
+        with self._lock:
+            return self.entries.get(f"{bucket_name}/{object_name}", {}).get("sha256") == digest
+    
+    def record(self, bucket_name, object_name, digest, size):
+        with self._lock:
+            self.entries[f"{bucket_name}/{object_name}"] = {"sha256": digest, "size": size}
+    
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._lock, open(self.path, 'w') as f:
+            json.dump(self.entries, f, indent=2, sort_keys=True)
+
+def is_unchanged(client, bucket_name, object_name, digest, etag):
+    """Whether the stored object has this content, by its hash metadata or else its ETag"""
+    try:
+        stat = client.stat_object(bucket_name, object_name)
+    except S3Error as e:
+        if e.code in ('NoSuchKey', 'NoSuchObject', 'ResourceNotFound'):
+            return False
+        raise
+    
+    stored = (stat.metadata or {}).get(f"x-amz-meta-{CONTENT_HASH_METADATA}")
+    if stored:
+        return stored == digest
+    return (stat.etag or '').strip('"') == etag
+
+def upload_file(client, bucket_name, file_path, object_name, settings, manifest=None):
+    """Upload one file, returning its upload record (raises on failure)
+    
+    With settings["skip_unchanged"], a file whose content already sits
+    under object_name is not sent and its record has skipped set.
+    """
+    size = os.path.getsize(file_path)
+    started = time.perf_counter()
+    record = {
+        "filename": os.path.basename(file_path),
+        "object_name": object_name,
+        "size": size,
+        "multipart": size > settings["part_size"],
+        "skipped": False
+    }
+    
+    metadata = None
+    if settings["skip_unchanged"]:
+        digest, etag = hash_file(file_path, settings["part_size"])
+        if (manifest and manifest.matches(bucket_name, object_name, digest)) or \
+                is_unchanged(client, bucket_name, object_name, digest, etag):
+            if manifest:
+                manifest.record(bucket_name, object_name, digest, size)
+            return {**record, "multipart": False, "skipped": True, "seconds": round(time.perf_counter() - started, 3)}
+        metadata = {CONTENT_HASH_METADATA: digest}
+    
+    client.fput_object(
+        bucket_name,
+        object_name,
+        file_path,
+        content_type=get_content_type(file_path),
+        metadata=metadata,
+        part_size=settings["part_size"],
+        num_parallel_uploads=settings["part_threads"]
+    )
+    if manifest and metadata:
+        manifest.record(bucket_name, object_name, metadata[CONTENT_HASH_METADATA], size)
+    return {**record, "seconds": round(time.perf_counter() - started, 3)}
+
+def upload_files(client, bucket_name, uploads, settings, manifest=None):
+    """Upload (file_path, object_name) pairs on a pool of settings["workers"] threads
+    
+    Returns (uploaded, failed): upload records in input order (skipped
+    unchanged files included), and {filename, object_name, error} for
+    every file that failed.
+    """
+    results = {}
+    failed = []
+    
+    with ThreadPoolExecutor(max_workers=settings["workers"]) as executor:
+        futures = {
+            executor.submit(upload_file, client, bucket_name, file_path, object_name, settings, manifest): (index, file_path, object_name)
+            for index, (file_path, object_name) in enumerate(uploads)
+        }
+        for future in as_completed(futures):
+            index, file_path, object_name = futures[future]
+            try:
+                results[index] = future.result()
+                if results[index]["skipped"]:
+                    print(f"  ⏭️  Unchanged: {object_name}")
+                else:
+                    print(f"  ✅ Uploaded: {object_name}" + (" (multipart)" if results[index]["multipart"] else ""))
+            except Exception as e:
+                print(f"  ❌ Failed to upload {file_path}: {e}")
+                failed.append({"filename": os.path.basename(file_path), "object_name": object_name, "error": str(e)})
+    
+    return [results[index] for index in sorted(results)], failed
+
+def summarize_uploads(uploaded, seconds):
+    """Totals and throughput of a batch of upload records; skipped files count as bytes saved"""
+    sent = [record for record in uploaded if not record.get("skipped")]
+    total_bytes = sum(record["size"] for record in sent)
+    return {
+        "objects": len(sent),
+        "bytes": total_bytes,
+        "skipped": len(uploaded) - len(sent),
+        "bytes_saved": sum(record["size"] for record in uploaded if record.get("skipped")),
+        "multipart": len([record for record in sent if record["multipart"]]),
+        "seconds": round(seconds, 3),
+        "mb_per_second": round(total_bytes / 1024 / 1024 / seconds, 2) if seconds else 0.0
+    }
+
+def get_public_read_policy(bucket_name):
+    """Bucket policy allowing anonymous downloads of every object"""
+    return {
+        "Version": "2012-10-17",
+        "Statement": [
+            {
+                "Effect": "Allow",
+                "Principal": {"AWS": "*"},
+                "Action": ["s3:GetObject"],
+                "Resource": [f"arn:aws:s3:::{bucket_name}/*"]
+            }
+        ]
+    }
+
+class UploaderSession:
+    """One MinIO client for a whole run, checking each bucket only once
+    
+    Every upload goes through the same client and connection pool.
+    ensure_bucket() creates a missing bucket (public-read when public_read
+    is set) on first use and remembers the answer for later uploads. The
+    upload manifest, when configured, is saved after every batch.
+    """
+    
+    def __init__(self, settings=None, public_read=False):
+        self.settings = settings or get_upload_settings()
+        self.client = create_minio_client(self.settings)
+        self.public_read = public_read
+        self.manifest = UploadManifest(self.settings["manifest"]) if self.settings["skip_unchanged"] and self.settings["manifest"] else None
+        self.stats = {"bucket_checks": 0, "uploads": 0, "skipped": 0, "bytes_saved": 0, "failed": 0}
+        self._buckets = set()
+    
+    def ensure_bucket(self, bucket_name):
+        """Create the bucket if it doesn't exist (once per session)"""
+        if bucket_name in self._buckets:
+            return
+        self._buckets.add(bucket_name)
+        self.stats["bucket_checks"] += 1
+        
+        try:
+            if self.client.bucket_exists(bucket_name):
+                print(f"✅ Bucket exists: {bucket_name}")
+                return
+            self.client.make_bucket(bucket_name)
+            if self.public_read:
+                self.client.set_bucket_policy(bucket_name, json.dumps(get_public_read_policy(bucket_name)))
+            print(f"✅ Created bucket: {bucket_name}" + (" (public read)" if self.public_read else ""))
+        except S3Error as e:
+            print(f"⚠️  Bucket check error: {e}")
+            print(f"   Will try upload anyway")
+    
+    def upload_files(self, bucket_name, uploads):
+        """Upload (file_path, object_name) pairs in parallel; returns (uploaded, failed) as upload_files()"""
+        self.ensure_bucket(bucket_name)
+        uploaded, failed = upload_files(self.client, bucket_name, uploads, self.settings, self.manifest)
+        skipped = [record for record in uploaded if record["skipped"]]
+        self.stats["uploads"] += len(uploaded) - len(skipped)
+        self.stats["skipped"] += len(skipped)
+        self.stats["bytes_saved"] += sum(record["size"] for record in skipped)
+        self.stats["failed"] += len(failed)
+        if self.manifest:
+            self.manifest.save()
+        return uploaded, failed
+    
+    def get_url(self, bucket_name, object_name):
+        """Console URL of an uploaded object"""
+        return f"https://{self.settings['endpoint']}/browser/{bucket_name}/{object_name}"
+
+def get_uploader_session(settings=None, public_read=False):
+    """Open an uploader session (environment settings by default), exiting when credentials are missing"""
+    settings = settings or get_upload_settings()
+    if not settings["access_key"] or not settings["secret_key"]:
+        print("❌ MinIO credentials not set")
+        sys.exit(1)
+    
+    print(f"🔌 Connecting to MinIO endpoint: {settings['endpoint']}")
+    try:
+        session = UploaderSession(settings, public_read)
+        print(f"✅ Connected to MinIO: {settings['endpoint']}")
+        return session
+    except Exception as e:
+        print(f"❌ Failed to connect to MinIO: {e}")
+        sys.exit(1)
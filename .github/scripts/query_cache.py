@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Query Result Cache
+Content-addressed on-disk cache of Prometheus query results for the Grafana collectors
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+
+def align_window(start, end, step):
+    """Align start/end (unix seconds) down to step boundaries so reruns share cache keys"""
+    step = max(1, int(step))
+    return int(start) - int(start) % step, int(end) - int(end) % step
+
+class QueryCache:
+    """On-disk query cache with TTL expiry and size-bounded LRU eviction
+    
+    Entries are JSON files named by the SHA-256 of the query key. The file
+    mtime is bumped on every hit, so the oldest mtime is the least recently
+    used entry when the cache grows past max_bytes.
+    """
+    
+    def __init__(self, cache_dir, ttl=3600, max_bytes=256 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "stores": 0, "evictions": 0}
+        self._lock = threading.Lock()
+        
+        os.makedirs(cache_dir, exist_ok=True)
+        self._total_bytes = sum(size for _, _, size in self._entries())
+    
+    @staticmethod
+    def make_key(datasource, expr, start, end, step):
+        """Build the content-addressed key for a query"""
+        raw = json.dumps([str(datasource), expr, int(start), int(end), str(step)])
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+    
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+    
+    def _entries(self):
+        """Yield (path, mtime, size) for every cache entry"""
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith('.json'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_mtime, stat.st_size
+    
+    def _count(self, stat_name):
+        with self._lock:
+            self.stats[stat_name] += 1
+    
+    def get(self, key):
+        """Return the cached result for key, or None on a miss"""
+        path = self._path(key)
+        
+        try:
+            with open(path, 'r') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self._count("misses")
+            return None
+        
+        if time.time() - entry.get('stored_at', 0) > self.ttl:
+            self._count("expired")
+            self._count("misses")
+            self._remove(path)
+            return None
+        
+        # Mark as recently used for LRU eviction
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        
+        self._count("hits")
+        return entry.get('result')
+    
+    def put(self, key, result):
+        """Store a query result under key"""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        
+        data = json.dumps({"stored_at": time.time(), "result": result})
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        
+        try:
+            old_size = os.path.getsize(path) if os.path.exists(path) else 0
+            with open(tmp_path, 'w') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"  ⚠️  Failed to write cache entry: {e}")
+            return
+        
+        with self._lock:
+            self.stats["stores"] += 1
+            self._total_bytes += len(data) - old_size
+            over_budget = self._total_bytes > self.max_bytes
+        
+        if over_budget:
+            self.evict()
+    
+    def _remove(self, path):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return False
+        
+        with self._lock:
+            self._total_bytes -= size
+        return True
+    
+    def evict(self):
+        """Drop least recently used entries until the cache fits in max_bytes"""
+        for path, _, _ in sorted(self._entries(), key=lambda entry: entry[1]):
+            if self._total_bytes <= self.max_bytes:
+                break
+            if self._remove(path):
+                self._count("evictions")
+    
+    def summary(self):
+        """Return counters and size for the collection summary"""
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+                "size_bytes": self._total_bytes,
+                "directory": self.cache_dir
+            }
+
+def get_query_cache():
+    """Create the query cache configured by environment variables, if enabled"""
+    cache_dir = os.getenv('QUERY_CACHE_DIR')
+    if not cache_dir:
+        return None
+    
+    ttl = int(os.getenv('QUERY_CACHE_TTL', '3600'))
+    max_bytes = int(float(os.getenv('QUERY_CACHE_MAX_MB', '256')) * 1024 * 1024)
+    
+    print(f"   Query cache: {cache_dir} (ttl {ttl}s, max {max_bytes // (1024 * 1024)} MB)")
+    return QueryCache(cache_dir, ttl=ttl, max_bytes=max_bytes)
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Query Trace
+Per-query timing and payload instrumentation for the collectors, written as JSONL
+"""
+
+import os
+import json
+import threading
+from datetime import datetime
+import pytz
+
+from transport import get_response_stats
+
+# Queries listed under "slowest" in the summary
+SLOWEST_QUERIES = 10
+
+def count_points(result):
+    """Return (series, points) in a Prometheus query response"""
+    samples = (result or {}).get('data', {}).get('result', [])
+    if not isinstance(samples, list):
+        return 0, 0
+    
+    points = 0
+    for sample in samples:
+        if isinstance(sample, dict):
+            points += len(sample.get('values', [])) or int('value' in sample)
+    return len(samples), points
+
+def percentile_ms(seconds, p):
+    """Nearest-rank percentile of a list of durations, in milliseconds"""
+    if not seconds:
+        return 0.0
+    ordered = sorted(seconds)
+    return round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] * 1000, 1)
+
+class QueryTrace:
+    """Collects one record per query and optionally streams them to a JSONL file
+    
+    Each record has the query label (e.g. plan expression id), expression,
+    window, wall time, bytes received, series/point counts, HTTP status,
+    retries and whether it was served from the cache.
+    """
+    
+    def __init__(self, path=None):
+        self.path = path
+        self.records = []
+        self._lock = threading.Lock()
+        self._file = None
+        
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._file = open(path, 'w')
+    
+    def record(self, label, query, seconds, response=None, result=None, error=None, cached=False, counts=None, **window):
+        """Record one query; response is the requests.Response when one was received
+        
+        counts overrides the (series, points) taken from a Prometheus result,
+        for responses in other layouts such as Grafana data frames.
+        """
+        size, retries = get_response_stats(response) if response is not None else (0, 0)
+        series, points = counts if counts is not None else count_points(result)
+        
+        if cached:
+            status = 'cached'
+        elif error is not None or not result or result.get('status') != 'success':
+            status = 'error'
+        else:
+            status = 'success'
+        
+        entry = {
+            "time": datetime.now(pytz.UTC).isoformat(),
+            "label": label,
+            "query": query,
+            **window,
+            "seconds": round(seconds, 4),
+            "bytes": size,
+            "series": series,
+            "points": points,
+            "status": status,
+            "http_status": response.status_code if response is not None else None,
+            "retries": retries
+        }
+        if error is not None:
+            entry["error"] = str(error)[:500]
+        
+        with self._lock:
+            self.records.append(entry)
+            if self._file:
+                self._file.write(json.dumps(entry) + '\n')
+    
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+    
+    def summary(self, groups=None):
+        """Aggregate the trace; groups maps a name (e.g. dashboard) to the labels it uses
+        
+        A label prefix before ':' also matches, so aggregate-mode queries
+        such as 'e3:p95' count toward every group using 'e3'. Batched
+        requests carry comma-joined labels ('e3,e4') and count toward every
+        group using any of them.
+        """
+        with self._lock:
+            records = list(self.records)
+        
+        fetched = [r for r in records if r['status'] != 'cached']
+        summary = {
+            "queries": len(records),
+            "errors": sum(1 for r in records if r['status'] == 'error'),
+            "cached": len(records) - len(fetched),
+            "retries": sum(r['retries'] for r in records),
+            "bytes_received": sum(r['bytes'] for r in records),
+            "points": sum(r['points'] for r in records),
+            "total_seconds": round(sum(r['seconds'] for r in fetched), 3),
+            "latency_ms": {
+                "p50": percentile_ms([r['seconds'] for r in fetched], 50),
+                "p95": percentile_ms([r['seconds'] for r in fetched], 95),
+                "max": percentile_ms([r['seconds'] for r in fetched], 100)
+            },
+            "slowest": [
+                {key: r[key] for key in ('label', 'query', 'seconds', 'bytes', 'series', 'points', 'status')}
+                for r in sorted(fetched, key=lambda r: r['seconds'], reverse=True)[:SLOWEST_QUERIES]
+            ]
+        }
+        
+        if groups:
+            summary["dashboards"] = {}
+            for name, labels in groups.items():
+                labels = set(labels)
+                matched = [
+                    r for r in fetched
+                    if r['label'] in labels or any(
+                        part in labels or part.split(':', 1)[0] in labels for part in str(r['label']).split(',')
+                    )
+                ]
+                summary["dashboards"][name] = {
+                    "queries": len(matched),
+                    "p95_ms": percentile_ms([r['seconds'] for r in matched], 95),
+                    "max_ms": percentile_ms([r['seconds'] for r in matched], 100),
+                    "total_seconds": round(sum(r['seconds'] for r in matched), 3),
+                    "bytes_received": sum(r['bytes'] for r in matched),
+                    "points": sum(r['points'] for r in matched)
+                }
+        
+        return summary
+
+def get_query_trace():
+    """Create the query trace, streaming to QUERY_TRACE_FILE when set"""
+    path = os.getenv('QUERY_TRACE_FILE')
+    if path:
+        print(f"   Query trace: {path}")
+    return QueryTrace(path)
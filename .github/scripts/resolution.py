@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Query Resolution Planner
+Chooses the query step for a time window from a point budget
+"""
+
+import os
+import math
+from datetime import timedelta
+
+# Candidate steps in seconds, matching the intervals Grafana offers
+STEP_LADDER = (15, 30, 60, 120, 300, 600, 900, 1800, 3600, 7200, 10800, 21600, 43200, 86400)
+
+# Samples per series per query when QUERY_MAX_POINTS is not set
+DEFAULT_MAX_POINTS = 300
+
+# Smallest step when QUERY_MIN_STEP is not set; the collectors' old fixed 1 hour resolution
+DEFAULT_MIN_STEP = 3600
+
+def parse_time_range(time_range):
+    """Convert a time range like '6h' or '7d' to a timedelta (defaults to 24h)"""
+    if time_range.endswith('h'):
+        return timedelta(hours=int(time_range[:-1]))
+    elif time_range.endswith('d'):
+        return timedelta(days=int(time_range[:-1]))
+    return timedelta(hours=24)
+
+def choose_step(window_seconds, max_points=DEFAULT_MAX_POINTS, min_step=STEP_LADDER[0]):
+    """Return the smallest ladder step that keeps a window within max_points samples
+    
+    Windows longer than the ladder allows fall back to whole days.
+    """
+    needed = max(min_step, window_seconds / max(1, max_points))
+    
+    for step in STEP_LADDER:
+        if step >= needed:
+            return step
+    
+    return int(math.ceil(needed / 86400)) * 86400
+
+def get_max_points():
+    """Point budget per series configured by QUERY_MAX_POINTS"""
+    return int(os.getenv('QUERY_MAX_POINTS', str(DEFAULT_MAX_POINTS)))
+
+def get_step(window_seconds):
+    """Step in seconds for a window, honouring QUERY_STEP, QUERY_MAX_POINTS and QUERY_MIN_STEP
+    
+    QUERY_STEP pins a fixed step (seconds) and disables the planner. Steps
+    below an hour are opt-in through QUERY_MIN_STEP.
+    """
+    fixed_step = os.getenv('QUERY_STEP')
+    if fixed_step:
+        return max(1, int(fixed_step))
+    
+    min_step = int(os.getenv('QUERY_MIN_STEP', str(DEFAULT_MIN_STEP)))
+    return choose_step(window_seconds, get_max_points(), min_step)
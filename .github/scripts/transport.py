@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+HTTP Transport
+Pooled, retrying Grafana sessions for the collectors, with latency tracking and optional HTTP/2
+"""
+
+import os
+import time
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.util.retry import Retry
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+# Responses worth retrying: rate limiting and transient server errors
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Grafana's /api/ds/query is a read-only POST, so it is safe to retry
+RETRY_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS', 'POST'])
+
+class TransportStats:
+    """Thread-safe counters and latencies of every HTTP request a session sends"""
+    
+    def __init__(self):
+        self.latencies = []
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.bytes_received = 0
+        self.status_codes = {}
+        self._lock = threading.Lock()
+    
+    def record(self, seconds, status=None, retries=0, size=0):
+        with self._lock:
+            self.requests += 1
+            self.latencies.append(seconds)
+            self.retries += retries
+            self.bytes_received += size
+            if status is None:
+                self.errors += 1
+            else:
+                self.status_codes[str(status)] = self.status_codes.get(str(status), 0) + 1
+    
+    def summary(self):
+        """Return counters and latency percentiles (ms) for the collection summary"""
+        with self._lock:
+            latencies = sorted(self.latencies)
+            summary = {
+                "requests": self.requests,
+                "errors": self.errors,
+                "retries": self.retries,
+                "bytes_received": self.bytes_received,
+                "status_codes": dict(self.status_codes)
+            }
+        
+        def percentile(p):
+            return round(latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))] * 1000, 1)
+        
+        if latencies:
+            summary["latency_ms"] = {
+                "avg": round(sum(latencies) / len(latencies) * 1000, 1),
+                "p50": percentile(50),
+                "p95": percentile(95),
+                "max": round(latencies[-1] * 1000, 1)
+            }
+        return summary
+
+class TransportSession(requests.Session):
+    """requests.Session that records latency, retries and bytes of every response
+    
+    Latency covers the full body download, since send() only returns once a
+    non-streamed body has been read.
+    """
+    
+    def __init__(self, stats=None):
+        super().__init__()
+        self.stats = stats or TransportStats()
+    
+    def send(self, request, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = super().send(request, **kwargs)
+        except requests.exceptions.RequestException:
+            self.stats.record(time.perf_counter() - started)
+            raise
+        
+        size, retries = get_response_stats(response)
+        self.stats.record(time.perf_counter() - started, response.status_code, retries, size)
+        return response
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter that applies a default timeout to requests that set none"""
+    
+    def __init__(self, timeout=None, **kwargs):
+        self.timeout = timeout
+        super().__init__(**kwargs)
+    
+    def send(self, request, timeout=None, **kwargs):
+        return super().send(request, timeout=timeout if timeout is not None else self.timeout, **kwargs)
+
+class HTTP2Adapter(requests.adapters.BaseAdapter):
+    """Transport adapter that sends requests through an httpx HTTP/2 client
+    
+    Responses are converted back to requests.Response objects and httpx
+    errors to requests exceptions, so callers are unchanged. Cookies (e.g.
+    the Grafana login session) are kept by the httpx client.
+    """
+    
+    def __init__(self, pool_size=10, retries=3, backoff=0.5, timeout=None, verify=True):
+        super().__init__()
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.client = httpx.Client(
+            http2=True,
+            verify=verify,
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        )
+    
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        timeout = timeout if timeout is not None else self.timeout
+        
+        for attempt in range(self.retries + 1):
+            try:
+                response = self.client.request(
+                    request.method, request.url, headers=dict(request.headers), content=request.body, timeout=timeout
+                )
+            except httpx.TimeoutException as e:
+                raise requests.exceptions.Timeout(e, request=request)
+            except httpx.HTTPError as e:
+                raise requests.exceptions.ConnectionError(e, request=request)
+            
+            if response.status_code not in RETRY_STATUSES or request.method not in RETRY_METHODS or attempt == self.retries:
+                break
+            time.sleep(get_retry_delay(response.headers.get('Retry-After'), self.backoff, attempt))
+        
+        result = self.build_response(request, response)
+        result.retry_count = attempt
+        return result
+    
+    def build_response(self, request, response):
+        result = requests.Response()
+        result.status_code = response.status_code
+        result.headers = CaseInsensitiveDict(response.headers)
+        result.reason = response.reason_phrase
+        result.url = str(response.url)
+        result.request = request
+        result.connection = self
+        result.elapsed = response.elapsed
+        result.encoding = response.encoding
+        # httpx already decoded gzip; the body is fully read
+        result._content = response.content
+        result._content_consumed = True
+        return result
+    
+    def close(self):
+        self.client.close()
+
+def get_response_stats(response):
+    """Return (bytes received, retries) for a completed response"""
+    # Compressed bytes off the wire when urllib3 can tell, else the body size
+    tell = getattr(response.raw, 'tell', None)
+    size = tell() if callable(tell) else len(response.content or b'')
+    
+    # urllib3 keeps the retry history on the raw response; HTTP2Adapter sets retry_count
+    retry_state = getattr(response.raw, 'retries', None)
+    retries = len(retry_state.history) if retry_state is not None else getattr(response, 'retry_count', 0)
+    
+    return size, retries
+
+def get_retry_delay(retry_after, backoff, attempt):
+    """Seconds to wait before retry number attempt, honouring a numeric Retry-After"""
+    try:
+        return max(0.0, float(retry_after))
+    except (TypeError, ValueError):
+        return backoff * (2 ** attempt)
+
+def get_transport_settings(pool_size=10, verify_variable='GRAFANA_VERIFY_TLS'):
+    """Read HTTP_* and TLS verification settings from the environment
+    
+    verify_variable (GRAFANA_VERIFY_TLS by default) is 'true' (default),
+    'false', or a CA bundle path.
+    """
+    verify = os.getenv(verify_variable, 'true')
+    if verify.lower() in ('1', 'true', 'yes'):
+        verify = True
+    elif verify.lower() in ('0', 'false', 'no'):
+        verify = False
+    
+    return {
+        "pool_size": int(os.getenv('HTTP_POOL_SIZE', str(pool_size))),
+        "retries": int(os.getenv('HTTP_RETRIES', '3')),
+        "backoff": float(os.getenv('HTTP_BACKOFF', '0.5')),
+        "timeout": float(os.getenv('HTTP_TIMEOUT', '60')),
+        "http2": os.getenv('HTTP2', 'false').lower() in ('1', 'true', 'yes'),
+        "verify": verify
+    }
+
+def create_session(pool_size=10, retries=3, backoff=0.5, timeout=60, http2=False, verify=True):
+    """Create a pooled keep-alive session with retry/backoff on 429 and 5xx
+    
+    The pool should be at least as large as the number of concurrent
+    workers so connections are reused instead of reopened. http2=True
+    needs httpx[http2]; without it the session falls back to HTTP/1.1.
+    """
+    
+    session = TransportSession()
+    session.verify = verify
+    session.headers.update({
+        'Accept-Encoding': 'gzip, deflate',
+        'Connection': 'keep-alive'
+    })
+    
+    if http2 and httpx is None:
+        print("   ⚠️  HTTP2 requested but httpx is not installed (pip install 'httpx[http2]'), using HTTP/1.1")
+        http2 = False
+    
+    if http2:
+        adapter = HTTP2Adapter(pool_size, retries, backoff, timeout, verify)
+    else:
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=backoff,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=RETRY_METHODS,
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        adapter = TimeoutHTTPAdapter(
+            timeout=timeout, pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry
+        )
+    
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
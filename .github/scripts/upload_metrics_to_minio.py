@@ -7,137 +7,167 @@ import os
 import sys
 import json
 import glob
+import time
+import argparse
 from datetime import datetime
-from minio import Minio
-from minio.error import S3Error
 import pytz
 
-def get_minio_client():
-    """Initialize MinIO client"""
-    endpoint = os.getenv('MINIO_ENDPOINT', 'minio.pkc.pub')
-    access_key = os.getenv('MINIO_ACCESS_KEY')
-    secret_key = os.getenv('MINIO_SECRET_KEY')
-    
-    if not access_key or not secret_key:
-        print("❌ MinIO credentials not set")
-        sys.exit(1)
+from minio_archive import upload_archive
+from minio_upload import get_upload_settings, get_uploader_session, summarize_uploads
+
+def load_failed_uploads(results_file):
+    """Return (prefix, filenames, previous results) of the failed files of an earlier run, or None"""
+    if not os.path.exists(results_file):
+        return None
     
-    print(f"🔌 Connecting to MinIO endpoint: {endpoint}")
+    with open(results_file) as f:
+        previous = json.load(f)
     
-    try:
-        client = Minio(
-            endpoint,
-            access_key=access_key,
-            secret_key=secret_key,
-            secure=True
-        )
-        print(f"✅ Connected to MinIO: {endpoint}")
-        return client
-    except Exception as e:
-        print(f"❌ Failed to connect to MinIO: {e}")
-        sys.exit(1)
+    prefix = previous.get("prefix")
+    if not prefix and previous.get("uploaded_files"):
+        prefix = os.path.dirname(previous["uploaded_files"][0]["object_name"])
+    return prefix, previous.get("failed_files", []), previous
 
-def ensure_bucket_exists(client, bucket_name):
-    """Create bucket if it doesn't exist"""
+def upload_run_archive(session, bucket_name, files, metrics_dir, archive_object):
+    """Upload files as one archive; returns (uploaded, failed, archive summary) like a per-file upload"""
     try:
-        if not client.bucket_exists(bucket_name):
-            client.make_bucket(bucket_name)
-            print(f"✅ Created bucket: {bucket_name}")
-        else:
-            print(f"✅ Bucket exists: {bucket_name}")
-    except S3Error as e:
-        print(f"⚠️  Bucket check error: {e}")
-        print(f"   Will try upload anyway")
-
-def upload_file(client, bucket_name, file_path, object_name):
-    """Upload file to MinIO"""
-    try:
-        # Determine content type based on file extension
-        if file_path.endswith('.json'):
-            content_type = "application/json"
-        elif file_path.endswith('.md'):
-            content_type = "text/markdown"
-        else:
-            content_type = "application/octet-stream"
-        
-        client.fput_object(
-            bucket_name,
-            object_name,
-            file_path,
-            content_type=content_type
-        )
-        print(f"  ✅ Uploaded: {object_name}")
-        return True
-    except S3Error as e:
-        print(f"  ❌ Failed to upload {file_path}: {e}")
-        return False
+        manifest = upload_archive(session, bucket_name, files, metrics_dir, archive_object)
+    except Exception as e:
+        print(f"  ❌ Failed to upload archive {archive_object}: {e}")
+        failed = [{"filename": os.path.basename(f), "object_name": archive_object, "error": str(e)} for f in files]
+        return [], failed, None
+    
+    print(f"  ✅ Uploaded: {archive_object} ({len(manifest['files'])} files)")
+    print(f"  ✅ Uploaded: {manifest['manifest_object']}")
+    uploaded = [
+        {
+            "filename": entry["name"],
+            "object_name": archive_object,
+            "size": entry["size"],
+            "multipart": False,
+            "skipped": False,
+            "offset": entry["offset"],
+            "length": entry["length"]
+        }
+        for entry in manifest["files"]
+    ]
+    archive = {
+        "object_name": archive_object,
+        "manifest_object": manifest["manifest_object"],
+        "files": len(manifest["files"]),
+        "bytes": manifest["bytes"],
+        "compressed_bytes": manifest["compressed_bytes"],
+        "ratio": round(manifest["bytes"] / manifest["compressed_bytes"], 2) if manifest["compressed_bytes"] else None
+    }
+    return uploaded, [], archive
 
 def main():
-    metrics_dir = "grafana-metrics"
+    parser = argparse.ArgumentParser(description="Upload Grafana metrics files to MinIO")
+    parser.add_argument('metrics_dir', nargs='?', default="grafana-metrics", help="Directory with metrics files")
+    parser.add_argument('--workers', type=int, help="Files uploaded in parallel (default: MINIO_UPLOAD_WORKERS or 4)")
+    parser.add_argument('--resume', action='store_true', help="Only retry the files that failed in the last run's upload_results.json")
+    parser.add_argument('--archive', action='store_true', default=os.getenv('MINIO_ARCHIVE', 'false').lower() == 'true',
+                        help="Upload one range-readable .tar.gz plus manifest instead of separate objects (default: MINIO_ARCHIVE)")
+    args = parser.parse_args()
+    
+    metrics_dir = args.metrics_dir
     bucket_name = "pkc"
+    results_file = f"{metrics_dir}/upload_results.json"
     
     print("🚀 Starting upload to MinIO")
     
-    # Initialize MinIO client
-    client = get_minio_client()
-    
-    # Ensure bucket exists
-    ensure_bucket_exists(client, bucket_name)
-    
     # Get current date in WITA timezone (UTC+8) for folder structure
     wita_tz = pytz.timezone('Asia/Makassar')
     now = datetime.now(wita_tz)
-    date_folder = now.strftime('%Y-%m-%d')
+    prefix = f"grafana-metrics/{now.strftime('%Y-%m-%d')}"
+    previous = None
+    
+    if args.resume:
+        failed = load_failed_uploads(results_file)
+        if not failed:
+            print(f"⚠️  No previous results in {results_file}, uploading everything")
+        elif not failed[1]:
+            print(f"✅ Nothing to resume: no failed files in {results_file}")
+            sys.exit(0)
+        else:
+            # Retried files go next to the ones the earlier run uploaded
+            prefix, failed_files, previous = failed
+            prefix = prefix or f"grafana-metrics/{now.strftime('%Y-%m-%d')}"
+            print(f"♻️  Resuming: {len(failed_files)} failed files from {results_file}")
     
-    # Find all JSON and Markdown files in metrics directory
-    json_files = glob.glob(f"{metrics_dir}/*.json")
+    # Find all JSON, columnar and Markdown files in metrics directory
+    json_files = [f for f in glob.glob(f"{metrics_dir}/*.json") if os.path.basename(f) != 'upload_results.json']
+    npz_files = glob.glob(f"{metrics_dir}/*.npz")
     md_files = glob.glob(f"{metrics_dir}/*.md")
-    all_files = json_files + md_files
+    if previous:
+        json_files, npz_files, md_files = (
+            [f for f in files if os.path.basename(f) in failed_files] for files in (json_files, npz_files, md_files)
+        )
+    all_files = json_files + npz_files + md_files
     
     if not all_files:
         print("⚠️  No metrics files found to upload")
         sys.exit(0)
     
-    print(f"\n📤 Uploading {len(all_files)} files ({len(json_files)} JSON, {len(md_files)} Markdown)...")
+    # One client for the whole run, its pool sized for the workers
+    settings = get_upload_settings()
+    if args.workers:
+        settings["workers"] = max(1, args.workers)
+    session = get_uploader_session(settings)
+    print(f"   Workers: {settings['workers']}, multipart above {settings['part_size'] // 1024 // 1024} MB "
+          f"({settings['part_threads']} parts at a time)")
+    if settings["skip_unchanged"]:
+        print(f"   Skipping unchanged files" + (f" (manifest {settings['manifest']})" if settings["manifest"] else ""))
+    
+    print(f"\n📤 Uploading {len(all_files)} files ({len(json_files)} JSON, {len(npz_files)} columnar, {len(md_files)} Markdown)"
+          + (" as one archive..." if args.archive else "..."))
+    
+    # Organize files by date (format: YYYY-MM-DD)
+    started = time.perf_counter()
+    archive = None
+    if args.archive:
+        archive_object = f"{prefix}/grafana-metrics_{now.strftime('%Y%m%d_%H%M%S')}.tar.gz"
+        uploaded, failed, archive = upload_run_archive(session, bucket_name, all_files, metrics_dir, archive_object)
+    else:
+        uploads = [(file_path, f"{prefix}/{os.path.basename(file_path)}") for file_path in sorted(all_files)]
+        uploaded, failed = session.upload_files(bucket_name, uploads)
+    stats = summarize_uploads(uploaded, time.perf_counter() - started)
     
     upload_results = {
         "timestamp": now.isoformat(),
         "bucket": bucket_name,
-        "uploaded_files": [],
-        "failed_files": []
+        "prefix": prefix,
+        "uploaded_files": (previous["uploaded_files"] if previous else []) + uploaded,
+        "failed_files": [record["filename"] for record in failed],
+        "errors": {record["filename"]: record["error"] for record in failed},
+        "stats": stats
     }
-    
-    for file_path in all_files:
-        filename = os.path.basename(file_path)
-        
-        # Organize files by date (format: YYYY-MM-DD)
-        object_name = f"grafana-metrics/{date_folder}/{filename}"
-        
-        success = upload_file(client, bucket_name, file_path, object_name)
-        
-        if success:
-            upload_results["uploaded_files"].append({
-                "filename": filename,
-                "object_name": object_name,
-                "size": os.path.getsize(file_path)
-            })
-        else:
-            upload_results["failed_files"].append(filename)
+    if previous:
+        upload_results["resumed_from"] = previous.get("timestamp")
+    if archive:
+        upload_results["archive"] = archive
     
     # Save upload results
-    results_file = f"{metrics_dir}/upload_results.json"
     with open(results_file, 'w') as f:
         json.dump(upload_results, f, indent=2)
     
     print(f"\n✅ Upload completed!")
-    print(f"   Successful: {len(upload_results['uploaded_files'])}")
+    print(f"   Successful: {len(uploaded)}" + (f" ({len(upload_results['uploaded_files'])} including earlier runs)" if previous else ""))
     print(f"   Failed: {len(upload_results['failed_files'])}")
+    print(f"   Throughput: {stats['objects'] / stats['seconds'] if stats['seconds'] else 0:.1f} objects/s, "
+          f"{stats['mb_per_second']} MB/s ({stats['multipart']} multipart)")
+    if archive:
+        print(f"   Archive: {archive['bytes'] / 1024 / 1024:.2f} MB -> {archive['compressed_bytes'] / 1024 / 1024:.2f} MB "
+              f"({archive['ratio']}x), manifest {archive['manifest_object']}")
+    if settings["skip_unchanged"] and not args.archive:
+        print(f"   Unchanged (skipped): {stats['skipped']}, {stats['bytes_saved'] / 1024 / 1024:.2f} MB saved")
     print(f"   Results saved to: {results_file}")
     
     if upload_results["failed_files"]:
         print(f"\n⚠️  Some files failed to upload:")
         for filename in upload_results["failed_files"]:
             print(f"   - {filename}")
+        print(f"   Retry them with: python3 upload_metrics_to_minio.py {metrics_dir} --resume" + (" --archive" if args.archive else ""))
 
 if __name__ == "__main__":
     main()
@@ -8,65 +8,38 @@ import json
 from pathlib import Path
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
-from minio import Minio
-from minio.error import S3Error
 
-def upload_to_minio(file_path, bucket_name, object_name):
-    """Upload a file to MinIO bucket."""
-    # Get MinIO credentials from environment
-    minio_endpoint = os.environ.get('MINIO_ENDPOINT', 'minio.pkc.pub')
-    minio_access_key = os.environ.get('MINIO_ACCESS_KEY')
-    minio_secret_key = os.environ.get('MINIO_SECRET_KEY')
-    
-    if not minio_access_key or not minio_secret_key:
-        print("Error: MinIO credentials not set in environment variables")
-        return None
+from minio_upload import get_upload_settings, UploaderSession
+
+def collect_user_uploads(results, date):
+    """Return (uploads, user_files): the (file_path, object_name) pairs of every user, and {user: {file_type: object_name}}"""
+    uploads = []
+    user_files = {}
+    base_path = Path('daily-reports')
     
-    try:
-        # Initialize MinIO client
-        client = Minio(
-            minio_endpoint,
-            access_key=minio_access_key,
-            secret_key=minio_secret_key,
-            secure=True
-        )
-        
-        # Check if bucket exists, create if not
-        if not client.bucket_exists(bucket_name):
-            print(f"Bucket {bucket_name} does not exist, creating...")
-            client.make_bucket(bucket_name)
-            # Set bucket policy to public read
-            policy = {
-                "Version": "2012-10-17",
-                "Statement": [
-                    {
-                        "Effect": "Allow",
-                        "Principal": {"AWS": "*"},
-                        "Action": ["s3:GetObject"],
-                        "Resource": [f"arn:aws:s3:::{bucket_name}/*"]
-                    }
-                ]
-            }
-            client.set_bucket_policy(bucket_name, json.dumps(policy))
-        
-        # Upload file
-        client.fput_object(
-            bucket_name,
-            object_name,
-            file_path,
-        )
+    for user_name, user_data in results.items():
+        if not user_data.get('has_commits'):
+            print(f"Skipping {user_name} - no commits")
+            continue
         
-        # Generate public URL
-        url = f"https://{minio_endpoint}/browser/{bucket_name}/{object_name}"
-        print(f"✅ Uploaded: {file_path} -> {url}")
-        return url
+        user_prefix = user_name.lower()
+        files_to_upload = {
+            'markdown': base_path / f"{user_prefix}_{date}.md",
+            'latex': base_path / f"{user_prefix}_{date}.tex",
+            'pdf': base_path / f"{user_prefix}_{date}.pdf"
+        }
         
-    except S3Error as e:
-        print(f"❌ MinIO S3 Error: {e}")
-        return None
-    except Exception as e:
-        print(f"❌ Error uploading to MinIO: {e}")
-        return None
+        user_files[user_name] = {}
+        for file_type, file_path in files_to_upload.items():
+            if file_path.exists():
+                # Object name format: {date}/{user}/{filename}
+                object_name = f"{date}/{user_name}/{file_path.name}"
+                uploads.append((str(file_path), object_name))
+                user_files[user_name][file_type] = object_name
+            else:
+                print(f"⚠️  File not found: {file_path}")
+    
+    return uploads, user_files
 
 def main():
     if len(sys.argv) < 2:
@@ -88,52 +61,54 @@ def main():
     yesterday = (datetime.now(wita_tz) - timedelta(days=1)).strftime('%Y-%m-%d')
     
     bucket_name = 'daily-reports'
-    upload_results = {}
+    uploads, user_files = collect_user_uploads(results, yesterday)
     
-    # Process each user
+    # One client and one bucket check for every user's MD/TeX/PDF files
+    uploaded_records = {}
+    session = None
+    settings = get_upload_settings()
+    if not settings["access_key"] or not settings["secret_key"]:
+        print("Error: MinIO credentials not set in environment variables")
+    elif uploads:
+        print(f"\n{'='*60}")
+        print(f"Uploading {len(uploads)} files for {len(user_files)} users")
+        print(f"{'='*60}")
+        try:
+            session = UploaderSession(settings, public_read=True)
+            uploaded, failed = session.upload_files(bucket_name, uploads)
+            uploaded_records = {record["object_name"]: record for record in uploaded}
+        except Exception as e:
+            print(f"❌ Error uploading to MinIO: {e}")
+    
+    upload_results = {}
     for user_name, user_data in results.items():
-        if not user_data.get('has_commits'):
-            print(f"Skipping {user_name} - no commits")
+        if user_name not in user_files:
             upload_results[user_name] = {
                 'has_commits': False,
                 'urls': {}
             }
             continue
         
-        print(f"\n{'='*60}")
-        print(f"Uploading files for {user_name}")
-        print(f"{'='*60}")
-        
-        user_urls = {}
-        
-        # Determine file paths
-        base_path = Path('daily-reports')
-        user_prefix = user_name.lower()
-        
-        files_to_upload = {
-            'markdown': base_path / f"{user_prefix}_{yesterday}.md",
-            'latex': base_path / f"{user_prefix}_{yesterday}.tex",
-            'pdf': base_path / f"{user_prefix}_{yesterday}.pdf"
-        }
-        
-        # Upload each file type
-        for file_type, file_path in files_to_upload.items():
-            if file_path.exists():
-                # Object name format: {date}/{user}/{filename}
-                object_name = f"{yesterday}/{user_name}/{file_path.name}"
-                url = upload_to_minio(str(file_path), bucket_name, object_name)
-                if url:
-                    user_urls[file_type] = url
-            else:
-                print(f"⚠️  File not found: {file_path}")
-        
         upload_results[user_name] = {
             'has_commits': True,
             'commit_count': user_data.get('commit_count', 0),
-            'urls': user_urls
+            'urls': {
+                file_type: session.get_url(bucket_name, object_name)
+                for file_type, object_name in user_files[user_name].items()
+                if object_name in uploaded_records
+            }
         }
         
-        print(f"✅ Upload complete for {user_name}")
+        # Unchanged files keep their URL but were not sent again
+        skipped = [
+            file_type for file_type, object_name in user_files[user_name].items()
+            if uploaded_records.get(object_name, {}).get('skipped')
+        ]
+        if skipped:
+            upload_results[user_name]['skipped'] = skipped
+            upload_results[user_name]['bytes_saved'] = sum(
+                uploaded_records[user_files[user_name][file_type]]['size'] for file_type in skipped
+            )
     
     # Save upload results
     upload_results_file = Path('daily-reports') / 'upload_results.json'
@@ -142,6 +117,8 @@ def main():
     
     print(f"\n{'='*60}")
     print(f"Upload results saved to: {upload_results_file}")
+    if session and settings["skip_unchanged"]:
+        print(f"Unchanged files skipped: {session.stats['skipped']} ({session.stats['bytes_saved']} bytes saved)")
     print(f"{'='*60}")
     
     # Print summary
@@ -4,15 +4,73 @@ Generate Simple ZITADEL Metrics Report
 Focus on Total Users and 7 Authentication Events
 """
 
-import json
+import os
 import sys
+import time
 from datetime import datetime, timezone, timedelta
 from pathlib import Path
 
-def load_json_data(json_file):
-    """Load ZITADEL metrics JSON file"""
-    with open(json_file, 'r') as f:
-        return json.load(f)
+# Metrics loaders live with the collector scripts
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / '.github' / 'scripts'))
+from metrics_io import iter_metrics
+from metrics_store import MetricsStore
+from resolution import parse_time_range
+
+# Metrics store files are read instead of a metrics file
+STORE_EXTENSIONS = ('.db', '.sqlite')
+
+# Only these metrics are kept in memory while reading a metrics file
+REPORT_METRICS = {
+    'registered_users',
+    'event_oidc_session_access_token_added',
+    'event_oidc_session_added',
+    'event_user_human_externallogin_check_succeeded',
+    'event_user_human_mfa_init_skipped',
+    'event_user_human_mfa_otp_added',
+    'event_user_human_password_check_succeeded',
+    'event_user_token_v2_added',
+}
+
+def load_report_metrics(json_file):
+    """Read a metrics file one metric at a time, keeping only the report metrics
+    
+    Returns (header, metrics, available_count, total_count).
+    """
+    data, metric_items = iter_metrics(json_file)
+    metrics = {}
+    available = 0
+    total = 0
+    
+    for metric_name, metric_data in metric_items:
+        total += 1
+        if metric_data and metric_data.get('result'):
+            available += 1
+        if metric_name in REPORT_METRICS:
+            metrics[metric_name] = metric_data
+    
+    return data, metrics, available, total
+
+def load_store_metrics(store_file, time_range=None):
+    """Read the report metrics of the last time_range (TIME_RANGE, default 24h) from the metrics store
+    
+    Returns the same (header, metrics, available_count, total_count) as
+    load_report_metrics, with the header describing the queried window.
+    """
+    time_range = time_range or os.getenv('TIME_RANGE', '24h')
+    end = time.time()
+    start = end - parse_time_range(time_range).total_seconds()
+    
+    store = MetricsStore(store_file, read_only=True)
+    metrics = {name: store.query(name, start, end, source='ZITADEL') for name in sorted(REPORT_METRICS)}
+    store.close()
+    
+    data = {
+        "timestamp": datetime.fromtimestamp(end, timezone.utc).isoformat(),
+        "time_range": time_range,
+        "source": "ZITADEL"
+    }
+    available = len([metric for metric in metrics.values() if metric['result']])
+    return data, metrics, available, len(metrics)
 
 def get_latest_value(metric_data):
     """Get the latest value from metric data"""
@@ -28,7 +86,11 @@ def get_latest_value(metric_data):
     return 0
 
 def calculate_hourly_samples(metric_data):
-    """Extract all hourly data points (24 hours)"""
+    """Extract all hourly data points (24 hours)
+    
+    Collections may use any step, so samples are reduced to the last value
+    of each clock hour.
+    """
     if not metric_data.get('result'):
         return [0] * 24
     
@@ -41,8 +103,11 @@ def calculate_hourly_samples(metric_data):
     if not all_values:
         return [0] * 24
     
-    # Extract all hourly values (should be 24 data points with 1-hour step)
-    hourly_values = [float(value[1]) for value in all_values]
+    # Keep the last sample of each hour (a no-op for 1-hour steps)
+    hourly = {}
+    for timestamp, value in all_values:
+        hourly[int(float(timestamp)) // 3600] = float(value)
+    hourly_values = [hourly[hour] for hour in sorted(hourly)]
     
     # Ensure we have exactly 24 data points
     if len(hourly_values) < 24:
@@ -64,14 +129,14 @@ def generate_report(json_file, template_file, output_file):
     """Generate simple report from JSON data"""
     
     # Load data
-    data = load_json_data(json_file)
+    if str(json_file).endswith(STORE_EXTENSIONS):
+        data, metrics, available_metrics, total_metrics = load_store_metrics(json_file)
+    else:
+        data, metrics, available_metrics, total_metrics = load_report_metrics(json_file)
     
     with open(template_file, 'r') as f:
         template = f.read()
     
-    # Extract metrics
-    metrics = data['metrics']
-    
     # Get total users
     total_users = get_latest_value(metrics['registered_users'])
     
@@ -163,7 +228,7 @@ def generate_report(json_file, template_file, output_file):
     print(f"   Total Users: {format_number(total_users)}")
     print(f"   Total Events: {total_events}")
     print(f"   Data Points: {data_points}")
-    print(f"   Metrics Available: {sum(1 for m in metrics.values() if m.get('result'))}/{len(metrics)}")
+    print(f"   Metrics Available: {available_metrics}/{total_metrics}")
 
 def main():
     # Default: use latest JSON from /tmp or current directory
@@ -182,7 +247,7 @@ def main():
         
         if not json_file:
             print("❌ No JSON file found. Please provide a file path or download metrics first:")
-            print("\nUsage: python3 generate_zitadel_report.py <json_file> [output_file]")
+            print("\nUsage: python3 generate_zitadel_report.py <json_file|metrics.db> [output_file]")
             print("\nExample:")
             print("  python3 generate_zitadel_report.py zitadel_metrics.json report.md")
             sys.exit(1)